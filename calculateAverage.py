@@ -1,21 +1,30 @@
 # time python3 calculateAverage.py
 import os
+import mmap
+import sys
+import argparse
 from gc import disable as gc_disable, enable as gc_enable
-import multiprocessing as mp
+
+from onebrc.cpus import available_cpus
+from onebrc.fixedpoint import TENTHS, TENTHS_LINE
+from onebrc.output import format_results
+from onebrc.histogram import BUCKETS, OFFSET, HistogramTable
+from onebrc.stations import StationTable, first_byte_filter
+from onebrc.scheduler import format_schedule_report, get_work_units, run_work_units
 
 
 def get_file_chunks(
     file_name: str,
-    max_cpu: int = 8,
+    max_cpu: int = None,
 ) -> tuple[int, list[tuple[str, int, int]]]:
-    """Split flie into chunks"""
-    cpu_count = min(max_cpu, mp.cpu_count())
+    """Split flie into chunks, one per available CPU (at most max_cpu)"""
+    cpu_count = available_cpus() if max_cpu is None else min(max_cpu, available_cpus())
 
     file_size = os.path.getsize(file_name)
     chunk_size = file_size // cpu_count
 
     start_end = list()
-    with open(file_name, encoding="utf-8", mode="r+b") as f:
+    with open(file_name, mode="r+b") as f:
 
         def is_new_line(position):
             if position == 0:
@@ -59,74 +68,211 @@ def _process_file_chunk(
     file_name: str,
     chunk_start: int,
     chunk_end: int,
-) -> dict:
-    """Process each file chunk in a different process"""
-    result = dict()
-    with open(file_name, encoding="utf-8", mode="rb") as f:
+    stations: frozenset = None,
+) -> StationTable:
+    """Process each file chunk in a different process, only aggregating the given stations if any"""
+    result = StationTable()
+    ids, add = result.ids, result.add
+    mins, maxs, sums, counts = result.mins, result.maxs, result.sums, result.counts
+    first_bytes = first_byte_filter(stations) if stations is not None else None
+    with open(file_name, mode="rb") as f:
         f.seek(chunk_start)
         gc_disable()
         for line in f:
             chunk_start += len(line)
             if chunk_start > chunk_end:
                 break
+            if first_bytes is not None and not first_bytes[line[0]]:
+                continue
             location, measurement = line.split(b";")
-            measurement = float(measurement)
-            _result = result.get(location)
-            if _result:
-                if measurement < _result[0]:
-                    _result[0] = measurement
-                if measurement > _result[1]:
-                    _result[1] = measurement
-                _result[2] += measurement
-                _result[3] += 1
-            else:
-                result[location] = [
-                    measurement,
-                    measurement,
-                    measurement,
-                    1,
-                ]  # min, max, sum, count
+            if first_bytes is not None and location not in stations:
+                continue
+            measurement = TENTHS_LINE[measurement]
+            station = ids.get(location)
+            if station is None:
+                station = add(location)
+            if measurement < mins[station]:
+                mins[station] = measurement
+            if measurement > maxs[station]:
+                maxs[station] = measurement
+            sums[station] += measurement
+            counts[station] += 1
 
         gc_enable()
     return result
 
 
+def _process_file_chunk_histogram(
+    file_name: str,
+    chunk_start: int,
+    chunk_end: int,
+    stations: frozenset = None,
+) -> HistogramTable:
+    """Process each file chunk in a different process, also counting every temperature per station for percentiles"""
+    result = HistogramTable()
+    ids, add = result.ids, result.add
+    mins, maxs, sums, counts = result.mins, result.maxs, result.sums, result.counts
+    histograms = result.histograms
+    with open(file_name, mode="rb") as f:
+        f.seek(chunk_start)
+        gc_disable()
+        for line in f:
+            chunk_start += len(line)
+            if chunk_start > chunk_end:
+                break
+            location, measurement = line.split(b";")
+            if stations is not None and location not in stations:
+                continue
+            measurement = TENTHS_LINE[measurement]
+            station = ids.get(location)
+            if station is None:
+                station = add(location)
+            if measurement < mins[station]:
+                mins[station] = measurement
+            if measurement > maxs[station]:
+                maxs[station] = measurement
+            sums[station] += measurement
+            counts[station] += 1
+            histograms[station * BUCKETS + OFFSET + measurement] += 1
+
+        gc_enable()
+    return result
+
+
+def _process_buffer(
+    buffer,
+    index: int,
+    end: int,
+    result: StationTable,
+    stations: frozenset = None,
+) -> StationTable:
+    """Aggregate the rows found between index and end of a bytes-like buffer, only the given stations if any"""
+    ids, add = result.ids, result.add
+    mins, maxs, sums, counts = result.mins, result.maxs, result.sums, result.counts
+    first_bytes = first_byte_filter(stations) if stations is not None else None
+    find = buffer.find
+    while index < end:
+        if first_bytes is not None and not first_bytes[buffer[index]]:
+            # Skip the row without slicing its name
+            newline = find(b"\n", index, end)
+            index = end if newline == -1 else newline + 1
+            continue
+        semicolon = find(b";", index, end)
+        newline = find(b"\n", semicolon, end)
+        if newline == -1:  # last line of the file has no trailing newline
+            newline = end
+        location = buffer[index:semicolon]
+        if first_bytes is not None and location not in stations:
+            index = newline + 1
+            continue
+        measurement = TENTHS[buffer[semicolon + 1 : newline]]
+        index = newline + 1
+        station = ids.get(location)
+        if station is None:
+            station = add(location)
+        if measurement < mins[station]:
+            mins[station] = measurement
+        if measurement > maxs[station]:
+            maxs[station] = measurement
+        sums[station] += measurement
+        counts[station] += 1
+    return result
+
+
+def _process_file_chunk_mmap(
+    file_name: str,
+    chunk_start: int,
+    chunk_end: int,
+    stations: frozenset = None,
+) -> StationTable:
+    """Process each file chunk in a different process, scanning a memory map of the file"""
+    result = StationTable()
+    with open(file_name, mode="rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            gc_disable()
+            _process_buffer(mm, chunk_start, chunk_end, result, stations)
+            gc_enable()
+    return result
+
+
 def process_file(
     cpu_count: int,
     start_end: list,
+    chunk_processor=_process_file_chunk,
+    schedule_report: bool = False,
+    shared_memory: bool = False,
+    percentiles: bool = False,
 ) -> dict:
-    """Process data file"""
-    with mp.Pool(cpu_count) as p:
-        # Run chunks in parallel
-        chunk_results = p.starmap(
-            _process_file_chunk,
-            start_end,
-        )
-
-    # Combine all results from all chunks
-    result = dict()
-    for chunk_result in chunk_results:
-        for location, measurements in chunk_result.items():
-            _result = result.get(location)
-            if _result:
-                if measurements[0] < _result[0]:
-                    _result[0] = measurements[0]
-                if measurements[1] > _result[1]:
-                    _result[1] = measurements[1]
-                _result[2] += measurements[2]
-                _result[3] += measurements[3]
-            else:
-                result[location] = measurements
+    """Process data file, with percentiles chunk_processor must return HistogramTables"""
+    # Run chunks in parallel, combining results from all chunks as they finish
+    result, report = run_work_units(
+        chunk_processor,
+        start_end,
+        cpu_count,
+        shared_memory=shared_memory,
+        table_class=HistogramTable if percentiles else StationTable,
+    )
+    if schedule_report:
+        print(format_schedule_report(report), file=sys.stderr)
+
     # Print final results
-    print("{", end="")
-    for location, measurements in sorted(result.items()):
-        print(
-            f"{location.decode('utf8')}={measurements[0]:.1f}/{(measurements[2] / measurements[3]) if measurements[3] != 0 else 0:.1f}/{measurements[1]:.1f}",
-            end=", ",
-        )
-    print("\b\b} ")
+    sys.stdout.write(format_results(result, percentiles))
 
 
 if __name__ == "__main__":
-    cpu_count, *start_end = get_file_chunks("measurements.txt")
-    process_file(cpu_count, start_end[0])
+    from onebrc.__main__ import positive_int
+
+    parser = argparse.ArgumentParser(description="Calculate average measurements")
+    parser.add_argument(
+        "--mmap",
+        dest="mmap",
+        action="store_true",
+        help="Scan a memory map of the file instead of iterating over its lines",
+    )
+    parser.add_argument(
+        "--unit-size",
+        dest="unit_size",
+        type=positive_int,
+        help="Split the file into work units of about UNIT_SIZE bytes pulled by the workers (default is one chunk per CPU)",
+    )
+    parser.add_argument(
+        "--schedule-report",
+        dest="schedule_report",
+        action="store_true",
+        help="Print how long each worker was busy and idle at the tail to stderr",
+    )
+    parser.add_argument(
+        "--shared-memory",
+        dest="shared_memory",
+        action="store_true",
+        help="Workers write their results to shared memory instead of pickling them back",
+    )
+    parser.add_argument(
+        "--percentiles",
+        dest="percentiles",
+        action="store_true",
+        help="Also print the exact p50/p95/p99 per station, from a temperature histogram per station",
+    )
+    args = parser.parse_args()
+    if args.percentiles and args.mmap:
+        parser.error("--mmap does not support --percentiles, the histograms are built by the line iterating reader")
+
+    if args.unit_size:
+        cpu_count = available_cpus()
+        start_end = [get_work_units("measurements.txt", args.unit_size)]
+    else:
+        cpu_count, *start_end = get_file_chunks("measurements.txt")
+    if args.percentiles:
+        chunk_processor = _process_file_chunk_histogram
+    elif args.mmap:
+        chunk_processor = _process_file_chunk_mmap
+    else:
+        chunk_processor = _process_file_chunk
+    process_file(
+        cpu_count,
+        start_end[0],
+        chunk_processor,
+        args.schedule_report,
+        args.shared_memory,
+        args.percentiles,
+    )
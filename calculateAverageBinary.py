@@ -0,0 +1,148 @@
+# time python3 calculateAverageBinary.py
+import argparse
+from functools import partial
+
+import numpy as np
+
+from calculateAverage import process_file
+from onebrc import progress as _progress
+from onebrc.cpus import available_cpus
+from onebrc.binary import group_columns, read_header, row_groups
+from onebrc.stations import StationTable
+from onebrc.histogram import BUCKETS, OFFSET, HistogramTable
+
+
+HISTOGRAM_CELLS = 1 << 23  # above stations * BUCKETS cells, min/max are reduced with ufunc.at instead
+
+
+def get_file_chunks(
+    file_name: str,
+    max_cpu: int = None,
+    unit_size: int = None,
+) -> tuple[int, list]:
+    """Split the row groups into one range per available CPU (at most max_cpu), or into units of about unit_size bytes
+
+    Units start and end on row group boundaries, a row group is never split.
+    """
+    if unit_size is not None and unit_size < 1:
+        raise ValueError("unit_size must be at least 1")
+    cpu_count = available_cpus() if max_cpu is None else min(max_cpu, available_cpus())
+    groups = row_groups(file_name)
+    if not groups:
+        return cpu_count, list()
+    unit_size = unit_size or -(-(groups[-1][1] - groups[0][0]) // cpu_count)
+
+    start_end = list()
+    unit_start = groups[0][0]
+    for _, group_end in groups:
+        if group_end - unit_start >= unit_size or group_end == groups[-1][1]:
+            start_end.append((file_name, unit_start, group_end))
+            unit_start = group_end
+    return cpu_count, start_end
+
+
+def _process_file_chunk(
+    file_name: str,
+    chunk_start: int,
+    chunk_end: int,
+    blocksize: int = 16 * 1024 * 1024,
+    stations: frozenset = None,
+    percentiles: bool = False,
+) -> StationTable:
+    """Reduce the row groups in [chunk_start, chunk_end) of a memory map of the file
+
+    Ids and tenths combine into one histogram bucket per row, station_id * BUCKETS + tenths + OFFSET,
+    so a single np.bincount gives min, max, sum and count of every station (and its percentiles).
+    With too many stations for a histogram, counts and sums come from np.bincount and min/max from
+    np.minimum.at/np.maximum.at. blocksize bounds the column bytes reduced at once.
+    """
+    names, _ = read_header(file_name)
+    station_count = len(names)
+    use_histogram = percentiles or station_count * BUCKETS <= HISTOGRAM_CELLS
+    if use_histogram:
+        histograms = np.zeros((station_count, BUCKETS), dtype=np.int64)
+    else:
+        mins = np.full(station_count, BUCKETS, dtype=np.int64)
+        maxs = np.full(station_count, -BUCKETS, dtype=np.int64)
+        sums = np.zeros(station_count, dtype=np.int64)
+        counts = np.zeros(station_count, dtype=np.int64)
+    block_rows = max(blocksize // 4, 1)
+    progress = _progress.current()
+    rows = 0
+
+    data = np.memmap(file_name, dtype=np.uint8, mode="r")
+    position = chunk_start
+    while position < chunk_end:
+        group_start = position
+        ids, tenths, position = group_columns(data, position)
+        if progress.enabled:
+            rows += len(ids)
+            progress.add(position - group_start, rows)
+        for start in range(0, len(ids), block_rows):
+            block_ids = ids[start : start + block_rows].astype(np.intp)
+            block_tenths = tenths[start : start + block_rows].astype(np.intp)
+            if use_histogram:
+                block_ids *= BUCKETS
+                block_ids += block_tenths
+                block_ids += OFFSET
+                histograms += np.bincount(block_ids, minlength=station_count * BUCKETS).reshape(
+                    station_count, BUCKETS
+                )
+                continue
+            np.minimum.at(mins, block_ids, block_tenths)
+            np.maximum.at(maxs, block_ids, block_tenths)
+            sums += np.rint(
+                np.bincount(block_ids, weights=block_tenths, minlength=station_count)
+            ).astype(np.int64)
+            counts += np.bincount(block_ids, minlength=station_count)
+    del data
+
+    if use_histogram:
+        counts = histograms.sum(axis=1)
+    # Only the stations seen in this chunk, in dictionary order
+    seen = np.flatnonzero(counts)
+    names = [names[station_id] for station_id in seen]
+    if percentiles:
+        result = HistogramTable.from_histograms(names, histograms[seen])
+    elif use_histogram:
+        present = histograms[seen] > 0
+        result = StationTable.from_columns(
+            names,
+            present.argmax(axis=1) - OFFSET,
+            BUCKETS - 1 - present[:, ::-1].argmax(axis=1) - OFFSET,
+            histograms[seen] @ np.arange(-OFFSET, BUCKETS - OFFSET, dtype=np.int64),
+            counts[seen],
+        )
+    else:
+        result = StationTable.from_columns(names, mins[seen], maxs[seen], sums[seen], counts[seen])
+    if stations is not None:
+        # The columns cost the same with or without the filter, it is applied to the result
+        return result.select(stations)
+    return result
+
+
+if __name__ == "__main__":
+    from onebrc.__main__ import positive_int
+
+    parser = argparse.ArgumentParser(description="Calculate average measurements from a binary columnar file")
+    parser.add_argument(
+        "--unit-size",
+        dest="unit_size",
+        type=positive_int,
+        help="Split the row groups into work units of about UNIT_SIZE bytes pulled by the workers (default is one chunk per CPU)",
+    )
+    parser.add_argument(
+        "--percentiles",
+        dest="percentiles",
+        action="store_true",
+        help="Also print the exact p50/p95/p99 per station",
+    )
+    args = parser.parse_args()
+
+    cpu_count, start_end = get_file_chunks("measurements.1brc", unit_size=args.unit_size)
+    process_file(
+        cpu_count,
+        start_end,
+        partial(_process_file_chunk, percentiles=True) if args.percentiles else _process_file_chunk,
+        percentiles=args.percentiles,
+    )
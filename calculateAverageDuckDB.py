@@ -1,32 +1,61 @@
+import sys
+
 import duckdb
 
+from onebrc.output import format_results
+from onebrc.stations import StationTable
+
+
+READ_MEASUREMENTS = """
+    READ_CSV(
+        ?,
+        header=false,
+        columns={'station_name':'VARCHAR','measurement':'DECIMAL(8,1)'},
+        delim=';',
+        parallel=true
+    )
+"""
+
 
-with duckdb.connect() as conn:
-    # Import CSV in memory using DuckDB
-    data = conn.sql(
-        """
-        SELECT
-            station_name,
-            MIN(measurement) AS min_measurement,
-            CAST(AVG(measurement) AS DECIMAL(8,1)) AS mean_measurement,
-            MAX(measurement) AS max_measurement
-        FROM READ_CSV(
-            'measurements.txt',
-            header=false,
-            columns={'station_name':'VARCHAR','measurement':'DECIMAL(8,1)'},
-            delim=';',
-            parallel=true
-        )
-        GROUP BY
-            station_name
-        """
+def aggregate_tenths(
+    file_name: str = "measurements.txt",
+    threads: int = None,
+    stations: frozenset = None,
+) -> StationTable:
+    """Group data into integer tenths min/max/sum/count with DuckDB, only for the given stations if any"""
+    where = ""
+    parameters = [file_name]
+    if stations is not None:
+        where = "WHERE station_name IN (SELECT UNNEST(?))"
+        parameters.append([name.decode("utf-8") for name in stations])
+    with duckdb.connect() as conn:
+        if threads:
+            conn.execute(f"SET threads TO {int(threads)}")
+        rows = conn.execute(
+            f"""
+            SELECT
+                station_name,
+                CAST(MIN(measurement) * 10 AS BIGINT),
+                CAST(MAX(measurement) * 10 AS BIGINT),
+                CAST(SUM(measurement) * 10 AS BIGINT),
+                COUNT(*)
+            FROM {READ_MEASUREMENTS}
+            {where}
+            GROUP BY
+                station_name
+            """,
+            parameters,
+        ).fetchall()
+    names, mins, maxs, sums, counts = zip(*rows) if rows else ((),) * 5
+    return StationTable.from_columns(
+        [name.encode("utf-8") for name in names],
+        mins,
+        maxs,
+        sums,
+        counts,
     )
 
+
+if __name__ == "__main__":
     # Print final results
-    print("{", end="")
-    for row in sorted(data.fetchall()):
-        print(
-            f"{row[0]}={row[1]}/{row[2]}/{row[3]}",
-            end=", ",
-        )
-    print("\b\b} ")
+    sys.stdout.write(format_results(aggregate_tenths()))
@@ -0,0 +1,203 @@
+# time python3 calculateAverageNumpy.py
+import sys
+from functools import partial
+
+import numpy as np
+
+from calculateAverage import get_file_chunks, process_file
+from onebrc.phases import current
+from onebrc.blockio import DEFAULT_STRATEGY, read_blocks
+from onebrc import progress as _progress
+from onebrc.stations import StationTable, first_byte_filter
+from onebrc.histogram import BUCKETS, OFFSET, HistogramTable
+
+
+NEW_LINE_ORD = ord(b"\n")
+SEMICOLON_ORD = ord(b";")
+MINUS_ORD = ord(b"-")
+ZERO_ORD = ord(b"0")
+NINE_ORD = ord(b"9")
+HASH_MULTIPLIER = np.uint64(0x100000001B3)  # FNV-1a 64 bit prime
+
+
+def _parse_block(
+    buffer: np.ndarray,
+    stations: dict,
+    allowed: frozenset = None,
+    first_bytes: np.ndarray = None,
+) -> tuple:
+    """Find all rows of a newline terminated block, returning their dense station ids and temperatures (tenths)
+
+    With allowed, rows of other stations are left out, first_bytes (first_byte_filter as a bool
+    array) drops most of them before their names are hashed.
+    """
+    newlines = np.flatnonzero(buffer == NEW_LINE_ORD)
+    semicolons = np.flatnonzero(buffer == SEMICOLON_ORD)
+    starts = np.empty_like(newlines)
+    starts[0] = 0
+    starts[1:] = newlines[:-1] + 1
+    if allowed is not None:
+        keep = first_bytes[buffer[starts]]
+        newlines, semicolons, starts = newlines[keep], semicolons[keep], starts[keep]
+        if not len(newlines):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int16)
+
+    # Temperatures are -?d?d.d, so the last digit, the dot and the units digit
+    # are always at the same distance from the newline
+    temperatures = buffer[newlines - 1].astype(np.int16) - ZERO_ORD
+    temperatures += 10 * (buffer[newlines - 3].astype(np.int16) - ZERO_ORD)
+    tens = buffer[newlines - 4].astype(np.int16)
+    temperatures += np.where(
+        (tens >= ZERO_ORD) & (tens <= NINE_ORD),
+        100 * (tens - ZERO_ORD),
+        0,
+    ).astype(np.int16)
+    temperatures = np.where(
+        buffer[semicolons + 1] == MINUS_ORD,
+        -temperatures,
+        temperatures,
+    )
+
+    # Pad station names to the same width, one column per byte, and hash them
+    lengths = semicolons - starts
+    width = int(lengths.max())
+    keys = np.empty((width, len(newlines)), dtype=np.uint8)
+    hashes = np.zeros(len(newlines), dtype=np.uint64)
+    positions = starts.copy()
+    for column in range(width):
+        key = keys[column]
+        np.take(buffer, positions, out=key, mode="clip")
+        np.multiply(key, lengths > column, out=key)
+        positions += 1
+        hashes *= HASH_MULTIPLIER
+        hashes ^= key
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    if not all(
+        np.array_equal(key, key[first][inverse]) for key in keys
+    ):
+        # Hash collision, fall back to comparing the padded names themselves
+        _, first, inverse = np.unique(
+            np.ascontiguousarray(keys.T).view(np.dtype((np.void, width))).ravel(),
+            return_index=True,
+            return_inverse=True,
+        )
+        inverse = inverse.ravel()
+
+    # Map block local station ids to chunk wide dense ids
+    lookup = np.empty(len(first), dtype=np.int64)
+    for index, row in enumerate(first):
+        location = buffer[starts[row] : semicolons[row]].tobytes()
+        if allowed is not None and location not in allowed:
+            lookup[index] = -1
+            continue
+        station_id = stations.get(location)
+        if station_id is None:
+            station_id = stations[location] = len(stations)
+        lookup[index] = station_id
+
+    ids = lookup[inverse]
+    if allowed is not None:
+        keep = ids >= 0
+        return ids[keep], temperatures[keep]
+    return ids, temperatures
+
+
+def _process_file_chunk(
+    file_name: str,
+    chunk_start: int,
+    chunk_end: int,
+    blocksize: int = 8 * 1024 * 1024,
+    stations: frozenset = None,
+    percentiles: bool = False,
+    io: str = DEFAULT_STRATEGY,
+) -> StationTable:
+    """Process each file chunk in a different process, only aggregating the given stations if any
+
+    With percentiles a HistogramTable is returned, min/max/sum/count are then derived from the
+    histograms instead of being tracked separately. io is the onebrc.blockio strategy reading the blocks.
+    """
+    first_bytes = None
+    if stations is not None:
+        first_bytes = np.frombuffer(first_byte_filter(stations), dtype=np.uint8).astype(bool)
+    station_ids = dict()
+    mins = np.zeros(0, dtype=np.int64)
+    maxs = np.zeros(0, dtype=np.int64)
+    sums = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+    histograms = np.zeros((0, BUCKETS), dtype=np.int64)
+    phases = current()
+    progress = _progress.current()
+    rows = 0
+
+    tail = b""
+    position = chunk_start
+    blocks = read_blocks(file_name, chunk_start, chunk_end, blocksize, io)
+
+    while True:
+        with phases.phase("read"):
+            block = next(blocks, None)
+        if block is None:
+            break
+        position += len(block)
+
+        data = tail + block
+        if position == chunk_end and not data.endswith(b"\n"):
+            data += b"\n"  # last line of the file has no trailing newline
+        size = data.rfind(b"\n") + 1
+        tail = data[size:]
+        if size == 0:
+            continue
+
+        ids, temperatures = _parse_block(
+            np.frombuffer(data, dtype=np.uint8, count=size),
+            station_ids,
+            stations,
+            first_bytes,
+        )
+        if progress.enabled:
+            rows += len(ids)
+            progress.add(len(block), rows)
+
+        station_count = len(station_ids)
+        if percentiles:
+            if station_count > len(histograms):
+                grow = station_count - len(histograms)
+                histograms = np.concatenate((histograms, np.zeros((grow, BUCKETS), dtype=np.int64)))
+            histograms += np.bincount(
+                ids * BUCKETS + (temperatures.astype(np.intp) + OFFSET),
+                minlength=station_count * BUCKETS,
+            ).reshape(station_count, BUCKETS)
+            continue
+
+        if station_count > len(counts):
+            grow = station_count - len(counts)
+            mins = np.concatenate((mins, np.full(grow, 1000, dtype=np.int64)))
+            maxs = np.concatenate((maxs, np.full(grow, -1000, dtype=np.int64)))
+            sums = np.concatenate((sums, np.zeros(grow, dtype=np.int64)))
+            counts = np.concatenate((counts, np.zeros(grow, dtype=np.int64)))
+
+        # ufunc.at only takes its fast path when all dtypes match
+        temperatures = temperatures.astype(np.int64)
+        np.minimum.at(mins, ids, temperatures)
+        np.maximum.at(maxs, ids, temperatures)
+        sums += np.rint(
+            np.bincount(ids, weights=temperatures, minlength=station_count)
+        ).astype(np.int64)
+        counts += np.bincount(ids, minlength=station_count)
+
+    # Dense ids were handed out in insertion order, so the columns line up with the names
+    if percentiles:
+        return HistogramTable.from_histograms(station_ids, histograms)
+    return StationTable.from_columns(station_ids, mins, maxs, sums, counts)
+
+
+if __name__ == "__main__":
+    percentiles = "--percentiles" in sys.argv[1:]
+    cpu_count, *start_end = get_file_chunks("measurements.txt")
+    process_file(
+        cpu_count,
+        start_end[0],
+        partial(_process_file_chunk, percentiles=True) if percentiles else _process_file_chunk,
+        percentiles=percentiles,
+    )
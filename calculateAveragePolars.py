@@ -1,31 +1,58 @@
+import sys
+
 import polars as pl
 
+from onebrc.output import format_results
+from onebrc.stations import StationTable
+
 
-# Read data file
-df = pl.scan_csv(
-    "measurements.txt",
-    separator=";",
-    has_header=False,
-    with_column_names=lambda cols: ["station_name", "measurement"],
-)
-
-# Group data
-grouped = (
-    df.group_by("station_name")
-    .agg(
-        pl.min("measurement").alias("min_measurement"),
-        pl.mean("measurement").alias("mean_measurement"),
-        pl.max("measurement").alias("max_measurement"),
+def scan_measurements(file_name: str = "measurements.txt") -> pl.LazyFrame:
+    """Read data file"""
+    return pl.scan_csv(
+        file_name,
+        separator=";",
+        has_header=False,
+        with_column_names=lambda cols: ["station_name", "measurement"],
     )
-    .sort("station_name")
-    .collect(streaming=True)
-)
-
-# Print final results
-print("{", end="")
-for data in grouped.iter_rows():
-    print(
-        f"{data[0]}={data[1]:.1f}/{data[2]:.1f}/{data[3]:.1f}",
-        end=", ",
+
+
+def collect(lazy: pl.LazyFrame) -> pl.DataFrame:
+    """Collect a query with the streaming engine"""
+    try:
+        return lazy.collect(engine="streaming")
+    except (TypeError, ValueError):  # polars < 1.23
+        return lazy.collect(streaming=True)
+
+
+def aggregate_tenths(
+    file_name: str = "measurements.txt",
+    stations: frozenset = None,
+) -> StationTable:
+    """Group data into integer tenths min/max/sum/count, only for the given stations if any"""
+    lazy = scan_measurements(file_name)
+    if stations is not None:
+        # Filtered before grouping, so the other stations are never hashed
+        lazy = lazy.filter(pl.col("station_name").is_in([name.decode("utf-8") for name in stations]))
+    grouped = collect(
+        lazy
+        .with_columns((pl.col("measurement") * 10).round(0).cast(pl.Int64))
+        .group_by("station_name")
+        .agg(
+            pl.min("measurement").alias("min_measurement"),
+            pl.max("measurement").alias("max_measurement"),
+            pl.sum("measurement").alias("sum_measurement"),
+            pl.col("measurement").count().alias("count_measurement"),
+        )
+    )
+    return StationTable.from_columns(
+        [name.encode("utf-8") for name in grouped["station_name"]],
+        grouped["min_measurement"],
+        grouped["max_measurement"],
+        grouped["sum_measurement"],
+        grouped["count_measurement"],
     )
-print("\b\b} ")
+
+
+if __name__ == "__main__":
+    # Print final results
+    sys.stdout.write(format_results(aggregate_tenths()))
@@ -1,21 +1,33 @@
 # time pypy3 calculateAveragePypy.py
 import os
-import multiprocessing as mp
+import sys
+import queue
+import argparse
+import threading
 from gc import disable as gc_disable, enable as gc_enable
 
+from onebrc.cpus import available_cpus
+from onebrc.blockio import DEFAULT_STRATEGY, read_blocks
+from onebrc.fixedpoint import TENTHS
+from onebrc.output import format_results
+from onebrc.phases import current
+from onebrc import progress as _progress
+from onebrc.stations import StationTable, first_byte_filter
+from onebrc.scheduler import format_schedule_report, get_work_units, run_work_units
+
 
 def get_file_chunks(
     file_name: str,
-    max_cpu: int = 8,
+    max_cpu: int = None,
 ) -> list:
-    """Split flie into chunks"""
-    cpu_count = min(max_cpu, mp.cpu_count())
+    """Split flie into chunks, one per available CPU (at most max_cpu)"""
+    cpu_count = available_cpus() if max_cpu is None else min(max_cpu, available_cpus())
 
     file_size = os.path.getsize(file_name)
     chunk_size = file_size // cpu_count
 
     start_end = list()
-    with open(file_name, encoding="utf-8", mode="r+b") as f:
+    with open(file_name, mode="r+b") as f:
 
         def is_new_line(position):
             if position == 0:
@@ -60,102 +72,266 @@ def _process_file_chunk(
     chunk_start: int,
     chunk_end: int,
     blocksize: int = 1024 * 1024,
-) -> dict:
-    """Process each file chunk in a different process"""
-    result = dict()
+    stations: frozenset = None,
+    io: str = DEFAULT_STRATEGY,
+) -> StationTable:
+    """Process each file chunk in a different process, only aggregating the given stations if any
 
-    with open(file_name, encoding="utf-8", mode="r+b") as fh:
-        fh.seek(chunk_start)
-        gc_disable()
+    io is the onebrc.blockio strategy reading the blocks.
+    """
+    result = StationTable()
+    ids, add = result.ids, result.add
+    mins, maxs, sums, counts = result.mins, result.maxs, result.sums, result.counts
+    first_bytes = first_byte_filter(stations) if stations is not None else None
+    phases = current()
+    progress = _progress.current()
 
-        tail = b""
-        location = None
-        byte_count = chunk_end - chunk_start
+    gc_disable()
+    tail = b""
+    location = None
+    position = chunk_start
+    blocks = read_blocks(file_name, chunk_start, chunk_end, blocksize, io)
 
-        while byte_count > 0:
-            if blocksize > byte_count:
-                blocksize = byte_count
-            byte_count -= blocksize
-
-            index = 0
-            data = tail + fh.read(blocksize)
-            while data:
-                if location is None:
-                    try:
-                        semicolon = data.index(b";", index)
-                    except ValueError:
-                        tail = data[index:]
-                        break
-
-                    location = data[index:semicolon]
-                    index = semicolon + 1
+    while True:
+        with phases.phase("read"):
+            block = next(blocks, None)
+        if block is None:
+            break
+        position += len(block)
 
+        index = 0
+        data = tail + block
+        if position == chunk_end and not data.endswith(b"\n"):
+            data += b"\n"  # last line of the file has no trailing newline
+        while data:
+            if location is None:
                 try:
-                    newline = data.index(b"\n", index)
+                    semicolon = data.index(b";", index)
                 except ValueError:
                     tail = data[index:]
                     break
 
-                value = float(data[index:newline])
-                index = newline + 1
-                try:
-                    _result = result[location]
-                    if value < _result[0]:
-                        _result[0] = value
-                    if value > _result[1]:
-                        _result[1] = value
-                    _result[2] += value
-                    _result[3] += 1
-                except KeyError:
-                    result[location] = [
-                        value,
-                        value,
-                        value,
-                        1,
-                    ]  # min, max, sum, count
+                location = data[index:semicolon]
+                index = semicolon + 1
+
+            try:
+                newline = data.index(b"\n", index)
+            except ValueError:
+                tail = data[index:]
+                break
 
+            if first_bytes is not None and (
+                not first_bytes[location[0]] or location not in stations
+            ):
+                index = newline + 1
                 location = None
-        gc_enable()
+                continue
+
+            value = TENTHS[data[index:newline]]
+            index = newline + 1
+            try:
+                station = ids[location]
+            except KeyError:
+                station = add(location)
+            if value < mins[station]:
+                mins[station] = value
+            if value > maxs[station]:
+                maxs[station] = value
+            sums[station] += value
+            counts[station] += 1
+
+            location = None
+        if progress.enabled:
+            progress.add(len(block), sum(counts))
+    gc_enable()
+    return result
+
+
+TAIL_RESERVE = 128  # free bytes in front of each prefetch buffer for the partial line of the previous block
+PREFETCH_DEPTH = 2  # buffers being filled or waiting while another one is parsed
+
+
+def _prefetch_blocks(
+    fh,
+    byte_count: int,
+    free: queue.Queue,
+    filled: queue.Queue,
+) -> None:
+    """Reader thread: readinto free buffers, behind their reserve, until byte_count bytes were read
+
+    Puts (buffer, size) for every block, then (None, 0), or (exception, 0) if reading failed. Stops
+    early when it takes None from free instead of a buffer.
+    """
+    try:
+        while byte_count > 0:
+            buffer = free.get()
+            if buffer is None:
+                return
+            with memoryview(buffer) as view:
+                size = fh.readinto(view[TAIL_RESERVE : TAIL_RESERVE + min(len(buffer) - TAIL_RESERVE, byte_count)])
+            if not size:
+                break
+            byte_count -= size
+            filled.put((buffer, size))
+    except BaseException as e:
+        filled.put((e, 0))
+        return
+    filled.put((None, 0))
+
+
+def _parse_rows(
+    data: bytes,
+    result: StationTable,
+    stations: frozenset,
+    first_bytes: bytes,
+) -> None:
+    """Aggregate newline terminated rows"""
+    ids, add = result.ids, result.add
+    mins, maxs, sums, counts = result.mins, result.maxs, result.sums, result.counts
+    index = 0
+    end = len(data)
+    while index < end:
+        semicolon = data.index(b";", index)
+        newline = data.index(b"\n", semicolon)
+        location = data[index:semicolon]
+        value = TENTHS[data[semicolon + 1 : newline]]
+        index = newline + 1
+        if first_bytes is not None and (not first_bytes[location[0]] or location not in stations):
+            continue
+        try:
+            station = ids[location]
+        except KeyError:
+            station = add(location)
+        if value < mins[station]:
+            mins[station] = value
+        if value > maxs[station]:
+            maxs[station] = value
+        sums[station] += value
+        counts[station] += 1
+
+
+def _process_file_chunk_prefetch(
+    file_name: str,
+    chunk_start: int,
+    chunk_end: int,
+    blocksize: int = 1024 * 1024,
+    stations: frozenset = None,
+) -> StationTable:
+    """Process each file chunk in a different process, with a reader thread prefetching the next blocks
+
+    The reader fills a ring of preallocated buffers with readinto while the previous block is parsed
+    (the read releases the GIL). The partial line at the end of a block is copied into the reserve in
+    front of the next buffer, instead of concatenating it with the whole next block. bytearray slices
+    are not hashable, so the complete rows are copied out as one bytes object per block: slicing
+    names out of it is cheaper than converting every name and value slice with bytes().
+    """
+    result = StationTable()
+    first_bytes = first_byte_filter(stations) if stations is not None else None
+    progress = _progress.current()
+    free = queue.Queue()
+    filled = queue.Queue()
+    for _ in range(PREFETCH_DEPTH + 1):
+        free.put(bytearray(TAIL_RESERVE + blocksize))
+
+    with open(file_name, mode="rb", buffering=0) as fh:
+        fh.seek(chunk_start)
+        reader = threading.Thread(
+            target=_prefetch_blocks,
+            args=(fh, chunk_end - chunk_start, free, filled),
+            daemon=True,
+        )
+        reader.start()
+        gc_disable()
+        try:
+            tail = b""
+            while True:
+                buffer, size = filled.get()
+                if buffer is None:
+                    break
+                if isinstance(buffer, BaseException):
+                    raise buffer
+
+                start = TAIL_RESERVE - len(tail)
+                if start < 0:
+                    raise ValueError(f"line longer than {TAIL_RESERVE} bytes at the end of a block")
+                buffer[start:TAIL_RESERVE] = tail
+                end = TAIL_RESERVE + size
+                rows_end = buffer.rfind(b"\n", start, end) + 1
+                if rows_end == 0:
+                    rows_end = start  # no complete line in this block
+                with memoryview(buffer) as view:
+                    _parse_rows(bytes(view[start:rows_end]), result, stations, first_bytes)
+                    tail = bytes(view[rows_end:end])
+                free.put(buffer)
+                if progress.enabled:
+                    progress.add(size, sum(result.counts))
+
+            if tail:
+                # last line of the file has no trailing newline
+                _parse_rows(tail + b"\n", result, stations, first_bytes)
+        finally:
+            # Stop a reader still waiting for a free buffer before the file is closed
+            free.put(None)
+            reader.join()
+            gc_enable()
     return result
 
 
 def process_file(
     cpu_count: int,
     start_end: list,
+    schedule_report: bool = False,
+    shared_memory: bool = False,
+    prefetch: bool = False,
 ) -> dict:
     """Process data file"""
-    with mp.Pool(cpu_count) as p:
-        # Run chunks in parallel
-        chunk_results = p.starmap(
-            _process_file_chunk,
-            start_end,
-        )
-
-    # Combine all results from all chunks
-    result = dict()
-    for chunk_result in chunk_results:
-        for location, measurements in chunk_result.items():
-            if location not in result:
-                result[location] = measurements
-            else:
-                _result = result[location]
-                if measurements[0] < _result[0]:
-                    _result[0] = measurements[0]
-                if measurements[1] > _result[1]:
-                    _result[1] = measurements[1]
-                _result[2] += measurements[2]
-                _result[3] += measurements[3]
+    # Run chunks in parallel, combining results from all chunks as they finish
+    result, report = run_work_units(
+        _process_file_chunk_prefetch if prefetch else _process_file_chunk,
+        start_end,
+        cpu_count,
+        shared_memory=shared_memory,
+    )
+    if schedule_report:
+        print(format_schedule_report(report), file=sys.stderr)
 
     # Print final results
-    print("{", end="")
-    for location, measurements in sorted(result.items()):
-        print(
-            f"{location.decode('utf-8')}={measurements[0]:.1f}/{(measurements[2] / measurements[3]) if measurements[3] !=0 else 0:.1f}/{measurements[1]:.1f}",
-            end=", ",
-        )
-    print("\b\b} ")
+    sys.stdout.write(format_results(result))
 
 
 if __name__ == "__main__":
-    cpu_count, *start_end = get_file_chunks("measurements.txt")
-    process_file(cpu_count, start_end[0])
+    from onebrc.__main__ import positive_int
+
+    parser = argparse.ArgumentParser(description="Calculate average measurements")
+    parser.add_argument(
+        "--unit-size",
+        dest="unit_size",
+        type=positive_int,
+        help="Split the file into work units of about UNIT_SIZE bytes pulled by the workers (default is one chunk per CPU)",
+    )
+    parser.add_argument(
+        "--schedule-report",
+        dest="schedule_report",
+        action="store_true",
+        help="Print how long each worker was busy and idle at the tail to stderr",
+    )
+    parser.add_argument(
+        "--shared-memory",
+        dest="shared_memory",
+        action="store_true",
+        help="Workers write their results to shared memory instead of pickling them back",
+    )
+    parser.add_argument(
+        "--prefetch",
+        dest="prefetch",
+        action="store_true",
+        help="Read the next blocks in a background thread while parsing the current one",
+    )
+    args = parser.parse_args()
+
+    if args.unit_size:
+        cpu_count = available_cpus()
+        start_end = [get_work_units("measurements.txt", args.unit_size)]
+    else:
+        cpu_count, *start_end = get_file_chunks("measurements.txt")
+    process_file(cpu_count, start_end[0], args.schedule_report, args.shared_memory, args.prefetch)
@@ -1,35 +1,45 @@
 from multiprocessing import Pool
+from functools import partial
 import os
+import sys
 import math
+import contextlib
+
+from onebrc.cpus import available_cpus
+from onebrc.fixedpoint import TENTHS
+from onebrc.output import format_results
+from onebrc.phases import current
+from onebrc import progress as _progress
+from onebrc.stations import StationTable, first_byte_filter
 
 
 FILE_PATH = "measurements.txt"
-PROCESS_COUNT = os.cpu_count()
+PROCESS_COUNT = available_cpus()
 BUFFER_SIZE = 1024 * 128
 
 NEW_LINE_ORD = ord(b"\n")
 SEMICOLON_ORD = ord(b";")
 
 
-def create_chunks():
-    s = os.stat(FILE_PATH)
+def create_chunks(file_path=FILE_PATH, process_count=PROCESS_COUNT):
+    s = os.stat(file_path)
     FILE_SIZE = s.st_size
 
-    CHUNK_SIZE = math.ceil(FILE_SIZE / PROCESS_COUNT)
+    CHUNK_SIZE = math.ceil(FILE_SIZE / process_count)
 
-    chunks = [[i * CHUNK_SIZE, min((i+1) * CHUNK_SIZE, FILE_SIZE - 1)] for i in range(PROCESS_COUNT)]
+    chunks = [[i * CHUNK_SIZE, min((i+1) * CHUNK_SIZE, FILE_SIZE - 1)] for i in range(process_count)]
 
-    # align chunks to \n
-    ALIGN_RANGE = 40
+    # align chunks to \n, a line is at most 100 bytes of name, ";-99.9" and the \n
+    ALIGN_RANGE = 128
 
-    with open(FILE_PATH, "rb") as f:
+    with open(file_path, "rb") as f:
         for chunk_num, chunk in enumerate(chunks):
             start, end = chunk
             if start == 0:
                 continue
 
-            f.seek(start - ALIGN_RANGE)
-            haystack = f.read(ALIGN_RANGE)
+            f.seek(max(start - ALIGN_RANGE, 0))
+            haystack = f.read(min(start, ALIGN_RANGE))
 
             # find next \n in haystack
             for pos, c in enumerate(reversed(haystack)):
@@ -44,15 +54,19 @@ def create_chunks():
     return chunks
 
 
-def parse_partial(chunk):
-    result = dict()
+def parse_partial(chunk, file_path=FILE_PATH, buffer_size=BUFFER_SIZE, stations=None):
+    result = StationTable()
+    first_bytes = first_byte_filter(stations) if stations is not None else None
+    ids, add = result.ids, result.add
+    mins, maxs, sums, counts = result.mins, result.maxs, result.sums, result.counts
 
     start, end = chunk
+    progress = _progress.current()
 
-    with open(FILE_PATH, "rb") as f:
+    with open(file_path, "rb") as f:
         f.seek(start)
 
-        buffer = memoryview(bytearray(BUFFER_SIZE))
+        buffer = memoryview(bytearray(buffer_size))
         buffer_view = buffer
         tail_size = 0
 
@@ -90,53 +104,86 @@ def parse_partial(chunk):
                     tail_size = len(buffer_view) - buffer_cursor
                     break
 
+                if first_bytes is not None and not first_bytes[cursor_view[0]]:
+                    # skip the row without copying it
+                    buffer_cursor += newline_index + 1
+                    continue
+
                 line = bytes(cursor_view[:newline_index])
                 city = line[:semicolon_index]
-                temp = int(line[semicolon_index+1:-2] + line[-1:])
+                if first_bytes is not None and city not in stations:
+                    buffer_cursor += newline_index + 1
+                    continue
+                temp = TENTHS[line[semicolon_index+1:]]
 
                 try:
-                    result_values = result[city]
-                    if temp < result_values[0]:
-                        result_values[0] = temp
-                    if temp > result_values[1]:
-                        result_values[1] = temp
-                    result_values[2] += temp
-                    result_values[3] += 1
+                    station = ids[city]
                 except KeyError:
-                    result[city] = [temp, temp, temp, 1]
+                    station = add(city)
+                if temp < mins[station]:
+                    mins[station] = temp
+                if temp > maxs[station]:
+                    maxs[station] = temp
+                sums[station] += temp
+                counts[station] += 1
 
                 buffer_cursor += newline_index + 1
 
+            if progress.enabled:
+                progress.add(bytes_read, sum(counts))
+
+        # the last line of the file may have no trailing \n
+        if tail_size > 0 and end + 1 == os.fstat(f.fileno()).st_size:
+            city, temp = bytes(buffer_view[-tail_size:]).split(b";")
+            if stations is None or city in stations:
+                temp = TENTHS[temp]
+                try:
+                    station = ids[city]
+                except KeyError:
+                    station = add(city)
+                if temp < mins[station]:
+                    mins[station] = temp
+                if temp > maxs[station]:
+                    maxs[station] = temp
+                sums[station] += temp
+                counts[station] += 1
+
+        if progress.enabled:
+            # the last read may go past the end of the chunk
+            progress.unit_done(end - start + 1, sum(counts))
         return result
 
 
+def process_file(file_path=FILE_PATH, process_count=PROCESS_COUNT, buffer_size=BUFFER_SIZE, stations=None):
+    phases = current()
+    with phases.phase("chunks"):
+        chunks = create_chunks(file_path, process_count)
+
+    overall_result = StationTable()
+    monitor = _progress.monitor()
+    initializer, counters = None, None
+    tracking = contextlib.nullcontext()
+    if monitor is not None:
+        # every pool process claims a slot of the shared progress counters
+        initializer, counters = _progress.attach, _progress.ProgressCounters(process_count)
+
+    with Pool(processes=process_count, initializer=initializer, initargs=(counters,)) as p:
+        if monitor is not None:
+            tracking = monitor.track(counters, sum(end - start + 1 for start, end in chunks))
+        with tracking:
+            # add results as soon as each chunk is done
+            for result in p.imap_unordered(
+                partial(parse_partial, file_path=file_path, buffer_size=buffer_size, stations=stations),
+                chunks,
+            ):
+                with phases.phase("merge"):
+                    overall_result.merge(result)
+
+    return overall_result
+
+
 if __name__ == "__main__":
-    chunks = create_chunks()
-
-    with Pool(processes=PROCESS_COUNT) as p:
-        results = p.map(parse_partial, chunks)
-
-    overall_result = dict()
-
-    # add all results
-    for result in results:
-        for city, values in result.items():
-            try:
-                overall_result_values = overall_result[city]
-                if values[0] < overall_result_values[0]:
-                    overall_result_values[0] = values[0]
-                if values[1] > overall_result_values[1]:
-                    overall_result_values[1] = values[1]
-                overall_result_values[2] += values[2]
-                overall_result_values[3] += values[3]
-            except KeyError:
-                overall_result[city] = [values[0], values[1], values[2], values[3]]
+    overall_result = process_file()
 
     # Print final results
-    print("{", end="")
-    for city, measurements in sorted(overall_result.items()):
-        print(
-            f"{city.decode('utf-8')}={measurements[0] / 10:.1f}/{(measurements[2] / 10 / measurements[3]) if measurements[3] !=0 else 0:.1f}/{measurements[1] / 10:.1f}",
-            end=", ",
-        )
-    print("\b\b} ")
+    sys.stdout.write(format_results(overall_result))
@@ -0,0 +1,113 @@
+# time python3.13t calculateAverageThreads.py
+import sys
+import mmap
+import queue
+import argparse
+import sysconfig
+import threading
+from gc import disable as gc_disable, enable as gc_enable
+
+from calculateAverage import _process_buffer, _process_file_chunk_mmap, get_file_chunks
+from onebrc.cpus import available_cpus
+from onebrc.output import format_results
+from onebrc.phases import current
+from onebrc.stations import StationTable
+from onebrc.scheduler import get_work_units, run_work_units
+
+
+def gil_disabled() -> bool:
+    """True on a free-threaded build (e.g. python3.13t) running without the GIL
+
+    A free-threaded build re-enables the GIL when PYTHON_GIL=1 is set or an extension module needs it,
+    threads would then run one at a time again.
+    """
+    if not sysconfig.get_config_var("Py_GIL_DISABLED"):
+        return False
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _thread_worker(
+    mm: mmap.mmap,
+    units: queue.SimpleQueue,
+    table: StationTable,
+    stations: frozenset,
+    errors: list,
+) -> None:
+    """Pull units until the queue is empty, aggregating them into this thread's own table"""
+    try:
+        while True:
+            try:
+                _, unit_start, unit_end = units.get_nowait()
+            except queue.Empty:
+                break
+            _process_buffer(mm, unit_start, unit_end, table, stations)
+    except BaseException as e:
+        errors.append(e)
+
+
+def process_file_threads(
+    file_name: str,
+    start_end: list,
+    thread_count: int,
+    stations: frozenset = None,
+) -> StationTable:
+    """Process the chunks with threads sharing one memory map, each thread with its own StationTable
+
+    Nothing is shared between the threads but the map and the unit queue, so their tables need no
+    locks, and they are merged once all threads are done.
+    """
+    units = queue.SimpleQueue()
+    for unit in start_end:
+        units.put(unit)
+    tables = [StationTable() for _ in range(thread_count)]
+    errors = list()
+
+    with open(file_name, mode="rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            threads = [
+                threading.Thread(target=_thread_worker, args=(mm, units, table, stations, errors))
+                for table in tables
+            ]
+            gc_disable()
+            with current().phase("threads"):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            gc_enable()
+    if errors:
+        raise errors[0]
+
+    result = StationTable()
+    with current().phase("merge"):
+        for table in tables:
+            result.merge(table)
+    return result
+
+
+if __name__ == "__main__":
+    from onebrc.__main__ import positive_int
+
+    parser = argparse.ArgumentParser(description="Calculate average measurements with threads")
+    parser.add_argument(
+        "--unit-size",
+        dest="unit_size",
+        type=positive_int,
+        help="Split the file into work units of about UNIT_SIZE bytes pulled by the threads (default is one chunk per CPU)",
+    )
+    args = parser.parse_args()
+
+    if args.unit_size:
+        cpu_count = available_cpus()
+        start_end = get_work_units("measurements.txt", args.unit_size)
+    else:
+        cpu_count, start_end = get_file_chunks("measurements.txt")
+    if gil_disabled():
+        result = process_file_threads("measurements.txt", start_end, cpu_count)
+    else:
+        # With the GIL threads would take turns, use processes instead
+        result, _ = run_work_units(_process_file_chunk_mmap, start_end, cpu_count)
+
+    # Print final results
+    sys.stdout.write(format_results(result))
@@ -1,9 +1,2 @@
-python calculateAverage.py > python.txt
-python calculateAveragePypy.py > pypy.txt
-python calculateAveragePolars.py > polars.txt
-python calculateAverageDuckDB.py > duckdb.txt
-python calculateAveragePypyInputBuffer.py > pypyinputbuffer.txt
-git diff --no-index --word-diff=porcelain python.txt pypy.txt
-git diff --no-index --word-diff=porcelain python.txt polars.txt
-git diff --no-index --word-diff=porcelain python.txt duckdb.txt
-git diff --no-index --word-diff=porcelain python.txt pypyinputbuffer.txt
+# Run every engine once and check they all produce the same output
+python -m onebrc.bench --runs 1 --warmup 0 "$@"
@@ -1,10 +1,16 @@
-import argparse
+import os
 import time
+import shutil
+import argparse
+import multiprocessing as mp
 
 import numpy as np
 import polars as pl
 from tqdm import tqdm
 
+from onebrc.cpus import available_cpus
+from onebrc.binary import pack_header, write_group
+
 
 class CreateMeasurement:
     STATIONS = (  # station_name, average_temperature
@@ -423,51 +429,246 @@ class CreateMeasurement:
         ("Zürich", 9.3),
     )
 
-    stations = pl.DataFrame(STATIONS, ("names", "means"))
+    stations = pl.DataFrame(STATIONS, ("names", "means"), orient="row").with_row_index("ids")
 
-    def __init__(self):
-        self.rng = np.random.default_rng()
+    MAX_NAME_BYTES = 100
+    # Synthetic station names mix letters of 1, 2, 3 and 4 bytes in UTF-8
+    NAME_LETTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ" "éüøçñåłžαβγδλπωжшщяю" "東京北海道大阪ทยก" "𝔸𝔹𝕂𐌰𐌱"
+
+    def __init__(self, seed: int = None, stations: int = None, zipf: float = 0):
+        """stations synthetic stations instead of STATIONS, with Zipf distributed frequencies when zipf > 0"""
+        # Every batch gets its own child of the master seed, so a file only depends on the seed,
+        # whatever the number of workers that generated its batches
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        if stations:
+            self.stations = self.synthetic_stations(stations)
+        self.weights = None
+        if zipf > 0:
+            # The k-th most frequent station has a weight of 1 / k ** zipf, ranks are shuffled so the
+            # hot stations are not the first ones in name order
+            ranks = self.rng.permutation(len(self.stations)) + 1
+            weights = 1.0 / ranks ** zipf
+            self.weights = weights / weights.sum()
+
+    def synthetic_stations(self, count: int) -> pl.DataFrame:
+        """count unique station names of 1 to MAX_NAME_BYTES UTF-8 bytes, with random average temperatures"""
+        letters = np.array(list(self.NAME_LETTERS))
+        sizes = np.array([len(letter.encode("utf-8")) for letter in letters])
+        names = dict()  # ordered, so the stations only depend on the seed
+        while len(names) < count:
+            target = self.rng.integers(1, self.MAX_NAME_BYTES + 1)
+            picks = self.rng.integers(len(letters), size=self.MAX_NAME_BYTES)
+            length = np.searchsorted(np.cumsum(sizes[picks]), target, side="right")
+            if length:
+                names["".join(letters[picks[:length]])] = None
+        means = np.round(self.rng.uniform(-10, 30, count), 1)
+        return pl.DataFrame({"names": list(names), "means": means}).with_row_index("ids")
 
     def generate_batch(
             self,
             std_dev: float = 10,
-            records: int = 10_000_000
+            records: int = 10_000_000,
+            rng: np.random.Generator = None,
     ) -> pl.DataFrame:
-        batch = self.stations.sample(
-            records,
-            with_replacement=True,
-            shuffle=True,
-            seed=self.rng.integers(np.iinfo(np.int64).max)
-        )
-        batch = batch.with_columns(temperature=self.rng.normal(batch["means"], std_dev))
+        rng = rng or self.rng
+        if self.weights is not None:
+            batch = self.stations[rng.choice(len(self.stations), records, p=self.weights)]
+        else:
+            batch = self.stations.sample(
+                records,
+                with_replacement=True,
+                shuffle=True,
+                seed=rng.integers(np.iinfo(np.int64).max)
+            )
+        batch = batch.with_columns(temperature=rng.normal(batch["means"], std_dev))
         return batch.drop("means")
 
+    def generate_tenths(
+            self,
+            std_dev: float = 10,
+            records: int = 10_000_000,
+            rng: np.random.Generator = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Station ids and temperatures in integer tenths of a batch, drawn with NumPy only"""
+        rng = rng or self.rng
+        if self.weights is not None:
+            ids = rng.choice(len(self.stations), records, p=self.weights)
+        else:
+            ids = rng.integers(len(self.stations), size=records)
+        means = (self.stations["means"].to_numpy() * 10).astype(np.float32)
+        tenths = rng.standard_normal(records, dtype=np.float32)
+        tenths *= std_dev * 10
+        tenths += means[ids]
+        np.rint(tenths, out=tenths)
+        np.clip(tenths, -999, 999, out=tenths)
+        return ids, tenths.astype(np.int16)
+
+    def write_batch(
+            self,
+            file_name: str,
+            seed_sequence: np.random.SeedSequence,
+            records: int,
+            sep: str = ";",
+            std_dev: float = 10,
+            binary: bool = False,
+            csv: bool = False,
+    ) -> str:
+        """Generate one batch from its own seed and write it to a file of its own, binary as one row group
+
+        With csv the rows are generated as a Polars DataFrame and formatted by write_csv, the
+        previous and slower path.
+        """
+        rng = np.random.default_rng(seed_sequence)
+        if csv:
+            data = self.generate_batch(std_dev, records, rng)
+            with open(file_name, encoding="utf-8", mode="w") as f:
+                data.select("names", "temperature").write_csv(f, separator=sep, float_precision=1, include_header=False)
+            return file_name
+
+        ids, tenths = self.generate_tenths(std_dev, records, rng)
+        with open(file_name, mode="wb") as f:
+            if binary:
+                write_group(f, ids, tenths)
+            else:
+                names = [name.encode("utf-8") for name in self.stations["names"]]
+                f.write(format_rows(names, ids, tenths, sep.encode("utf-8")))
+        return file_name
+
     def generate_measurement_file(
             self,
             file_name: str = "measurements.txt",
             records: int = 1_000_000_000,
             sep: str = ";",
             std_dev: float = 10,
+            workers: int = 1,
+            batch_size: int = 10_000_000,
+            binary: bool = False,
+            csv: bool = False,
     ) -> None:
         print(
-            f"Creating measurement file '{file_name}' with {records:,} measurements..."
+            f"Creating measurement file '{file_name}' with {records:,} measurements "
+            f"(seed {self.seed_sequence.entropy})..."
         )
         start = time.time()
-        batches = max(records // 10_000_000, 1)
+        batches = max(records // batch_size, 1)
         batch_ends = np.linspace(0, records, batches + 1).astype(int)
+        seeds = self.seed_sequence.spawn(batches)
+        shards = [
+            (f"{file_name}.part{i:05d}", seeds[i], batch_ends[i + 1] - batch_ends[i], sep, std_dev, binary, csv)
+            for i in range(batches)
+        ]
 
-        with open(file_name, encoding="utf-8", mode="w") as f:
-            for i in tqdm(range(batches)):
-                from_, to = batch_ends[i], batch_ends[i + 1]
-                data = self.generate_batch(std_dev, to - from_)
-                data.write_csv(f, separator=sep, float_precision=1, include_header=False)
+        with open(file_name, mode="wb") as f:
+            if binary:
+                # Ids are the positions in stations, every batch is a row group behind the dictionary
+                f.write(pack_header([name.encode("utf-8") for name in self.stations["names"]]))
+            if workers > 1:
+                # Polars runs a thread pool, forking the process would copy its locks in whatever state
+                with mp.get_context("spawn").Pool(workers) as pool:
+                    # Batches are generated in parallel, each into a shard file, and appended in order
+                    # as soon as they are ready
+                    for shard in tqdm(pool.imap(self._write_batch, shards), total=batches):
+                        _append_file(shard, f)
+            else:
+                for shard in tqdm(shards):
+                    _append_file(self._write_batch(shard), f)
 
-            print(
-                f"Created file '{file_name}' with {to:,} measurements in {time.time() - start:.2f} seconds"
-            )
+        print(
+            f"Created file '{file_name}' with {records:,} measurements in {time.time() - start:.2f} seconds"
+        )
+
+    def _write_batch(self, shard: tuple) -> str:
+        return self.write_batch(*shard)
+
+
+# Text of every temperature in tenths from -99.9 to 99.9, TEMPERATURES[tenths + 999]
+TEMPERATURES = [f"{tenths / 10:.1f}\n".encode() for tenths in range(-999, 1000)]
+FORMAT_ROWS = 1 << 14  # rows assembled at once, the segments of a block stay in the CPU caches
+SEGMENT_COPY_BYTES = 6  # above this mean name + separator size per row, whole segments are copied
+
+
+def format_rows(names: list, ids: np.ndarray, tenths: np.ndarray, sep: bytes = b";") -> np.ndarray:
+    """Text rows of station ids and temperatures in tenths as one uint8 array, ready for a single write
+
+    Every row is two segments: the encoded name and separator of its station, then its temperature
+    text from TEMPERATURES. b"".join copies whole segments, block by block. Only for names of a few
+    bytes a gather index, which maps every output byte to its byte in one table of all segments for
+    np.take, is faster: its cost grows with every byte.
+    """
+    prefixes = [name + sep for name in names]
+    prefix_sizes = np.array([len(prefix) for prefix in prefixes], dtype=np.int32)
+    temperature_sizes = np.array([len(text) for text in TEMPERATURES], dtype=np.int32)
+    temperatures = tenths.astype(np.intp) + 999
+    name_bytes = int(prefix_sizes[ids].sum())
+    rows = np.empty(name_bytes + int(temperature_sizes[temperatures].sum()), dtype=np.uint8)
+    if len(ids) and name_bytes / len(ids) > SEGMENT_COPY_BYTES:
+        _copy_segments(rows, prefixes, ids, temperatures)
+    else:
+        _gather_segments(rows, prefixes, prefix_sizes, temperature_sizes, ids, temperatures)
+    return rows
+
+
+def _gather_segments(rows, prefixes, prefix_sizes, temperature_sizes, ids, temperatures) -> None:
+    table = np.frombuffer(b"".join(prefixes) + b"".join(TEMPERATURES), dtype=np.uint8)
+    prefix_starts = np.cumsum(prefix_sizes, dtype=np.int32) - prefix_sizes
+    temperature_starts = np.cumsum(temperature_sizes, dtype=np.int32) - temperature_sizes + prefix_sizes.sum()
+    position = 0
+    for start in range(0, len(ids), FORMAT_ROWS):
+        block_ids = ids[start : start + FORMAT_ROWS]
+        block_temperatures = temperatures[start : start + FORMAT_ROWS]
+        # Interleaved name and temperature segments: their sizes and their offsets in the table
+        sizes = np.empty(2 * len(block_ids), dtype=np.int32)
+        sizes[0::2] = prefix_sizes[block_ids]
+        sizes[1::2] = temperature_sizes[block_temperatures]
+        sources = np.empty(2 * len(block_ids), dtype=np.int32)
+        sources[0::2] = prefix_starts[block_ids]
+        sources[1::2] = temperature_starts[block_temperatures]
+        ends = np.cumsum(sizes, dtype=np.int32)
+        size = int(ends[-1])
+        # Byte i of the block comes from table[i - segment start + segment source]
+        sources -= ends - sizes
+        index = np.repeat(sources, sizes)
+        index += np.arange(size, dtype=np.int32)
+        np.take(table, index, out=rows[position : position + size])
+        position += size
+
+
+def _copy_segments(rows, prefixes, ids, temperatures) -> None:
+    prefixes = np.array(prefixes, dtype=object)
+    texts = np.array(TEMPERATURES, dtype=object)
+    view = memoryview(rows)
+    position = 0
+    for start in range(0, len(ids), FORMAT_ROWS):
+        block_ids = ids[start : start + FORMAT_ROWS]
+        segments = np.empty(2 * len(block_ids), dtype=object)
+        segments[0::2] = prefixes[block_ids]
+        segments[1::2] = texts[temperatures[start : start + FORMAT_ROWS]]
+        block = b"".join(segments.tolist())
+        view[position : position + len(block)] = block
+        position += len(block)
+
+
+def _append_file(source_name: str, destination) -> None:
+    """Append a shard to an open file and delete it, copy_file_range copies inside the kernel (or shares the blocks)"""
+    destination.flush()
+    with open(source_name, mode="rb") as source:
+        size = remaining = os.fstat(source.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(source.fileno(), destination.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except (AttributeError, OSError):  # not Linux, or a file system without copy_file_range
+            source.seek(size - remaining)
+            destination.seek(0, os.SEEK_END)
+            shutil.copyfileobj(source, destination)
+    os.remove(source_name)
 
 
 if __name__ == "__main__":
+    from onebrc.__main__ import positive_int
 
     def min_records(records: str) -> int:
         try:
@@ -489,8 +690,7 @@ if __name__ == "__main__":
         "--output",
         dest="output",
         type=str,
-        help='Measurement file name (default is "measurements.txt")',
-        default="measurements.txt",
+        help='Measurement file name (default is "measurements.txt", "measurements.1brc" in binary format)',
     )
     parser.add_argument(
         "-r",
@@ -500,11 +700,57 @@ if __name__ == "__main__":
         type=min_records,
         default=1_000_000_000,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes generating batches in parallel (default is the number of CPUs)",
+        dest="workers",
+        type=positive_int,
+        default=available_cpus(),
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        help="Master seed, the same seed creates the same file whatever the number of workers (default is random)",
+        dest="seed",
+        type=int,
+    )
+    parser.add_argument(
+        "--stations",
+        help="Number of synthetic stations with UTF-8 names of up to 100 bytes (default is the 413 real cities)",
+        dest="stations",
+        type=positive_int,
+    )
+    parser.add_argument(
+        "--zipf",
+        help="Zipf exponent of the station frequencies, e.g. 1.0 for a few hot stations (default is 0, uniform)",
+        dest="zipf",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        help='"text" rows, or "binary" columns of station ids and tenths read by calculateAverageBinary.py (default is "text")',
+        dest="format",
+        choices=("text", "binary"),
+        default="text",
+    )
+    parser.add_argument(
+        "--csv",
+        help="Format the rows with Polars write_csv, the previous and slower path (text format only)",
+        dest="csv",
+        action="store_true",
+    )
 
     args = parser.parse_args()
+    binary = args.format == "binary"
 
-    measurement = CreateMeasurement()
+    measurement = CreateMeasurement(args.seed, args.stations, args.zipf)
     measurement.generate_measurement_file(
-        file_name=args.output,
+        file_name=args.output or ("measurements.1brc" if binary else "measurements.txt"),
         records=args.records,
+        workers=args.workers,
+        binary=binary,
+        csv=args.csv and not binary,
     )
@@ -0,0 +1,4 @@
+"""Shared building blocks for the 1BRC calculateAverage*.py engines"""
+from onebrc.api import StationStats, aggregate
+
+__all__ = ["StationStats", "aggregate"]
@@ -0,0 +1,201 @@
+"""Command line entry point: python -m onebrc --engine ENGINE --file PATH"""
+import sys
+import argparse
+import contextlib
+
+from onebrc import phases as _phases
+from onebrc import progress as _progress
+from onebrc.blockio import STRATEGIES
+from onebrc.engines import ENGINES, EngineOptions, run
+from onebrc.output import format_results
+
+
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except Exception:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    else:
+        if number < 1:
+            raise argparse.ArgumentTypeError("value must be at least 1")
+        else:
+            return number
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m onebrc",
+        description="Calculate min/mean/max per station with any of the engines",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        dest="engine",
+        choices=list(ENGINES),
+        help='Engine to run (default is "python")',
+        default="python",
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        dest="file",
+        type=str,
+        help='Measurement file name (default is "measurements.txt")',
+        default="measurements.txt",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=positive_int,
+        help="Number of worker processes (threads for polars/duckdb), default is the CPUs allowed by the affinity mask and cgroup quota",
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        dest="block_size",
+        type=positive_int,
+        help="Read size in bytes for the pypy, numpy and inputbuffer engines",
+    )
+    parser.add_argument(
+        "-u",
+        "--unit-size",
+        dest="unit_size",
+        type=positive_int,
+        help="Split the file into work units of about UNIT_SIZE bytes pulled by the workers (python, mmap, pypy and numpy engines)",
+    )
+    parser.add_argument(
+        "--shared-memory",
+        dest="shared_memory",
+        action="store_true",
+        help="Workers write their results to shared memory instead of pickling them back",
+    )
+    parser.add_argument(
+        "--schedule-report",
+        dest="schedule_report",
+        action="store_true",
+        help="Print how long each worker was busy and idle at the tail to stderr",
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="Only aggregate lines appended since the previous incremental run (python, mmap, pypy and numpy engines)",
+    )
+    parser.add_argument(
+        "--state-file",
+        dest="state_file",
+        type=str,
+        help="Where incremental runs keep their state (default is FILE.1brc-state)",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        dest="checkpoint_dir",
+        type=str,
+        help="Save every completed work unit to this directory, rerunning a killed run only processes the missing units",
+    )
+    parser.add_argument(
+        "-s",
+        "--station",
+        dest="stations",
+        action="append",
+        help="Only aggregate this station, can be repeated (rows of other stations are skipped in the workers)",
+    )
+    parser.add_argument(
+        "--percentiles",
+        dest="percentiles",
+        action="store_true",
+        help="Also print the exact p50/p95/p99 per station (python, numpy and binary engines)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        dest="prefetch",
+        action="store_true",
+        help="pypy engine: read the next blocks in a background thread while parsing the current one",
+    )
+    parser.add_argument(
+        "--index",
+        dest="index",
+        action="store_true",
+        help="Answer from the block index built by python -m onebrc.index, scan the file when it is missing or stale",
+    )
+    parser.add_argument(
+        "--index-file",
+        dest="index_file",
+        type=str,
+        help="Block index file (default is FILE.1brc-index)",
+    )
+    parser.add_argument(
+        "--phase-report",
+        dest="phase_report",
+        type=str,
+        help="Write the wall/CPU time of every phase, in the parent and per worker, as JSON to this file (- for stderr)",
+    )
+    parser.add_argument(
+        "--io",
+        dest="io",
+        choices=STRATEGIES,
+        help="How the pypy and numpy engines read their blocks (default is buffered): read, readinto, mmap with madvise or pread with posix_fadvise",
+    )
+    parser.add_argument(
+        "--pin",
+        dest="pin",
+        action="store_true",
+        help="Restrict every worker process to one CPU (Linux, engines using the work unit scheduler)",
+    )
+    parser.add_argument(
+        "--progress",
+        dest="progress",
+        action="store_true",
+        help="Show the throughput, worker skew and ETA on stderr while the workers run",
+    )
+    parser.add_argument(
+        "--progress-json",
+        dest="progress_json",
+        type=str,
+        help="Append the progress as one JSON object per line to this file (- for stderr)",
+    )
+    return parser
+
+
+def main(argv: list = None) -> None:
+    args = build_parser().parse_args(argv)
+    options = EngineOptions(
+        workers=args.workers,
+        block_size=args.block_size,
+        unit_size=args.unit_size,
+        shared_memory=args.shared_memory,
+        schedule_report=args.schedule_report,
+        incremental=args.incremental,
+        state_file=args.state_file,
+        checkpoint_dir=args.checkpoint_dir,
+        index=args.index,
+        index_file=args.index_file,
+        stations=None if args.stations is None else frozenset(name.encode("utf-8") for name in args.stations),
+        percentiles=args.percentiles,
+        prefetch=args.prefetch,
+        pin=args.pin,
+        io=args.io,
+    )
+    phases = _phases.enable() if args.phase_report else _phases.current()
+    with contextlib.ExitStack() as stack:
+        if args.progress_json:
+            stream = sys.stderr if args.progress_json == "-" else stack.enter_context(open(args.progress_json, mode="a"))
+            _progress.enable(stream, json_lines=True)
+        elif args.progress:
+            _progress.enable()
+        stack.callback(_progress.disable)
+        with phases.phase("run"):
+            result = run(args.engine, args.file, options)
+    with phases.phase("format"):
+        output = format_results(result, args.percentiles)
+    with phases.phase("write"):
+        sys.stdout.write(output)
+        sys.stdout.flush()
+    if args.phase_report:
+        _phases.write_report({"engine": args.engine, "file": args.file, **phases.to_dict()}, args.phase_report)
+        _phases.disable()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Library interface: aggregate a measurements file from Python instead of parsing the printed summary"""
+from dataclasses import dataclass
+
+from onebrc.engines import EngineOptions, run
+
+
+@dataclass(frozen=True)
+class StationStats:
+    """Aggregates of one station, in degrees, the percentiles are only set when they were asked for"""
+
+    min: float
+    mean: float
+    max: float
+    count: int
+    p50: float = None
+    p95: float = None
+    p99: float = None
+
+
+def _station_names(stations) -> frozenset:
+    return frozenset(name.encode("utf-8") if isinstance(name, str) else bytes(name) for name in stations)
+
+
+def aggregate(
+    path: str,
+    engine: str = "python",
+    stations=None,
+    workers: int = None,
+    **options,
+) -> dict[str, StationStats]:
+    """Return min/mean/max/count per station, sorted by station name
+
+    stations is an allow-list of names (str or bytes), pushed down into the workers so rows of other
+    stations are skipped before they are hashed. The other keyword arguments are EngineOptions fields,
+    e.g. percentiles=True also fills in the exact p50/p95/p99.
+    """
+    if stations is not None:
+        stations = _station_names(stations)
+    options = EngineOptions(workers=workers, stations=stations, **options)
+    result = run(engine, path, options)
+    if options.percentiles:
+        percentiles = [tuple(value / 10 for value in values) for values in result.percentiles()]
+    else:
+        percentiles = [()] * len(result)
+    return {
+        name.decode("utf-8"): StationStats(low / 10, total / (10 * count), high / 10, count, *station_percentiles)
+        for (name, (low, high, total, count)), station_percentiles in sorted(zip(result.items(), percentiles))
+        if count
+    }
@@ -0,0 +1,337 @@
+"""Benchmark runner: repeated timed runs of the engines, JSON results and a regression check against a baseline"""
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import platform
+import statistics
+import subprocess
+
+from onebrc.cpus import available_cpus
+from onebrc.engines import ENGINES
+
+
+# The engines are top level scripts next to the onebrc package
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Engines that do not read the text measurements file, only run when they are named
+NON_TEXT_ENGINES = ("binary",)
+# Engines that split the file into one chunk per available CPU unless work units are asked for
+CAPPING_ENGINES = ("python", "mmap", "pypy", "numpy", "threads", "binary")
+
+
+def default_engines() -> list:
+    """Every engine reading the text format, the engines run when none are named"""
+    return [engine for engine in ENGINES if engine not in NON_TEXT_ENGINES]
+
+
+def count_rows(file_name: str, blocksize: int = 16 * 1024 * 1024) -> int:
+    """Count the lines of a file (a last line without newline counts too)"""
+    rows = 0
+    last = b"\n"
+    with open(file_name, mode="rb") as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            rows += block.count(b"\n")
+            last = block[-1:]
+    return rows + (last != b"\n")
+
+
+def can_drop_file_cache() -> bool:
+    """os.posix_fadvise is missing on macOS and Windows"""
+    return hasattr(os, "posix_fadvise")
+
+
+def drop_file_cache(file_name: str) -> None:
+    """Ask the kernel to evict the file from the page cache, so the next run reads it from disk"""
+    if not can_drop_file_cache():
+        raise ValueError("evicting the file from the page cache needs os.posix_fadvise (Linux)")
+    with open(file_name, mode="rb") as f:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def parse_engine(spec: str) -> tuple[str, list]:
+    """Split an ENGINE[:INTERPRETER] spec, e.g. "pypy:pypy3" runs the pypy engine under pypy3"""
+    engine, _, interpreter = spec.partition(":")
+    if engine not in ENGINES:
+        raise argparse.ArgumentTypeError(f"unknown engine '{engine}', choose from {', '.join(ENGINES)}")
+    return engine, shlex.split(interpreter) if interpreter else [sys.executable]
+
+
+def parse_sweep(value: str) -> list:
+    """Split comma separated worker counts, each at least 1"""
+    try:
+        sweep = [int(workers) for workers in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid worker counts: '{value}'")
+    if min(sweep) < 1:
+        raise argparse.ArgumentTypeError("worker counts must be at least 1")
+    return sweep
+
+
+def caps_workers(engine: str, file_name: str, engine_args: list = ()) -> bool:
+    """Whether the engine never starts more than available_cpus() workers, whatever --workers asks
+
+    The one chunk per CPU split (get_file_chunks) caps them, the binary engine always splits that
+    way. Work units, incremental runs and compressed files start --workers workers, so do the
+    inputbuffer pool and the Polars and DuckDB thread pools.
+    """
+    from onebrc.compressed import is_streamed
+
+    if engine not in CAPPING_ENGINES or is_streamed(file_name):
+        return False
+    if engine == "binary":
+        return True
+    return not any(arg.startswith(("-u", "--unit-size", "--incremental", "--index")) for arg in engine_args)
+
+
+def check_sweep(specs: list, file_name: str, engine_args: list, sweep: list) -> None:
+    """Raise ValueError for sweep worker counts an engine would cap at available_cpus()
+
+    Such a run would repeat the capped one under a wrong "ENGINE -w N" label.
+    """
+    cpus = available_cpus()
+    for spec in specs:
+        engine, _ = parse_engine(spec)
+        if caps_workers(engine, file_name, engine_args) and max(sweep) > cpus:
+            raise ValueError(
+                f"the {engine} engine runs at most the {cpus} available CPUs as workers, "
+                f"sweep worker count {max(sweep)} would repeat that run"
+            )
+
+
+def run_once(command: list) -> tuple[dict, bytes]:
+    """Run a command, returning its wall/user/sys time, peak RSS and stdout"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (PROJECT_DIR, env.get("PYTHONPATH"))))
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, env=env)
+    output = process.stdout.read()
+    process.stdout.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; the child's rusage
+    # includes its worker processes once they have been waited for
+    maxrss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return (
+        {
+            "wall": wall,
+            "user": usage.ru_utime,
+            "sys": usage.ru_stime,
+            "max_rss": maxrss,
+        },
+        output,
+    )
+
+
+def benchmark(
+    specs: list,
+    file_name: str,
+    runs: int = 3,
+    warmup: int = 1,
+    cold: bool = False,
+    engine_args: list = (),
+    sweep: list = None,
+) -> dict:
+    """Run every engine spec warmup + runs times and summarize the timed runs
+
+    With sweep (a list of worker counts) every engine runs once per worker count, the results are
+    keyed "ENGINE -w N" and give the scaling curve of each engine. An engine that fails (or whose
+    interpreter is missing) gets an "error" entry instead of timings, the other engines still run.
+    """
+    if cold and not can_drop_file_cache():
+        raise ValueError("--cold needs os.posix_fadvise to evict the file from the page cache (Linux)")
+    if sweep:
+        check_sweep(specs, file_name, engine_args, sweep)
+    size = os.path.getsize(file_name)
+    rows = count_rows(file_name)
+    results = dict()
+    reference = None
+
+    runs_specs = [(spec, spec, []) for spec in specs]
+    if sweep:
+        runs_specs = [(f"{spec} -w {workers}", spec, ["--workers", str(workers)]) for spec in specs for workers in sweep]
+
+    for key, spec, workers_args in runs_specs:
+        engine, interpreter = parse_engine(spec)
+        command = interpreter + ["-m", "onebrc", "--engine", engine, "--file", file_name, *engine_args, *workers_args]
+
+        timings = list()
+        try:
+            for run in range(warmup + runs):
+                if cold:
+                    drop_file_cache(file_name)
+                timing, output = run_once(command)
+                if run >= warmup:
+                    timings.append(timing)
+        except (subprocess.CalledProcessError, OSError) as e:
+            results[key] = {"command": command, "error": str(e)}
+            continue
+
+        if reference is None:
+            reference = output
+        wall = statistics.median(timing["wall"] for timing in timings)
+        results[key] = {
+            "command": command,
+            "runs": timings,
+            "wall": wall,
+            "user": statistics.median(timing["user"] for timing in timings),
+            "sys": statistics.median(timing["sys"] for timing in timings),
+            "max_rss": max(timing["max_rss"] for timing in timings),
+            "rows_per_s": rows / wall,
+            "mb_per_s": size / 1024 / 1024 / wall,
+            "output_matches": output == reference,
+        }
+
+    return {
+        "file": os.path.abspath(file_name),
+        "size": size,
+        "rows": rows,
+        "runs": runs,
+        "warmup": warmup,
+        "cold": cold,
+        "engine_args": list(engine_args),
+        "sweep": sweep,
+        "host": {
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "available_cpus": available_cpus(),
+            "python": sys.version.split()[0],
+        },
+        "results": results,
+    }
+
+
+def check_regressions(report: dict, baseline: dict, tolerance: float = 0.05) -> list:
+    """Return a message for every engine whose median wall time is slower than the baseline by more than tolerance"""
+    regressions = list()
+    for spec, result in report["results"].items():
+        previous = baseline.get("results", dict()).get(spec)
+        if previous is None or "error" in previous:
+            continue
+        if "error" in result:
+            regressions.append(f"{spec}: failed ({result['error']}), {previous['wall']:.3f}s baseline")
+        elif result["wall"] > previous["wall"] * (1 + tolerance):
+            regressions.append(
+                f"{spec}: {result['wall']:.3f}s vs {previous['wall']:.3f}s baseline ({result['wall'] / previous['wall'] - 1:+.1%})"
+            )
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    """Format a benchmark report as a table, like the one in the README"""
+    lines = ["| Engine | wall | user | system | max RSS (MB) | rows/s | MB/s | output |"]
+    lines.append("| ------ | ---- | ---- | ------ | ------------ | ------ | ---- | ------ |")
+    for spec, result in report["results"].items():
+        if "error" in result:
+            lines.append(f"| {spec} | - | - | - | - | - | - | FAILED: {result['error']} |")
+            continue
+        lines.append(
+            f"| {spec} | {result['wall']:.3f} | {result['user']:.2f} | {result['sys']:.2f} | "
+            f"{result['max_rss'] / 1024 / 1024:.0f} | {result['rows_per_s']:,.0f} | {result['mb_per_s']:.1f} | "
+            f"{'same' if result['output_matches'] else 'DIFFERENT'} |"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m onebrc.bench",
+        description="Benchmark the engines and check for regressions",
+    )
+    parser.add_argument(
+        "engines",
+        nargs="*",
+        help="ENGINE[:INTERPRETER] to run, e.g. pypy:pypy3 (default is every text format engine with this interpreter)",
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        dest="file",
+        type=str,
+        help='Measurement file name (default is "measurements.txt")',
+        default="measurements.txt",
+    )
+    parser.add_argument("-r", "--runs", dest="runs", type=int, help="Timed runs per engine (default is 3)", default=3)
+    parser.add_argument("--warmup", dest="warmup", type=int, help="Untimed runs per engine (default is 1)", default=1)
+    parser.add_argument(
+        "--cold",
+        dest="cold",
+        action="store_true",
+        help="Evict the file from the page cache before every run",
+    )
+    parser.add_argument(
+        "--engine-args",
+        dest="engine_args",
+        type=shlex.split,
+        help='Extra arguments for python -m onebrc, e.g. "--workers 8 --block-size 4194304"',
+        default=[],
+    )
+    parser.add_argument(
+        "--sweep",
+        dest="sweep",
+        type=parse_sweep,
+        help="Comma separated worker counts to run every engine with, e.g. 1,2,4,8 for a scaling curve",
+    )
+    parser.add_argument("-o", "--output", dest="output", type=str, help="Write the JSON results to this file")
+    parser.add_argument("--baseline", dest="baseline", type=str, help="JSON results of a previous run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        dest="tolerance",
+        type=float,
+        help="Allowed slowdown against the baseline before failing (default is 0.05)",
+        default=0.05,
+    )
+    args = parser.parse_args(argv)
+
+    specs = args.engines or default_engines()
+    for spec in specs:
+        try:
+            parse_engine(spec)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
+    if args.cold and not can_drop_file_cache():
+        parser.error("--cold needs os.posix_fadvise to evict the file from the page cache, it is only available on Linux")
+
+    if args.sweep:
+        try:
+            check_sweep(specs, args.file, args.engine_args, args.sweep)
+        except ValueError as e:
+            parser.error(str(e))
+
+    report = benchmark(specs, args.file, args.runs, args.warmup, args.cold, args.engine_args, args.sweep)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, mode="w") as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    failed = [spec for spec, result in report["results"].items() if "error" in result]
+    if failed:
+        print(f"Engines failed: {', '.join(failed)}", file=sys.stderr)
+        status = 1
+    if not all(result.get("output_matches", True) for result in report["results"].values()):
+        print("Engines produced different output", file=sys.stderr)
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression {regression}", file=sys.stderr)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
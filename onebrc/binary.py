@@ -0,0 +1,149 @@
+"""Binary columnar measurements: a station dictionary header, then row groups of uint16 ids and int16 tenths
+
+    header     MAGIC, station count (uint32), per station its UTF-8 name length (uint16) and name,
+               zero padded to a multiple of 8 bytes
+    row group  row count (uint64), row count station ids (uint16), row count temperatures in tenths (int16)
+
+All numbers are little endian, row groups follow each other up to the end of the file. A row is 4
+bytes instead of about 14 as text, and is reduced without scanning for delimiters or parsing numbers.
+"""
+import os
+import struct
+import shutil
+import argparse
+
+import numpy as np
+
+
+MAGIC = b"1BRCCOL1"
+BINARY_SUFFIX = ".1brc"
+MAX_STATIONS = 1 << 16  # ids are uint16
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024  # text bytes per row group written by convert
+
+_COUNT = struct.Struct("<I")
+_NAME_LENGTH = struct.Struct("<H")
+_ROWS = struct.Struct("<Q")
+
+
+def pack_header(names: list) -> bytes:
+    """Header for a file of the given stations, a row with id i is a measurement of names[i]"""
+    if len(names) > MAX_STATIONS:
+        raise ValueError(f"{len(names)} stations do not fit in uint16 ids")
+    parts = [MAGIC, _COUNT.pack(len(names))]
+    for name in names:
+        parts.append(_NAME_LENGTH.pack(len(name)))
+        parts.append(name)
+    header = b"".join(parts)
+    return header + bytes(-len(header) % 8)
+
+
+def read_header(file_name: str) -> tuple[list, int]:
+    """Station names of a binary file and the offset of its first row group"""
+    with open(file_name, mode="rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_name} is not a binary measurements file")
+        (count,) = _COUNT.unpack(f.read(_COUNT.size))
+        names = list()
+        for _ in range(count):
+            (length,) = _NAME_LENGTH.unpack(f.read(_NAME_LENGTH.size))
+            names.append(f.read(length))
+        offset = f.tell()
+    return names, offset + (-offset % 8)
+
+
+def write_group(f, ids, tenths) -> None:
+    """Append a row group, ids and tenths are equally long integer sequences"""
+    ids = np.asarray(ids, dtype="<u2")
+    tenths = np.asarray(tenths, dtype="<i2")
+    f.write(_ROWS.pack(len(ids)))
+    f.write(np.ascontiguousarray(ids).tobytes())
+    f.write(np.ascontiguousarray(tenths).tobytes())
+
+
+def row_groups(file_name: str) -> list[tuple[int, int]]:
+    """(start, end) byte offsets of every row group"""
+    _, position = read_header(file_name)
+    groups = list()
+    with open(file_name, mode="rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        while position < size:
+            f.seek(position)
+            (rows,) = _ROWS.unpack(f.read(_ROWS.size))
+            end = position + _ROWS.size + 4 * rows
+            if end > size:
+                raise ValueError(f"{file_name} is truncated")
+            groups.append((position, end))
+            position = end
+    return groups
+
+
+def group_columns(buffer, position: int) -> tuple:
+    """(ids, tenths, end) of the row group at position, as NumPy views of buffer"""
+    (rows,) = _ROWS.unpack_from(buffer, position)
+    position += _ROWS.size
+    ids = np.frombuffer(buffer, dtype="<u2", count=rows, offset=position)
+    tenths = np.frombuffer(buffer, dtype="<i2", count=rows, offset=position + 2 * rows)
+    return ids, tenths, position + 4 * rows
+
+
+def convert(source: str, destination: str, block_size: int = DEFAULT_BLOCK_SIZE) -> None:
+    """Convert a text measurements file (also compressed, or - for stdin) to the binary format
+
+    Every block of text becomes a row group. The dictionary is only complete at the end, so the row
+    groups go to a temporary file first and are copied behind the header.
+    """
+    from calculateAverageNumpy import _parse_block
+    from onebrc.compressed import open_input
+
+    station_ids = dict()
+    body = f"{destination}.{os.getpid()}.tmp"
+    try:
+        with open_input(source) as f, open(body, mode="wb") as out:
+            tail = b""
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                data = tail + data
+                size = data.rfind(b"\n") + 1
+                tail = data[size:]
+                if size:
+                    write_group(out, *_parse_block(np.frombuffer(data, dtype=np.uint8, count=size), station_ids))
+            if tail:
+                # last line of the file has no trailing newline
+                tail += b"\n"
+                write_group(out, *_parse_block(np.frombuffer(tail, dtype=np.uint8), station_ids))
+
+        header = pack_header(list(station_ids))
+        with open(body, mode="rb") as f, open(destination, mode="wb") as out:
+            out.write(header)
+            shutil.copyfileobj(f, out, 1024 * 1024)
+    finally:
+        if os.path.exists(body):
+            os.remove(body)
+
+
+def main(argv: list = None) -> None:
+    from onebrc.__main__ import positive_int
+
+    parser = argparse.ArgumentParser(
+        prog="python -m onebrc.binary",
+        description="Convert a text measurements file to the binary columnar format",
+    )
+    parser.add_argument("source", type=str, help="Measurements file (.gz/.bz2/.xz are decompressed), - for stdin")
+    parser.add_argument("destination", type=str, help="Binary file to write, e.g. measurements.1brc")
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        dest="block_size",
+        type=positive_int,
+        help="Text bytes per row group (default is 16 MB)",
+        default=DEFAULT_BLOCK_SIZE,
+    )
+    args = parser.parse_args(argv)
+
+    convert(args.source, args.destination, args.block_size)
+
+
+if __name__ == "__main__":
+    main()
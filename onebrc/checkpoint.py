@@ -0,0 +1,86 @@
+"""Per work unit checkpoints, so a run that was killed part way resumes with only the missing units"""
+import os
+import json
+
+from onebrc.stations import StationTable
+
+
+MANIFEST = "manifest.json"
+SUFFIX = ".part"
+
+
+class Checkpoint:
+    """A directory with one serialized StationTable per completed (file_name, unit_start, unit_end) unit
+
+    The manifest records the identity of the input file, the station filter and the table class of
+    the run, the partials are dropped when any of them changed. Instances are pickled to the workers,
+    which save their own units.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        file_name: str,
+        stations: frozenset = None,
+        table_class: type = StationTable,
+    ):
+        self.directory = directory
+        self.table_class = table_class
+        stat = os.stat(file_name)
+        self.identity = {
+            "file": os.path.abspath(file_name),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "stations": None if stations is None else sorted(name.hex() for name in stations),
+            "table": table_class.__name__,
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        manifest = os.path.join(directory, MANIFEST)
+        try:
+            with open(manifest) as f:
+                valid = json.load(f) == self.identity
+        except (OSError, ValueError):
+            valid = False
+        if not valid:
+            self.clear()
+            self._write(MANIFEST, json.dumps(self.identity).encode())
+
+    def _path(self, unit: tuple) -> str:
+        _, unit_start, unit_end = unit
+        return os.path.join(self.directory, f"{unit_start:016x}-{unit_end:016x}{SUFFIX}")
+
+    def _write(self, name: str, data: bytes) -> None:
+        # Write then rename, a worker killed mid-write leaves no truncated partial behind
+        path = os.path.join(self.directory, name)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, mode="wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    def save(self, unit: tuple, table: StationTable) -> None:
+        """Persist the partial aggregate of a completed unit"""
+        self._write(os.path.basename(self._path(unit)), table.to_bytes())
+
+    def restore(self, units: list) -> tuple[StationTable, list]:
+        """Merge the saved partials of units, returning that table and the units still to process
+
+        Only exact unit matches are used, partials of a run with other unit boundaries are ignored.
+        """
+        result = self.table_class()
+        missing = list()
+        for unit in units:
+            try:
+                with open(self._path(unit), mode="rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                missing.append(unit)
+                continue
+            result.merge(self.table_class.from_bytes(data)[0])
+        return result, missing
+
+    def clear(self) -> None:
+        """Remove the partials and the manifest"""
+        for name in os.listdir(self.directory):
+            if name == MANIFEST or name.endswith((SUFFIX, ".tmp")):
+                os.remove(os.path.join(self.directory, name))
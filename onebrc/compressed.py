@@ -0,0 +1,257 @@
+"""Compressed (.gz/.bz2/.xz) and piped (-) measurement files, which can not be split by seeking into them
+
+BGZF files (gzip files made of independent members with their compressed size in the header, as
+written by bgzip or write_bgzf) are decompressed in parallel, a group of members per unit. Other
+inputs are read by one decompressor thread that feeds parser processes through a bounded queue.
+"""
+import os
+import bz2
+import sys
+import gzip
+import lzma
+import zlib
+import queue
+import struct
+import argparse
+import threading
+import traceback
+import contextlib
+import multiprocessing as mp
+
+from onebrc.stations import StationTable
+
+
+OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+STDIN = "-"
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024  # decompressed bytes per queued block
+DEFAULT_UNIT_SIZE = 4 * 1024 * 1024  # compressed bytes per parallel BGZF unit
+BGZF_BLOCK_SIZE = 0xFF00  # uncompressed bytes per member written by write_bgzf, as bgzip does
+
+# gzip header with FEXTRA: magic, CM, FLG, MTIME, XFL, OS, XLEN, then the BC subfield
+_BGZF_HEADER = struct.Struct("<4sIBBHBBHH")
+_BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+
+
+def is_streamed(file_name: str) -> bool:
+    """True for inputs that have to be read front to back"""
+    return file_name == STDIN or os.path.splitext(file_name)[1] in OPENERS
+
+
+def open_input(file_name: str):
+    """Open a measurements file for reading decompressed bytes, - is stdin"""
+    if file_name == STDIN:
+        return contextlib.nullcontext(sys.stdin.buffer)
+    opener = OPENERS.get(os.path.splitext(file_name)[1], open)
+    return opener(file_name, mode="rb")
+
+
+def bgzf_members(file_name: str) -> list[tuple[int, int]]:
+    """(start, end) of every member of a BGZF file, None when the file is not BGZF"""
+    members = list()
+    with open(file_name, mode="rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        position = 0
+        while position < size:
+            f.seek(position)
+            header = f.read(_BGZF_HEADER.size)
+            if len(header) < _BGZF_HEADER.size:
+                return None
+            magic, _, _, _, extra_size, subfield_1, subfield_2, _, block_size = _BGZF_HEADER.unpack(header)
+            if magic != _BGZF_MAGIC or extra_size < 6 or (subfield_1, subfield_2) != (ord("B"), ord("C")):
+                return None
+            members.append((position, position + block_size + 1))
+            position += block_size + 1
+    return members
+
+
+def write_bgzf(source, destination, level: int = 6) -> None:
+    """Compress a binary stream to a BGZF file, which gzip and zcat still read as a regular gzip file"""
+    while True:
+        data = source.read(BGZF_BLOCK_SIZE)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        destination.write(_BGZF_HEADER.pack(_BGZF_MAGIC, 0, 0, 255, 6, ord("B"), ord("C"), 2, len(deflated) + 25))
+        destination.write(deflated)
+        destination.write(struct.pack("<II", zlib.crc32(data), len(data)))
+        if not data:
+            break  # the empty member is the BGZF end of file marker
+
+
+def _process_bgzf_unit(
+    file_name: str,
+    unit_start: int,
+    unit_end: int,
+    stations: frozenset = None,
+) -> tuple:
+    """Decompress and aggregate a group of members, returning the partial lines at both ends for the parent
+
+    Returns (head, tail, table): head is everything up to the first newline (None when the unit has
+    no newline at all) and tail everything after the last one.
+    """
+    from calculateAverage import _process_buffer
+
+    with open(file_name, mode="rb") as f:
+        f.seek(unit_start)
+        data = gzip.decompress(f.read(unit_end - unit_start))
+    result = StationTable()
+    first = data.find(b"\n")
+    if first == -1:
+        return None, data, result
+    last = data.rfind(b"\n")
+    _process_buffer(data, first + 1, last + 1, result, stations)
+    return data[: first + 1], data[last + 1 :], result
+
+
+def _aggregate_bgzf(
+    file_name: str,
+    members: list,
+    workers: int,
+    unit_size: int,
+    stations: frozenset,
+) -> StationTable:
+    from calculateAverage import _process_buffer
+
+    units = list()
+    unit_start = 0
+    for _, member_end in members:
+        if member_end - unit_start >= unit_size or member_end == members[-1][1]:
+            units.append((file_name, unit_start, member_end, stations))
+            unit_start = member_end
+
+    result = StationTable()
+    lines = list()
+    carry = b""
+    with mp.get_context().Pool(workers) as pool:
+        # Ordered, so the partial lines at the unit boundaries can be stitched back together
+        for head, tail, table in pool.starmap(_process_bgzf_unit, units):
+            result.merge(table)
+            if head is None:
+                carry += tail
+                continue
+            lines.append(carry + head)
+            carry = tail
+    lines.append(carry)
+    stitched = b"".join(lines)
+    return _process_buffer(stitched, 0, len(stitched), result, stations)
+
+
+def _parse_blocks(blocks, results, stations: frozenset) -> None:
+    """Parser process: aggregate newline aligned blocks until the None sentinel"""
+    from calculateAverage import _process_buffer
+
+    result = StationTable()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            _process_buffer(block, 0, len(block), result, stations)
+    except BaseException:
+        results.put(("error", traceback.format_exc()))
+        raise
+    results.put(("done", result))
+
+
+def _aggregate_pipeline(
+    file_name: str,
+    workers: int,
+    block_size: int,
+    stations: frozenset,
+) -> StationTable:
+    ctx = mp.get_context()
+    blocks = ctx.Queue(maxsize=2 * workers)  # bounded, the decompressor waits for slow parsers
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_parse_blocks, args=(blocks, results, stations), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    failure = list()
+
+    def decompress() -> None:
+        try:
+            with open_input(file_name) as f:
+                tail = b""
+                while True:
+                    data = f.read(block_size)
+                    if not data:
+                        break
+                    data = tail + data
+                    size = data.rfind(b"\n") + 1
+                    tail = data[size:]
+                    if size:
+                        blocks.put(data[:size])
+                if tail:
+                    blocks.put(tail)  # last line of the file has no trailing newline
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            for _ in processes:
+                blocks.put(None)
+
+    decompressor = threading.Thread(target=decompress, daemon=True)
+    decompressor.start()
+
+    result = StationTable()
+    try:
+        done = 0
+        while done < workers:
+            try:
+                message = results.get(timeout=1)
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise RuntimeError("a parser process died before finishing its blocks")
+                continue
+            if message[0] == "error":
+                raise RuntimeError(f"a parser process failed:\n{message[1]}")
+            result.merge(message[1])
+            done += 1
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    decompressor.join()
+    if failure:
+        raise failure[0]
+    return result
+
+
+def aggregate_stream(
+    file_name: str,
+    workers: int,
+    block_size: int = None,
+    unit_size: int = None,
+    stations: frozenset = None,
+) -> StationTable:
+    """Aggregate a compressed file or stdin, in parallel when it is BGZF"""
+    if file_name.endswith(".gz"):
+        members = bgzf_members(file_name)
+        if members:
+            return _aggregate_bgzf(file_name, members, workers, unit_size or DEFAULT_UNIT_SIZE, stations)
+    return _aggregate_pipeline(file_name, workers, block_size or DEFAULT_BLOCK_SIZE, stations)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m onebrc.compressed",
+        description="Compress a measurements file to BGZF, so it can be decompressed in parallel",
+    )
+    parser.add_argument("source", type=str, help="Measurements file, - for stdin")
+    parser.add_argument("destination", type=str, help="BGZF file to write, e.g. measurements.txt.gz")
+    parser.add_argument("-l", "--level", dest="level", type=int, help="Compression level (default is 6)", default=6)
+    args = parser.parse_args(argv)
+
+    with open_input(args.source) as source, open(args.destination, mode="wb") as destination:
+        write_bgzf(source, destination, args.level)
+
+
+if __name__ == "__main__":
+    main()
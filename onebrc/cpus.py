@@ -0,0 +1,96 @@
+"""How many CPUs this process may really use: its affinity mask and its cgroup CPU quota
+
+os.cpu_count() counts the CPUs of the host. In a container limited to 2 CPUs on a 64 core host that
+starts 64 workers, which the CFS quota then throttles, and a taskset/cpuset restriction is ignored
+as well. available_cpus() is the default worker count of every engine.
+"""
+import os
+import math
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PROC_CGROUP = "/proc/self/cgroup"
+
+
+def affinity_cpus() -> list[int]:
+    """CPUs this process may run on, from its affinity mask where the platform has one"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_paths(proc_cgroup: str) -> dict:
+    """Controllers to the cgroup of this process, "" is the cgroup v2 hierarchy"""
+    paths = dict()
+    for line in (_read(proc_cgroup) or "").splitlines():
+        _, controllers, path = line.split(":", 2)
+        for controller in controllers.split(","):
+            paths[controller] = path
+    return paths
+
+
+def _ancestors(directory: str, path: str) -> list[str]:
+    """directory/path and its parents up to directory, a quota of any of them applies"""
+    directories = list()
+    parts = [part for part in path.split("/") if part]
+    for end in range(len(parts), -1, -1):
+        directories.append(os.path.join(directory, *parts[:end]))
+    return directories
+
+
+def cgroup_cpu_limit(root: str = CGROUP_ROOT, proc_cgroup: str = PROC_CGROUP) -> float:
+    """CPUs allowed by the cgroup CPU quota (quota / period), None without a quota
+
+    cgroup v2 reads cpu.max ("max 100000" or "200000 100000"), cgroup v1 cpu.cfs_quota_us (-1 is no
+    quota) and cpu.cfs_period_us. The smallest quota of the cgroup and its ancestors wins. Inside a
+    container the cgroup of /proc/self/cgroup may not be visible, the mounted root is tried as well.
+    """
+    paths = _cgroup_paths(proc_cgroup)
+    limits = list()
+
+    candidates = _ancestors(root, paths.get("", "/"))
+    if os.path.exists(os.path.join(root, "cgroup.controllers")):
+        for directory in candidates:
+            fields = (_read(os.path.join(directory, "cpu.max")) or "max").split()
+            if fields[0] != "max":
+                limits.append(int(fields[0]) / int(fields[1]))
+    else:
+        for mount in ("cpu", "cpu,cpuacct", "cpuacct,cpu"):
+            directory = os.path.join(root, mount)
+            if not os.path.isdir(directory):
+                continue
+            for candidate in _ancestors(directory, paths.get("cpu", "/")):
+                quota = _read(os.path.join(candidate, "cpu.cfs_quota_us"))
+                period = _read(os.path.join(candidate, "cpu.cfs_period_us"))
+                if quota is not None and period is not None and int(quota) > 0:
+                    limits.append(int(quota) / int(period))
+            break
+    return min(limits, default=None)
+
+
+def available_cpus(root: str = CGROUP_ROOT, proc_cgroup: str = PROC_CGROUP) -> int:
+    """Number of CPUs this process can keep busy: its affinity mask, capped by the cgroup quota rounded up"""
+    cpus = len(affinity_cpus())
+    limit = cgroup_cpu_limit(root, proc_cgroup)
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(cpus, 1)
+
+
+def worker_cpus(workers: int) -> list[int]:
+    """The CPU to pin each of workers workers to, round robin over the affinity mask"""
+    cpus = affinity_cpus()
+    return [cpus[slot % len(cpus)] for slot in range(workers)]
+
+
+def pin(cpu: int) -> None:
+    """Restrict this process to one CPU"""
+    os.sched_setaffinity(0, {cpu})
@@ -0,0 +1,381 @@
+"""Engine registry: one run(file_name, options) interface over every calculateAverage*.py script"""
+import os
+import sys
+from dataclasses import dataclass, replace
+from functools import partial
+
+from onebrc import progress as _progress
+from onebrc.cpus import available_cpus
+from onebrc.phases import current
+from onebrc.stations import StationTable
+
+
+@dataclass
+class EngineOptions:
+    """Tuning parameters, None keeps each script's own default"""
+
+    workers: int = None
+    block_size: int = None  # read size for the block based engines
+    unit_size: int = None  # work unit size for the chunk engines, instead of one chunk per worker
+    shared_memory: bool = False
+    schedule_report: bool = False
+    incremental: bool = False  # only aggregate what was appended since the last incremental run
+    state_file: str = None  # sidecar file for incremental runs, default is FILE.1brc-state
+    checkpoint_dir: str = None  # save each completed work unit here, a rerun resumes from them
+    index: bool = False  # answer from the block index summaries when it is up to date
+    index_file: str = None  # default is FILE.1brc-index
+    stations: frozenset = None  # only aggregate these station names (bytes), pushed down into the workers
+    percentiles: bool = False  # also count every temperature per station, returns a HistogramTable
+    prefetch: bool = False  # pypy engine: read the next blocks in a background thread
+    pin: bool = False  # restrict every worker process to one CPU of the affinity mask
+    io: str = None  # pypy and numpy engines: onebrc.blockio strategy reading the blocks
+    units: list = None  # scan these work units instead of splitting the whole file, e.g. BlockIndex.units()
+
+
+ENGINES = dict()
+
+
+def register(name: str):
+    """Add an engine to the registry"""
+
+    def decorator(engine):
+        ENGINES[name] = engine
+        return engine
+
+    return decorator
+
+
+def run(engine: str, file_name: str, options: EngineOptions = None) -> StationTable:
+    """Run an engine by name"""
+    try:
+        engine = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"unknown engine '{engine}', choose from {', '.join(ENGINES)}") from None
+    options = options or EngineOptions()
+
+    if options.index and not options.incremental:
+        from onebrc.index import load_index
+
+        index = load_index(file_name, options.index_file)
+        if index is None:
+            print(f"No up to date index for {file_name}, scanning it", file=sys.stderr)
+        elif not options.percentiles:
+            return index.query(options.stations)
+        else:
+            # The summaries have no histograms, only scan the blocks holding the stations
+            options = replace(options, units=index.units(options.stations))
+    return engine(file_name, options)
+
+
+def _checkpoint(file_name: str, options: EngineOptions):
+    if options.checkpoint_dir is None:
+        return None
+    from onebrc.checkpoint import Checkpoint
+
+    return Checkpoint(options.checkpoint_dir, file_name, options.stations, _table_class(options))
+
+
+def _table_class(options: EngineOptions) -> type:
+    if options.percentiles:
+        from onebrc.histogram import HistogramTable
+
+        return HistogramTable
+    return StationTable
+
+
+def _run_chunks(
+    module,
+    processor,
+    file_name: str,
+    options: EngineOptions,
+) -> StationTable:
+    """Shared driver for the get_file_chunks/_process_file_chunk engines"""
+    from onebrc.compressed import is_streamed
+    from onebrc.scheduler import format_schedule_report, get_work_units, run_work_units
+
+    if is_streamed(file_name):
+        return _run_streamed(file_name, options)
+    if options.incremental:
+        return _run_incremental(processor, file_name, options)
+    if options.stations is not None:
+        processor = partial(processor, stations=options.stations)
+
+    with current().phase("chunks"):
+        if options.units is not None:
+            workers = options.workers or available_cpus()
+            units = options.units
+        elif options.unit_size:
+            workers = options.workers or available_cpus()
+            units = get_work_units(file_name, options.unit_size)
+        elif options.workers:
+            workers, units = module.get_file_chunks(file_name, max_cpu=options.workers)
+        else:
+            workers, units = module.get_file_chunks(file_name)
+
+    result, report = run_work_units(
+        processor,
+        units,
+        workers,
+        shared_memory=options.shared_memory,
+        checkpoint=_checkpoint(file_name, options),
+        table_class=_table_class(options),
+        pin=options.pin,
+    )
+    if options.schedule_report:
+        print(format_schedule_report(report), file=sys.stderr)
+    return result
+
+
+def _run_incremental(
+    processor,
+    file_name: str,
+    options: EngineOptions,
+) -> StationTable:
+    """Aggregate the complete lines appended since the saved state, then fold them into it
+
+    The state covers every station, a station filter is only applied to the returned table.
+    """
+    from onebrc.incremental import complete_lines_end, load_state, save_state
+    from onebrc.scheduler import format_schedule_report, get_work_units, run_work_units
+
+    if options.percentiles:
+        raise ValueError("incremental runs do not keep the percentile histograms")
+    offset, result = load_state(file_name, options.state_file)
+    end = complete_lines_end(file_name)
+    workers = options.workers or available_cpus()
+
+    if end > offset:
+        unit_size = options.unit_size or -(-(end - offset) // workers)
+        with current().phase("chunks"):
+            units = get_work_units(file_name, unit_size, start=offset, end=end)
+        appended, report = run_work_units(
+            processor,
+            units,
+            workers,
+            shared_memory=options.shared_memory,
+            checkpoint=_checkpoint(file_name, options),
+            pin=options.pin,
+        )
+        if options.schedule_report:
+            print(format_schedule_report(report), file=sys.stderr)
+        result.merge(appended)
+        save_state(file_name, end, result, options.state_file)
+    if options.stations is not None:
+        return result.select(options.stations)
+    return result
+
+
+def _percentiles_unsupported(name: str, options: EngineOptions) -> None:
+    if options.percentiles:
+        raise ValueError(f"the {name} engine does not support percentiles, use the python, numpy or binary engine")
+
+
+def _io_unsupported(name: str, options: EngineOptions) -> None:
+    if options.io is not None:
+        raise ValueError(f"the {name} engine does not take an I/O strategy, use the pypy or numpy engine")
+
+
+def _prefetch_unsupported(name: str, options: EngineOptions) -> None:
+    if options.prefetch:
+        raise ValueError(f"the {name} engine does not prefetch, use the pypy engine")
+
+
+def _run_streamed(file_name: str, options: EngineOptions) -> StationTable:
+    """Compressed files and stdin are parsed by calculateAverage._process_buffer whatever the chunk engine"""
+    from onebrc.compressed import aggregate_stream
+
+    for option in ("incremental", "checkpoint_dir", "percentiles", "shared_memory", "pin", "io", "prefetch", "units"):
+        if getattr(options, option):
+            raise ValueError(f"{option} is not supported for compressed files and stdin")
+    return aggregate_stream(
+        file_name,
+        options.workers or available_cpus(),
+        options.block_size,
+        options.unit_size,
+        options.stations,
+    )
+
+
+def _chunk_engines_only(name: str, file_name: str, options: EngineOptions) -> None:
+    from onebrc.compressed import is_streamed
+
+    _percentiles_unsupported(name, options)
+    _io_unsupported(name, options)
+    _prefetch_unsupported(name, options)
+    if is_streamed(file_name):
+        raise ValueError(f"the {name} engine does not support compressed files and stdin")
+    if options.incremental:
+        raise ValueError(f"the {name} engine does not support incremental runs")
+    if options.checkpoint_dir is not None:
+        raise ValueError(f"the {name} engine does not support checkpoints")
+    if options.pin:
+        raise ValueError(f"the {name} engine does not pin its workers")
+    if options.units is not None:
+        raise ValueError(f"the {name} engine does not scan work units")
+
+
+@register("python")
+def _python(file_name: str, options: EngineOptions) -> StationTable:
+    _io_unsupported("python", options)
+    _prefetch_unsupported("python", options)
+    import calculateAverage
+
+    processor = calculateAverage._process_file_chunk
+    if options.percentiles:
+        processor = calculateAverage._process_file_chunk_histogram
+    return _run_chunks(calculateAverage, processor, file_name, options)
+
+
+@register("mmap")
+def _mmap(file_name: str, options: EngineOptions) -> StationTable:
+    _percentiles_unsupported("mmap", options)
+    _io_unsupported("mmap", options)
+    _prefetch_unsupported("mmap", options)
+    import calculateAverage
+
+    return _run_chunks(calculateAverage, calculateAverage._process_file_chunk_mmap, file_name, options)
+
+
+@register("pypy")
+def _pypy(file_name: str, options: EngineOptions) -> StationTable:
+    _percentiles_unsupported("pypy", options)
+    import calculateAveragePypy
+
+    processor = calculateAveragePypy._process_file_chunk
+    if options.prefetch:
+        if options.io is not None:
+            raise ValueError("--prefetch reads with its own thread, it does not take an I/O strategy")
+        processor = calculateAveragePypy._process_file_chunk_prefetch
+    elif options.io is not None:
+        processor = partial(processor, io=options.io)
+    if options.block_size:
+        processor = partial(processor, blocksize=options.block_size)
+    return _run_chunks(calculateAveragePypy, processor, file_name, options)
+
+
+@register("numpy")
+def _numpy(file_name: str, options: EngineOptions) -> StationTable:
+    _prefetch_unsupported("numpy", options)
+    import calculateAverage
+    import calculateAverageNumpy
+
+    processor = calculateAverageNumpy._process_file_chunk
+    if options.block_size:
+        processor = partial(processor, blocksize=options.block_size)
+    if options.percentiles:
+        processor = partial(processor, percentiles=True)
+    if options.io is not None:
+        processor = partial(processor, io=options.io)
+    return _run_chunks(calculateAverage, processor, file_name, options)
+
+
+@register("threads")
+def _threads(file_name: str, options: EngineOptions) -> StationTable:
+    import calculateAverage
+    import calculateAverageThreads
+    from onebrc.compressed import is_streamed
+
+    _io_unsupported("threads", options)
+    _prefetch_unsupported("threads", options)
+    if (
+        not calculateAverageThreads.gil_disabled()
+        or is_streamed(file_name)
+        or options.incremental
+        or options.checkpoint_dir
+        or options.shared_memory
+        or options.percentiles
+        or options.schedule_report
+        or options.pin
+        or _progress.monitor() is not None
+    ):
+        # Threads only pay off without the GIL, the process engine also covers the other options (and progress)
+        return _run_chunks(calculateAverage, calculateAverage._process_file_chunk_mmap, file_name, options)
+
+    from onebrc.scheduler import get_work_units
+
+    with current().phase("chunks"):
+        if options.units is not None:
+            workers = options.workers or available_cpus()
+            units = options.units
+        elif options.unit_size:
+            workers = options.workers or available_cpus()
+            units = get_work_units(file_name, options.unit_size)
+        elif options.workers:
+            workers, units = calculateAverage.get_file_chunks(file_name, max_cpu=options.workers)
+        else:
+            workers, units = calculateAverage.get_file_chunks(file_name)
+    return calculateAverageThreads.process_file_threads(file_name, units, workers, options.stations)
+
+
+@register("binary")
+def _binary(file_name: str, options: EngineOptions) -> StationTable:
+    from onebrc.compressed import is_streamed
+
+    _io_unsupported("binary", options)
+    _prefetch_unsupported("binary", options)
+    if is_streamed(file_name):
+        raise ValueError("the binary engine does not support compressed files and stdin")
+    if options.incremental:
+        raise ValueError("the binary engine does not support incremental runs")
+    if options.units is not None:
+        raise ValueError("the binary engine does not scan work units of text files")
+    import calculateAverageBinary
+    from onebrc.scheduler import format_schedule_report, run_work_units
+
+    processor = calculateAverageBinary._process_file_chunk
+    if options.block_size:
+        processor = partial(processor, blocksize=options.block_size)
+    if options.stations is not None:
+        processor = partial(processor, stations=options.stations)
+    if options.percentiles:
+        processor = partial(processor, percentiles=True)
+
+    with current().phase("chunks"):
+        if options.workers:
+            workers, units = calculateAverageBinary.get_file_chunks(file_name, options.workers, options.unit_size)
+        else:
+            workers, units = calculateAverageBinary.get_file_chunks(file_name, unit_size=options.unit_size)
+    result, report = run_work_units(
+        processor,
+        units,
+        workers,
+        shared_memory=options.shared_memory,
+        checkpoint=_checkpoint(file_name, options),
+        table_class=_table_class(options),
+        pin=options.pin,
+    )
+    if options.schedule_report:
+        print(format_schedule_report(report), file=sys.stderr)
+    return result
+
+
+@register("inputbuffer")
+def _inputbuffer(file_name: str, options: EngineOptions) -> StationTable:
+    _chunk_engines_only("inputbuffer", file_name, options)
+    import calculateAveragePypyInputBuffer
+
+    return calculateAveragePypyInputBuffer.process_file(
+        file_name,
+        options.workers or calculateAveragePypyInputBuffer.PROCESS_COUNT,
+        options.block_size or calculateAveragePypyInputBuffer.BUFFER_SIZE,
+        options.stations,
+    )
+
+
+@register("polars")
+def _polars(file_name: str, options: EngineOptions) -> StationTable:
+    _chunk_engines_only("polars", file_name, options)
+    if options.workers and "polars" not in sys.modules:
+        # Polars sizes its thread pool once, when it is first imported
+        os.environ["POLARS_MAX_THREADS"] = str(options.workers)
+    import calculateAveragePolars
+
+    return calculateAveragePolars.aggregate_tenths(file_name, options.stations)
+
+
+@register("duckdb")
+def _duckdb(file_name: str, options: EngineOptions) -> StationTable:
+    _chunk_engines_only("duckdb", file_name, options)
+    import calculateAverageDuckDB
+
+    return calculateAverageDuckDB.aggregate_tenths(file_name, options.workers, options.stations)
@@ -0,0 +1,33 @@
+"""Fixed-point temperature parsing, every temperature is kept as integer tenths"""
+
+
+def parse_tenths(value: bytes) -> int:
+    """Parse any temperature into integer tenths (slow path)"""
+    return round(float(value) * 10)
+
+
+def format_tenths(value: int) -> bytes:
+    """Format integer tenths as a -?d?d.d temperature"""
+    sign = b"-" if value < 0 else b""
+    value = abs(value)
+    return b"%s%d.%d" % (sign, value // 10, value % 10)
+
+
+class TenthsTable(dict):
+    """Lookup table from temperature bytes to integer tenths, parsing unexpected keys on a miss"""
+
+    def __missing__(self, key: bytes) -> int:
+        return parse_tenths(key)
+
+
+def _build_table(suffix: bytes = b"") -> TenthsTable:
+    """Precompute all -99.9..99.9 temperatures (plus -0.0) followed by suffix"""
+    table = TenthsTable()
+    for value in range(-999, 1000):
+        table[format_tenths(value) + suffix] = value
+    table[b"-0.0" + suffix] = 0
+    return table
+
+
+TENTHS = _build_table()  # b"-12.3" -> -123
+TENTHS_LINE = _build_table(b"\n")  # b"-12.3\n" -> -123
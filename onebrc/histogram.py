@@ -0,0 +1,114 @@
+"""Exact per station percentiles: one count per possible temperature, from -99.9 to 99.9 in tenths"""
+import sys
+import bisect
+import itertools
+from array import array
+
+from onebrc.stations import StationTable, _little_endian, np
+
+
+BUCKETS = 1999
+OFFSET = 999  # bucket of a temperature in tenths is value + OFFSET
+PERCENTILES = (50, 95, 99)
+
+_EMPTY = array("q", bytes(8 * BUCKETS))
+
+
+class HistogramTable(StationTable):
+    """StationTable with a BUCKETS long count histogram per station, in one flat column
+
+    Station station_id's histogram is histograms[station_id * BUCKETS : (station_id + 1) * BUCKETS],
+    histograms of two tables merge by element-wise addition.
+    """
+
+    __slots__ = ("histograms",)
+
+    def __init__(self):
+        super().__init__()
+        self.histograms = array("q")
+
+    def __getstate__(self) -> tuple:
+        return super().__getstate__() + (self.histograms,)
+
+    def __setstate__(self, state: tuple) -> None:
+        super().__setstate__(state[:-1])
+        self.histograms = state[-1]
+
+    def add(self, name: bytes) -> int:
+        self.histograms.extend(_EMPTY)
+        return super().add(name)
+
+    def update(self, name: bytes, value: int) -> None:
+        super().update(name, value)
+        self.histograms[self.ids[name] * BUCKETS + value + OFFSET] += 1
+
+    def merge(self, other: "HistogramTable") -> "HistogramTable":
+        super().merge(other)
+        remap = [self.ids[name] for name in other.names]
+        if not remap:
+            return self
+
+        if np is not None:
+            values = np.frombuffer(self.histograms, dtype=np.int64).reshape(-1, BUCKETS)
+            values[np.array(remap, dtype=np.intp)] += np.frombuffer(other.histograms, dtype=np.int64).reshape(-1, BUCKETS)
+            del values  # release the buffer so the column can grow again
+            return self
+
+        histograms = self.histograms
+        for other_id, station_id in enumerate(remap):
+            start = station_id * BUCKETS
+            other_start = other_id * BUCKETS
+            for bucket in range(BUCKETS):
+                histograms[start + bucket] += other.histograms[other_start + bucket]
+        return self
+
+    def select(self, stations) -> "HistogramTable":
+        selected = super().select(stations)
+        table = HistogramTable()
+        table.names, table.ids = selected.names, selected.ids
+        table.mins, table.maxs, table.sums, table.counts = selected.mins, selected.maxs, selected.sums, selected.counts
+        for name in table.names:
+            start = self.ids[name] * BUCKETS
+            table.histograms.extend(self.histograms[start : start + BUCKETS])
+        return table
+
+    def to_bytes(self) -> bytes:
+        return super().to_bytes() + _little_endian(self.histograms)
+
+    @classmethod
+    def from_bytes(cls, data, offset: int = 0) -> tuple["HistogramTable", int]:
+        table, offset = super().from_bytes(data, offset)
+        size = 8 * BUCKETS * len(table)
+        table.histograms.frombytes(bytes(data[offset : offset + size]))
+        if sys.byteorder != "little":
+            table.histograms.byteswap()
+        return table, offset + size
+
+    @classmethod
+    def from_histograms(cls, names: list, histograms) -> "HistogramTable":
+        """Build a table from names and a (stations, BUCKETS) NumPy count array, min/max/sum/count follow from it"""
+        table = cls()
+        table.names = list(names)
+        table.ids = {name: station_id for station_id, name in enumerate(table.names)}
+        values = np.arange(-OFFSET, BUCKETS - OFFSET, dtype=np.int64)
+        seen = histograms > 0
+        table.mins = array("q", (int(value) for value in np.where(seen, values, BUCKETS).min(axis=1)))
+        table.maxs = array("q", (int(value) for value in np.where(seen, values, -BUCKETS).max(axis=1)))
+        table.sums = array("q", (int(value) for value in histograms @ values))
+        table.counts = array("q", (int(value) for value in histograms.sum(axis=1)))
+        table.histograms = array("q", np.ascontiguousarray(histograms, dtype=np.int64).tobytes())
+        return table
+
+    def percentiles(self, percentiles: tuple = PERCENTILES) -> list[tuple]:
+        """Exact nearest-rank percentiles per station id, in tenths: the smallest value with at least p% of the rows at or below it"""
+        results = list()
+        for station_id, count in enumerate(self.counts):
+            row = self.histograms[station_id * BUCKETS : (station_id + 1) * BUCKETS]
+            cumulative = list(itertools.accumulate(row))
+            results.append(
+                tuple(
+                    bisect.bisect_left(cumulative, max(1, -(-percentile * count // 100))) - OFFSET
+                    for percentile in percentiles
+                )
+            )
+        return results
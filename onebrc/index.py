@@ -0,0 +1,137 @@
+"""Sidecar block index: newline aligned block offsets with a StationTable summary per block
+
+python -m onebrc.index --file measurements.txt writes measurements.txt.1brc-index
+"""
+import os
+import sys
+import struct
+import argparse
+import multiprocessing as mp
+
+from onebrc.cpus import available_cpus
+from onebrc.stations import StationTable
+from onebrc.incremental import fingerprint
+from onebrc.scheduler import DEFAULT_UNIT_SIZE, get_work_units
+
+
+INDEX_SUFFIX = ".1brc-index"
+MAGIC = b"1BRCINDEX1"
+
+_HEADER = struct.Struct("<10sq16sq")  # magic, file size, fingerprint, block count
+_BLOCK = struct.Struct("<qq")  # block start, block end
+
+
+def index_file_for(file_name: str) -> str:
+    """Default sidecar file name"""
+    return file_name + INDEX_SUFFIX
+
+
+class BlockIndex:
+    """Blocks of a measurements file, each with the stations it contains and their aggregates"""
+
+    def __init__(self, file_name: str, blocks: list, tables: list):
+        self.file_name = file_name
+        self.blocks = blocks  # [(block_start, block_end)]
+        self.tables = tables  # one StationTable per block
+
+    def units(self, stations=None) -> list[tuple[str, int, int]]:
+        """Work units for the blocks containing any of the stations (every block when stations is None)"""
+        return [
+            (self.file_name, block_start, block_end)
+            for (block_start, block_end), table in zip(self.blocks, self.tables)
+            if stations is None or not table.ids.keys().isdisjoint(stations)
+        ]
+
+    def query(self, stations=None) -> StationTable:
+        """Aggregate straight from the block summaries, without reading the measurements file"""
+        result = StationTable()
+        for table in self.tables:
+            result.merge(table if stations is None else table.select(stations))
+        return result
+
+
+def build_index(
+    file_name: str,
+    block_size: int = DEFAULT_UNIT_SIZE,
+    workers: int = None,
+    index_file: str = None,
+) -> BlockIndex:
+    """Summarize every block of the file with the pypy engine's chunk processor and write the sidecar"""
+    from calculateAveragePypy import _process_file_chunk
+
+    units = get_work_units(file_name, block_size)
+    with mp.get_context().Pool(workers or available_cpus()) as pool:
+        # Ordered, the tables are stored next to their block offsets
+        tables = pool.starmap(_process_file_chunk, units)
+
+    index = BlockIndex(file_name, [(unit_start, unit_end) for _, unit_start, unit_end in units], tables)
+    size = os.path.getsize(file_name)
+    index_file = index_file or index_file_for(file_name)
+    temporary = index_file + ".tmp"
+    with open(temporary, mode="wb") as f:
+        f.write(_HEADER.pack(MAGIC, size, fingerprint(file_name, size), len(units)))
+        for (block_start, block_end), table in zip(index.blocks, tables):
+            f.write(_BLOCK.pack(block_start, block_end))
+            f.write(table.to_bytes())
+    os.replace(temporary, index_file)
+    return index
+
+
+def load_index(file_name: str, index_file: str = None) -> BlockIndex:
+    """Read the sidecar index, None when it is missing or the file changed since it was built"""
+    index_file = index_file or index_file_for(file_name)
+    try:
+        with open(index_file, mode="rb") as f:
+            data = f.read()
+        magic, size, digest, count = _HEADER.unpack_from(data)
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or size != os.path.getsize(file_name) or digest != fingerprint(file_name, size):
+        return None
+
+    blocks = list()
+    tables = list()
+    offset = _HEADER.size
+    for _ in range(count):
+        blocks.append(_BLOCK.unpack_from(data, offset))
+        table, offset = StationTable.from_bytes(data, offset + _BLOCK.size)
+        tables.append(table)
+    return BlockIndex(file_name, blocks, tables)
+
+
+def main(argv: list = None) -> None:
+    from onebrc.__main__ import positive_int
+
+    parser = argparse.ArgumentParser(
+        prog="python -m onebrc.index",
+        description="Build the block index of a measurements file",
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        dest="file",
+        type=str,
+        help='Measurement file name (default is "measurements.txt")',
+        default="measurements.txt",
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        dest="block_size",
+        type=positive_int,
+        help=f"Size of the indexed blocks in bytes (default is {DEFAULT_UNIT_SIZE})",
+        default=DEFAULT_UNIT_SIZE,
+    )
+    parser.add_argument("-w", "--workers", dest="workers", type=positive_int, help="Number of worker processes")
+    parser.add_argument("-o", "--output", dest="output", type=str, help="Index file (default is FILE.1brc-index)")
+    args = parser.parse_args(argv)
+
+    index = build_index(args.file, args.block_size, args.workers, args.output)
+    print(
+        f"Indexed {len(index.blocks)} blocks of {args.file} to {args.output or index_file_for(args.file)}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
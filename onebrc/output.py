@@ -0,0 +1,24 @@
+"""Output formatting shared by the engines"""
+from onebrc.stations import StationTable
+
+
+def format_results(result: StationTable, percentiles: bool = False) -> str:
+    """Format min/mean/max per station, sorted by name, in the same layout as the scripts print
+
+    With percentiles result is a HistogramTable, and p50/p95/p99 follow the max.
+    """
+    if percentiles:
+        rows = sorted(
+            (location, measurements, "".join(f"/{value / 10:.1f}" for value in station_percentiles))
+            for (location, measurements), station_percentiles in zip(result.items(), result.percentiles())
+        )
+    else:
+        rows = sorted((location, measurements, "") for location, measurements in result.items())
+    return (
+        "{"
+        + "".join(
+            f"{location.decode('utf-8')}={measurements[0] / 10:.1f}/{(measurements[2] / (10 * measurements[3])) if measurements[3] != 0 else 0:.1f}/{measurements[1] / 10:.1f}{extra}, "
+            for location, measurements, extra in rows
+        )
+        + "\b\b} \n"
+    )
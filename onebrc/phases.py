@@ -0,0 +1,92 @@
+"""Opt-in phase instrumentation: wall and CPU time per named phase, plus counters, as a JSON report
+
+Code asks for the recorder of its process with current() and wraps its phases in
+current().phase(name). Until enable() is called that is a no-op recorder, a phase costs one method
+call returning a shared null context, so phases are only placed around blocks, never around rows.
+"""
+import sys
+import time
+import json
+import contextlib
+
+
+class PhaseRecorder:
+    """Totals per phase name, counters, and the reports of the worker processes"""
+
+    enabled = True
+
+    def __init__(self):
+        self.phases = dict()  # name -> [wall, cpu, calls]
+        self.counters = dict()
+        self.workers = list()  # to_dict() of every worker process
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Add the wall and CPU (process_time, all threads of the process) time of the block to a phase"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.phases.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+            totals[2] += 1
+
+    def count(self, name: str, value: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        report = {
+            "phases": {
+                name: {"wall": wall, "cpu": cpu, "calls": calls}
+                for name, (wall, cpu, calls) in self.phases.items()
+            },
+            "counters": dict(self.counters),
+        }
+        if self.workers:
+            report["workers"] = self.workers
+        return report
+
+
+class _DisabledRecorder:
+    """Stand in when instrumentation is off, every call does nothing"""
+
+    enabled = False
+    _null = contextlib.nullcontext()
+
+    def phase(self, name: str):
+        return self._null
+
+    def count(self, name: str, value: int) -> None:
+        pass
+
+
+DISABLED = _DisabledRecorder()
+_current = DISABLED
+
+
+def current():
+    """Recorder of this process, DISABLED unless enable() was called"""
+    return _current
+
+
+def enable() -> PhaseRecorder:
+    """Start recording in this process, with a fresh recorder"""
+    global _current
+    _current = PhaseRecorder()
+    return _current
+
+
+def disable() -> None:
+    global _current
+    _current = DISABLED
+
+
+def write_report(report: dict, file_name: str) -> None:
+    """Write a report as JSON, - is stderr"""
+    if file_name == "-":
+        json.dump(report, sys.stderr, indent=2)
+        sys.stderr.write("\n")
+        return
+    with open(file_name, mode="w") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,221 @@
+"""Live progress of a run: per worker byte and row counters in shared memory, read by a reporter thread
+
+Every worker process claims a slot of a ProgressCounters array and reports each block it parsed with
+current().add(size, rows), once per block and never per row. rows is the running total of rows the
+processor aggregated, e.g. sum(table.counts), which costs one pass over the stations instead of a
+pass over the block. Until a monitor is
+enabled current() is a no-op counter. The reporter thread of the parent reads all slots every interval
+and writes a status line (throughput, per worker skew, ETA) or one JSON object per line.
+"""
+import sys
+import json
+import time
+import threading
+import contextlib
+import multiprocessing as mp
+
+
+DEFAULT_INTERVAL = 1.0  # seconds between two progress updates
+
+
+class ProgressCounters:
+    """Bytes and rows per worker slot (int64), and the next free slot, in shared memory
+
+    Created before the worker processes, which inherit it (as Process or Pool initializer arguments).
+    Every slot is only written by the worker that claimed it, the parent only reads.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.values = mp.RawArray("q", 2 * slots)
+        self.next_slot = mp.Value("i", 0)
+
+    def claim(self) -> int:
+        with self.next_slot.get_lock():
+            slot = self.next_slot.value
+            self.next_slot.value += 1
+        if slot >= self.slots:
+            raise ValueError(f"more than {self.slots} workers attached to the progress counters")
+        return slot
+
+    def snapshot(self) -> tuple[list, list]:
+        """(bytes, rows) of every slot"""
+        values = self.values[:]
+        return values[0::2], values[1::2]
+
+
+class WorkerCounter:
+    """The slot of a worker process"""
+
+    enabled = True
+
+    def __init__(self, counters: ProgressCounters):
+        self.values = counters.values
+        slot = counters.claim()
+        self.bytes_index = 2 * slot
+        self.rows_index = 2 * slot + 1
+        self.unit_bytes = 0  # reported by add() since the last unit_done()
+        self.unit_rows = 0
+
+    def add(self, size: int, rows: int) -> None:
+        """A block of size bytes was parsed, rows were aggregated since the work unit started"""
+        self.values[self.bytes_index] += size
+        self.values[self.rows_index] += rows - self.unit_rows
+        self.unit_bytes += size
+        self.unit_rows = rows
+
+    def unit_done(self, size: int, rows: int) -> None:
+        """A work unit of size bytes and rows rows is done, add what its blocks did not report
+
+        Processors without a block loop only report here.
+        """
+        self.values[self.bytes_index] += size - self.unit_bytes
+        self.values[self.rows_index] += rows - self.unit_rows
+        self.unit_bytes = 0
+        self.unit_rows = 0
+
+
+class _DisabledCounter:
+    """Stand in when no progress is shown, every call does nothing"""
+
+    enabled = False
+
+    def add(self, size: int, rows: int) -> None:
+        pass
+
+    def unit_done(self, size: int, rows: int) -> None:
+        pass
+
+
+DISABLED = _DisabledCounter()
+_current = DISABLED
+_monitor = None
+
+
+def current():
+    """Counter of this process, DISABLED unless attach() was called"""
+    return _current
+
+
+def attach(counters: ProgressCounters) -> WorkerCounter:
+    """Claim a slot of counters for this worker process"""
+    global _current
+    _current = WorkerCounter(counters)
+    return _current
+
+
+class ProgressMonitor:
+    """Writes the progress of the runs of the parent process to a stream"""
+
+    def __init__(
+        self,
+        stream=None,
+        json_lines: bool = False,
+        interval: float = DEFAULT_INTERVAL,
+    ):
+        self.stream = stream or sys.stderr
+        self.json_lines = json_lines
+        self.interval = interval
+
+    @contextlib.contextmanager
+    def track(self, counters: ProgressCounters, total: int):
+        """Report the counters every interval until the block exits, then a last time"""
+        started = time.perf_counter()
+        stop = threading.Event()
+        previous = (0.0, 0, 0)  # elapsed, bytes and rows of the previous update
+
+        def report(done: bool) -> None:
+            nonlocal previous
+            elapsed = time.perf_counter() - started
+            worker_bytes, worker_rows = counters.snapshot()
+            # the last update has the rates of the whole run
+            since = (0.0, 0, 0) if done else previous
+            self.write(progress_status(worker_bytes, worker_rows, total, elapsed, since, done))
+            previous = (elapsed, sum(worker_bytes), sum(worker_rows))
+
+        def loop() -> None:
+            while not stop.wait(self.interval):
+                report(False)
+
+        reporter = threading.Thread(target=loop, daemon=True)
+        reporter.start()
+        try:
+            yield counters
+        finally:
+            stop.set()
+            reporter.join()
+        report(True)
+
+    def write(self, status: dict) -> None:
+        if self.json_lines:
+            self.stream.write(json.dumps(status) + "\n")
+        else:
+            end = "\n" if status["done"] or not self.stream.isatty() else ""
+            self.stream.write("\r" + format_progress(status) + end)
+        self.stream.flush()
+
+
+def progress_status(
+    worker_bytes: list,
+    worker_rows: list,
+    total: int,
+    elapsed: float,
+    previous: tuple,
+    done: bool,
+) -> dict:
+    """Progress of a run as a dict
+
+    previous is (elapsed, bytes, rows) of the previous update, the rates are over the time since then
+    and the ETA extrapolates the average rate of the whole run.
+    """
+    done_bytes = sum(worker_bytes)
+    rows = sum(worker_rows)
+    since_previous = (elapsed - previous[0]) or 1e-9
+    mean = done_bytes / len(worker_bytes) if worker_bytes else 0
+    average_rate = done_bytes / elapsed if elapsed else 0
+    return {
+        "elapsed": round(elapsed, 3),
+        "bytes": done_bytes,
+        "total_bytes": total,
+        "fraction": done_bytes / total if total else 1.0,
+        "rows": rows,
+        "bytes_per_s": (done_bytes - previous[1]) / since_previous,
+        "rows_per_s": (rows - previous[2]) / since_previous,
+        "skew": max(worker_bytes) / mean if mean else 1.0,  # busiest worker against the mean
+        "eta": 0.0 if done else ((total - done_bytes) / average_rate if average_rate else None),
+        "worker_bytes": worker_bytes,
+        "worker_rows": worker_rows,
+        "done": done,
+    }
+
+
+def format_progress(status: dict) -> str:
+    """One status line"""
+    eta = status["eta"]
+    eta = "--:--" if eta is None else f"{int(eta) // 60}:{int(eta) % 60:02d}"
+    return (
+        f"{status['fraction'] * 100:5.1f}% {status['bytes'] / 1e6:.1f}/{status['total_bytes'] / 1e6:.1f} MB"
+        f" {status['bytes_per_s'] / 1e6:.1f} MB/s {status['rows_per_s'] / 1e6:.2f}M rows/s"
+        f" skew {status['skew']:.2f} ETA {eta}"
+    )
+
+
+def monitor():
+    """Monitor of this process, None unless enable() was called"""
+    return _monitor
+
+
+def enable(
+    stream=None,
+    json_lines: bool = False,
+    interval: float = DEFAULT_INTERVAL,
+) -> ProgressMonitor:
+    """Show the progress of the following runs on stream (default stderr), as status lines or JSON lines"""
+    global _monitor
+    _monitor = ProgressMonitor(stream, json_lines, interval)
+    return _monitor
+
+
+def disable() -> None:
+    global _monitor
+    _monitor = None
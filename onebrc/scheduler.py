@@ -0,0 +1,295 @@
+"""Work-stealing scheduler: many small newline aligned work units pulled by a pool of workers"""
+import os
+import time
+import queue
+import pickle
+import contextlib
+import traceback
+import multiprocessing as mp
+from dataclasses import asdict, dataclass
+
+from onebrc import phases as _phases
+from onebrc import progress as _progress
+from onebrc import cpus as _cpus
+from onebrc.stations import StationTable
+from onebrc.shm import SharedTables
+from onebrc.checkpoint import Checkpoint
+
+
+DEFAULT_UNIT_SIZE = 32 * 1024 * 1024
+
+
+@dataclass
+class WorkerStats:
+    """Time line of one worker process"""
+
+    pid: int
+    units: int = 0
+    bytes: int = 0
+    busy: float = 0.0
+    last_finish: float = 0.0
+    idle_tail: float = 0.0
+    phases: dict = None  # PhaseRecorder.to_dict() of the worker when instrumented
+
+
+def get_work_units(
+    file_name: str,
+    unit_size: int = DEFAULT_UNIT_SIZE,
+    start: int = 0,
+    end: int = None,
+) -> list[tuple[str, int, int]]:
+    """Split [start, end) of a file into newline aligned (file_name, unit_start, unit_end) units of about unit_size bytes
+
+    start must be the beginning of a line, end defaults to the end of the file.
+    """
+    if unit_size < 1:
+        raise ValueError("unit_size must be at least 1")
+    if end is None:
+        end = os.path.getsize(file_name)
+
+    units = list()
+    with open(file_name, mode="rb") as f:
+        unit_start = start
+        while unit_start < end:
+            unit_end = unit_start + unit_size
+            if unit_end < end:
+                # Move forward to the start of the next line
+                f.seek(unit_end - 1)
+                unit_end += len(f.readline()) - 1
+            if unit_end > end:
+                unit_end = end
+
+            units.append(
+                (
+                    file_name,
+                    unit_start,
+                    unit_end,
+                )
+            )
+
+            unit_start = unit_end
+
+    return units
+
+
+@dataclass
+class ScheduleReport:
+    """Per worker statistics plus the serial merge work done by the parent"""
+
+    workers: list
+    merge: float = 0.0  # time spent folding tables in the parent
+    merge_tail: float = 0.0  # time between the last unit finishing and the result being ready
+    tables: int = 0  # number of tables received by the parent
+    restored: int = 0  # units restored from a checkpoint instead of being processed
+
+
+def _worker(
+    processor,
+    tasks,
+    results,
+    premerge: bool,
+    slot: int,
+    shared: SharedTables,
+    checkpoint: Checkpoint,
+    table_class: type,
+    instrument: bool = False,
+    counters: _progress.ProgressCounters = None,
+    cpu: int = None,
+) -> None:
+    """Worker loop: pull units until the None sentinel, folding results into a local table"""
+    if cpu is not None:
+        _cpus.pin(cpu)
+    stats = WorkerStats(os.getpid())
+    phases = _phases.enable() if instrument else _phases.current()
+    progress = _progress.attach(counters) if counters is not None else _progress.current()
+    local = table_class()
+    try:
+        while True:
+            unit = tasks.get()
+            if unit is None:
+                break
+
+            started = time.time()
+            with phases.phase("process"):
+                chunk_result = processor(*unit)
+            if checkpoint is not None:
+                with phases.phase("checkpoint"):
+                    checkpoint.save(unit, chunk_result)
+            if premerge:
+                with phases.phase("premerge"):
+                    local.merge(chunk_result)
+            else:
+                results.put(("unit", chunk_result))
+            finished = time.time()
+            if progress.enabled:
+                progress.unit_done(unit[2] - unit[1], sum(chunk_result.counts))
+
+            stats.units += 1
+            stats.bytes += unit[2] - unit[1]
+            stats.busy += finished - started
+            stats.last_finish = finished
+            if phases.enabled:
+                phases.count("rows", sum(chunk_result.counts))
+        if phases.enabled and premerge:
+            phases.count("keys", len(local))
+        if shared is not None:
+            with phases.phase("shared_write"):
+                shared.write(slot, local)
+            shared.close()
+            local = None
+        if phases.enabled and local is not None:
+            # The queue pickles in a background thread, time an extra pickling of the result instead
+            with phases.phase("pickle"):
+                phases.count("result_bytes", len(pickle.dumps(local, pickle.HIGHEST_PROTOCOL)))
+        if phases.enabled:
+            stats.phases = phases.to_dict()
+    except BaseException:
+        results.put(("error", traceback.format_exc()))
+        raise
+    results.put(("done", local if premerge else None, stats))
+
+
+def run_work_units(
+    processor,
+    units: list,
+    workers: int,
+    premerge: bool = True,
+    shared_memory: bool = False,
+    checkpoint: Checkpoint = None,
+    table_class: type = StationTable,
+    pin: bool = False,
+) -> tuple[StationTable, ScheduleReport]:
+    """Process units with worker processes, each worker pulls the next unit from a shared queue as soon as it is done
+
+    With premerge every worker folds its own units, so the parent only merges one table per worker
+    instead of one table per unit. With shared_memory those tables are written to a shared memory
+    slot per worker and reduced in place, instead of being pickled back to the parent. With a
+    checkpoint every worker saves each unit it completes, units saved by a previous run are not
+    processed again, and the checkpoint is cleared once the run succeeded. table_class is the
+    StationTable subclass the processor returns (e.g. HistogramTable), the results are folded into it.
+    With pin every worker is restricted to one CPU of the affinity mask, round robin.
+    """
+    if shared_memory and not premerge:
+        raise ValueError("shared_memory needs premerge, there is one slot per worker")
+    if shared_memory and table_class is not StationTable:
+        raise ValueError("shared memory slots only hold the min/max/sum/count columns")
+    if pin and not hasattr(os, "sched_setaffinity"):
+        raise ValueError("pinning workers to CPUs needs os.sched_setaffinity (Linux)")
+    result = table_class()
+    report = ScheduleReport(list())
+    if checkpoint is not None:
+        result, remaining = checkpoint.restore(units)
+        report.restored = len(units) - len(remaining)
+        units = remaining
+
+    shared = SharedTables(workers) if shared_memory else None
+    phases = _phases.current()
+    monitor = _progress.monitor()
+    counters = _progress.ProgressCounters(workers) if monitor is not None else None
+    worker_cpus = _cpus.worker_cpus(workers) if pin else [None] * workers
+
+    ctx = mp.get_context()
+    tasks = ctx.Queue()
+    results = ctx.Queue()
+    for unit in units:
+        tasks.put(unit)
+    for _ in range(workers):
+        tasks.put(None)
+
+    processes = [
+        ctx.Process(
+            target=_worker,
+            args=(
+                processor,
+                tasks,
+                results,
+                premerge,
+                slot,
+                shared,
+                checkpoint,
+                table_class,
+                phases.enabled,
+                counters,
+                worker_cpus[slot],
+            ),
+            daemon=True,
+        )
+        for slot in range(workers)
+    ]
+    run_start = time.time()
+    with phases.phase("start_workers"):
+        for process in processes:
+            process.start()
+
+    tracking = contextlib.nullcontext()
+    if monitor is not None:
+        tracking = monitor.track(counters, sum(unit[2] - unit[1] for unit in units))
+
+    try:
+        with tracking:
+            while len(report.workers) < workers:
+                try:
+                    message = results.get(timeout=1)
+                except queue.Empty:
+                    if any(process.exitcode not in (None, 0) for process in processes):
+                        raise RuntimeError("a worker process died before finishing its units")
+                    continue
+
+                if message[0] == "error":
+                    raise RuntimeError(f"a worker process failed:\n{message[1]}")
+                if message[0] == "done":
+                    report.workers.append(message[2])
+                chunk_result = message[1]
+                if chunk_result is not None:
+                    merge_start = time.time()
+                    with phases.phase("merge"):
+                        result.merge(chunk_result)
+                    report.merge += time.time() - merge_start
+                    report.tables += 1
+
+        if shared is not None:
+            merge_start = time.time()
+            with phases.phase("merge"):
+                shared.merge_into(result)
+            report.merge += time.time() - merge_start
+            report.tables += workers
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        if shared is not None:
+            shared.unlink()
+    if checkpoint is not None:
+        checkpoint.clear()
+    done = time.time()
+
+    # Idle tail: how long each worker waited for the slowest one at the end of the run
+    busy_workers = [worker for worker in report.workers if worker.units]
+    run_end = max((worker.last_finish for worker in busy_workers), default=run_start)
+    report.merge_tail = done - run_end
+    for worker in report.workers:
+        worker.idle_tail = run_end - (worker.last_finish if worker.units else run_start)
+    report.workers.sort(key=lambda worker: worker.pid)
+    if phases.enabled:
+        for worker in report.workers:
+            entry = asdict(worker)
+            entry.update(entry.pop("phases") or {})
+            phases.workers.append(entry)
+
+    return result, report
+
+
+def format_schedule_report(report: ScheduleReport) -> str:
+    """Format the per worker schedule statistics"""
+    lines = ["pid units MB busy(s) idle_tail(s)"]
+    for worker in report.workers:
+        lines.append(
+            f"{worker.pid} {worker.units} {worker.bytes / 1024 / 1024:.1f} {worker.busy:.3f} {worker.idle_tail:.3f}"
+        )
+    if report.restored:
+        lines.append(f"{report.restored} units restored from the checkpoint")
+    lines.append(
+        f"parent merged {report.tables} tables in {report.merge:.3f}s, result ready {report.merge_tail:.3f}s after the last unit"
+    )
+    return "\n".join(lines)
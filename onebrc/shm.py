@@ -0,0 +1,88 @@
+"""Shared memory accumulator slots: workers write their tables in place instead of pickling them back"""
+from multiprocessing import shared_memory
+
+from onebrc.stations import StationTable
+
+
+MAX_STATIONS = 10_000  # 1BRC rules: at most 10,000 unique station names
+MAX_NAME_BYTES = 100  # 1BRC rules: station names are at most 100 bytes of UTF-8
+
+_COLUMNS = 4  # min, max, sum, count
+
+
+class SharedTables:
+    """One fixed size slot per worker in a single shared memory block
+
+    Slot layout: station count (int64), then the min/max/sum/count columns (int64, indexed by
+    the worker's dense station id), then one length byte and one fixed width name per station.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        capacity: int = MAX_STATIONS,
+    ):
+        self.slots = slots
+        self.capacity = capacity
+        slot_size = 8 + _COLUMNS * 8 * capacity + capacity + MAX_NAME_BYTES * capacity
+        self.slot_size = (slot_size + 7) // 8 * 8  # keep every slot's columns 8 byte aligned
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_size)
+
+    def _offsets(self, slot: int) -> tuple[int, int, int, int]:
+        start = slot * self.slot_size
+        columns = start + 8
+        lengths = columns + _COLUMNS * 8 * self.capacity
+        names = lengths + self.capacity
+        return start, columns, lengths, names
+
+    def write(self, slot: int, table: StationTable) -> None:
+        """Copy a worker table into its slot"""
+        count = len(table)
+        if count > self.capacity:
+            raise ValueError(f"{count} stations do not fit in a slot of {self.capacity}")
+
+        start, columns, lengths, names = self._offsets(slot)
+        buf = self.shm.buf
+        buf[start : start + 8] = count.to_bytes(8, "little", signed=True)
+        for index, column in enumerate((table.mins, table.maxs, table.sums, table.counts)):
+            offset = columns + index * 8 * self.capacity
+            buf[offset : offset + 8 * count] = memoryview(column).cast("B")
+        for station_id, name in enumerate(table.names):
+            if len(name) > MAX_NAME_BYTES:
+                raise ValueError(f"station name longer than {MAX_NAME_BYTES} bytes: {name!r}")
+            buf[lengths + station_id] = len(name)
+            offset = names + station_id * MAX_NAME_BYTES
+            buf[offset : offset + len(name)] = name
+
+    def merge_into(self, result: StationTable) -> StationTable:
+        """Fold every slot into result, reading the columns in place"""
+        buf = self.shm.buf
+        for slot in range(self.slots):
+            start, columns, lengths, names = self._offsets(slot)
+            count = int.from_bytes(buf[start : start + 8], "little", signed=True)
+            if count == 0:
+                continue
+
+            table = StationTable()
+            table.names = [
+                bytes(buf[offset : offset + buf[lengths + station_id]])
+                for station_id, offset in enumerate(
+                    range(names, names + count * MAX_NAME_BYTES, MAX_NAME_BYTES)
+                )
+            ]
+            table.mins, table.maxs, table.sums, table.counts = (
+                buf[offset : offset + 8 * count].cast("q")
+                for offset in range(columns, lengths, 8 * self.capacity)
+            )
+            result.merge(table)
+            del table  # drop the views into the block before it can be closed
+        return result
+
+    def close(self) -> None:
+        """Detach from the block"""
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """Detach from and free the block (parent only)"""
+        self.shm.close()
+        self.shm.unlink()
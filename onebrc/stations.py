@@ -0,0 +1,191 @@
+"""Dense station interning, with min/max/sum/count kept in parallel array columns"""
+import sys
+import struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # e.g. PyPy without NumPy, merge falls back to a loop
+    np = None
+
+
+EMPTY_MIN = 1 << 62
+EMPTY_MAX = -(1 << 62)
+
+_HEADER = struct.Struct("<qq")  # station count, total name bytes
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "little":
+        return column.tobytes()
+    column = array(column.typecode, column)
+    column.byteswap()
+    return column.tobytes()
+
+
+def first_byte_filter(stations) -> bytes:
+    """256 entry table that is non zero for the first byte of any of the stations
+
+    Rows whose first byte is zero in it can be skipped before their name is sliced or hashed.
+    """
+    table = bytearray(256)
+    for name in stations:
+        if name:
+            table[name[0]] = 1
+    return bytes(table)
+
+
+class StationTable:
+    """Map each station name to a dense id on first sight, aggregates are indexed by that id"""
+
+    __slots__ = ("ids", "names", "mins", "maxs", "sums", "counts")
+
+    def __init__(self):
+        self.ids = dict()  # station name -> dense id
+        self.names = list()  # dense id -> station name
+        self.mins = array("q")
+        self.maxs = array("q")
+        self.sums = array("q")
+        self.counts = array("q")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getstate__(self) -> tuple:
+        # The ids dict is rebuilt on unpickling, only names and columns are sent
+        return (self.names, self.mins, self.maxs, self.sums, self.counts)
+
+    def __setstate__(self, state: tuple) -> None:
+        self.names, self.mins, self.maxs, self.sums, self.counts = state
+        self.ids = {name: station_id for station_id, name in enumerate(self.names)}
+
+    def add(self, name: bytes) -> int:
+        """Intern a station that is not in the table yet, returning its id"""
+        station_id = self.ids[name] = len(self.names)
+        self.names.append(name)
+        self.mins.append(EMPTY_MIN)
+        self.maxs.append(EMPTY_MAX)
+        self.sums.append(0)
+        self.counts.append(0)
+        return station_id
+
+    def station_id(self, name: bytes) -> int:
+        """Return the id of a station, interning it if needed"""
+        station_id = self.ids.get(name)
+        if station_id is None:
+            station_id = self.add(name)
+        return station_id
+
+    def update(self, name: bytes, value: int) -> None:
+        """Add a single measurement (slow path, engines inline this in their loops)"""
+        station_id = self.station_id(name)
+        if value < self.mins[station_id]:
+            self.mins[station_id] = value
+        if value > self.maxs[station_id]:
+            self.maxs[station_id] = value
+        self.sums[station_id] += value
+        self.counts[station_id] += 1
+
+    def items(self):
+        """Iterate over (name, (min, max, sum, count))"""
+        return zip(
+            self.names,
+            zip(self.mins, self.maxs, self.sums, self.counts),
+        )
+
+    def merge(self, other: "StationTable") -> "StationTable":
+        """Fold another table into this one"""
+        remap = [self.station_id(name) for name in other.names]
+        if not remap:
+            return self
+
+        if np is not None:
+            ids = np.array(remap, dtype=np.intp)
+            for column, other_column, reduce in (
+                (self.mins, other.mins, np.minimum),
+                (self.maxs, other.maxs, np.maximum),
+                (self.sums, other.sums, np.add),
+                (self.counts, other.counts, np.add),
+            ):
+                values = np.frombuffer(column, dtype=np.int64)
+                values[ids] = reduce(values[ids], np.frombuffer(other_column, dtype=np.int64))
+                del values  # release the buffer so the column can grow again
+            return self
+
+        for other_id, station_id in enumerate(remap):
+            if other.mins[other_id] < self.mins[station_id]:
+                self.mins[station_id] = other.mins[other_id]
+            if other.maxs[other_id] > self.maxs[station_id]:
+                self.maxs[station_id] = other.maxs[other_id]
+            self.sums[station_id] += other.sums[other_id]
+            self.counts[station_id] += other.counts[other_id]
+        return self
+
+    @classmethod
+    def from_columns(cls, names: list, mins, maxs, sums, counts) -> "StationTable":
+        """Build a table from a list of names and four integer sequences (lists, arrays or NumPy arrays)"""
+        table = cls()
+        table.names = list(names)
+        table.ids = {name: station_id for station_id, name in enumerate(table.names)}
+        table.mins = array("q", (int(value) for value in mins))
+        table.maxs = array("q", (int(value) for value in maxs))
+        table.sums = array("q", (int(value) for value in sums))
+        table.counts = array("q", (int(value) for value in counts))
+        return table
+
+    def select(self, stations) -> "StationTable":
+        """Return a table with only the given stations (the ones not in this table are left out)"""
+        ids = [self.ids[name] for name in stations if name in self.ids]
+        return StationTable.from_columns(
+            [self.names[station_id] for station_id in ids],
+            [self.mins[station_id] for station_id in ids],
+            [self.maxs[station_id] for station_id in ids],
+            [self.sums[station_id] for station_id in ids],
+            [self.counts[station_id] for station_id in ids],
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize to a compact little endian layout: header, name lengths, names, then the four columns"""
+        names = b"".join(self.names)
+        return b"".join(
+            (
+                _HEADER.pack(len(self.names), len(names)),
+                _little_endian(array("H", (len(name) for name in self.names))),
+                names,
+                _little_endian(array("q", self.mins)),
+                _little_endian(array("q", self.maxs)),
+                _little_endian(array("q", self.sums)),
+                _little_endian(array("q", self.counts)),
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, data, offset: int = 0) -> tuple["StationTable", int]:
+        """Deserialize a table written by to_bytes at offset, returning it and the offset right after it"""
+        count, names_size = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+
+        def read_column(typecode: str, size: int) -> array:
+            nonlocal offset
+            column = array(typecode)
+            column.frombytes(bytes(data[offset : offset + size]))
+            if sys.byteorder != "little":
+                column.byteswap()
+            offset += size
+            return column
+
+        lengths = read_column("H", 2 * count)
+        names = bytes(data[offset : offset + names_size])
+        offset += names_size
+
+        table = cls()
+        position = 0
+        for length in lengths:
+            table.names.append(names[position : position + length])
+            position += length
+        table.ids = {name: station_id for station_id, name in enumerate(table.names)}
+        table.mins = read_column("q", 8 * count)
+        table.maxs = read_column("q", 8 * count)
+        table.sums = read_column("q", 8 * count)
+        table.counts = read_column("q", 8 * count)
+        return table, offset
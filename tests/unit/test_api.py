@@ -0,0 +1,56 @@
+"""
+Unit tests for the library interface and station filters.
+"""
+
+import pytest
+
+from onebrc import StationStats, aggregate
+from onebrc.__main__ import main
+from onebrc.engines import ENGINES
+
+
+@pytest.mark.unit
+class TestAggregate:
+    """Test aggregate() and the station allow-list pushdown."""
+
+    def test_structured_result(self, sample_measurements_file):
+        """Results are sorted by name, in degrees."""
+        result = aggregate(str(sample_measurements_file), workers=2)
+        assert list(result)[:2] == ["Bulawayo", "Cracow"]
+        assert result["Hamburg"] == StationStats(-2.3, 4.85, 12.0, 2)
+
+    @pytest.mark.parametrize("engine", sorted(ENGINES))
+    def test_station_filter(self, sample_measurements_file, engine):
+        """Every engine only returns the allowed stations."""
+        if engine in ("numpy", "polars", "duckdb"):
+            pytest.importorskip(engine)
+        file_name = str(sample_measurements_file)
+        if engine == "binary":
+            pytest.importorskip("numpy")
+            from onebrc.binary import convert
+
+            file_name = f"{file_name}.1brc"
+            convert(str(sample_measurements_file), file_name)
+        result = aggregate(
+            file_name,
+            engine=engine,
+            stations=["Cracow", b"St. John's", "Nowhere"],
+            workers=2,
+            block_size=16,
+        )
+        assert result == {
+            "Cracow": StationStats(-8.7, 1.95, 12.6, 2),
+            "St. John's": StationStats(-5.1, 5.05, 15.2, 2),
+        }
+
+    def test_same_first_byte(self, temp_dir):
+        """Stations sharing the first byte of an allowed one are still left out, also on a last line without newline."""
+        path = temp_dir / "m.txt"
+        path.write_text("Hamburg;1.0\nHanoi;2.0\nBerlin;3.0\nHamburg;5.0\nHanoi;4.0")
+        for engine in ("python", "mmap", "pypy", "inputbuffer"):
+            assert list(aggregate(str(path), engine=engine, stations=["Hamburg"], workers=2)) == ["Hamburg"]
+
+    def test_main(self, sample_measurements_file, capsys):
+        """The command line takes repeated --station options."""
+        main(["--file", str(sample_measurements_file), "--workers", "2", "-s", "Cracow", "-s", "Hamburg"])
+        assert capsys.readouterr().out == "{Cracow=-8.7/1.9/12.6, Hamburg=-2.3/4.8/12.0, \b\b} \n"
@@ -0,0 +1,111 @@
+"""
+Unit tests for the benchmark runner.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import pytest
+
+from onebrc import bench
+from onebrc.bench import check_regressions, count_rows, default_engines, main, parse_engine
+from onebrc.engines import ENGINES
+
+
+@pytest.mark.unit
+class TestBench:
+    """Test the benchmark helpers and a short end to end run."""
+
+    def test_count_rows(self, sample_measurements_file, temp_dir):
+        """Rows are counted with or without a trailing newline."""
+        assert count_rows(str(sample_measurements_file)) == 10
+        with_newline = temp_dir / "newline.txt"
+        with_newline.write_text("A;1.0\nB;2.0\n")
+        assert count_rows(str(with_newline), blocksize=4) == 2
+
+    def test_parse_engine(self):
+        """Engine specs can name the interpreter to run them with."""
+        assert parse_engine("python") == ("python", [sys.executable])
+        assert parse_engine("pypy:pypy3 -X faulthandler") == ("pypy", ["pypy3", "-X", "faulthandler"])
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_engine("java")
+
+    def test_check_regressions(self):
+        """Only engines slower than the baseline beyond the tolerance are reported."""
+        baseline = {"results": {"python": {"wall": 10.0}, "pypy": {"wall": 5.0}}}
+        report = {"results": {"python": {"wall": 10.4}, "pypy": {"wall": 6.0}, "numpy": {"wall": 1.0}}}
+        regressions = check_regressions(report, baseline, tolerance=0.05)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("pypy:")
+
+    def test_main(self, sample_measurements_file, temp_dir, capsys):
+        """A run writes JSON results and passes against itself as baseline."""
+        output = temp_dir / "results.json"
+        args = ["python", "mmap", "--file", str(sample_measurements_file), "--runs", "1", "--warmup", "0"]
+        assert main(args + ["--output", str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert report["rows"] == 10
+        assert set(report["results"]) == {"python", "mmap"}
+        assert all(result["output_matches"] for result in report["results"].values())
+        assert main(args + ["--baseline", str(output), "--tolerance", "100"]) == 0
+        assert "| python |" in capsys.readouterr().out
+
+    def test_failing_engine(self, sample_measurements_file, temp_dir, capsys):
+        """A failing engine is recorded and the other engines still run."""
+        output = temp_dir / "results.json"
+        args = ["binary", "python", "--file", str(sample_measurements_file), "--runs", "1", "--warmup", "0"]
+        assert main(args + ["--output", str(output)]) == 1
+        report = json.loads(output.read_text())
+        assert "exit status" in report["results"]["binary"]["error"]
+        assert report["results"]["python"]["output_matches"]
+        captured = capsys.readouterr()
+        assert "| binary | - |" in captured.out
+        assert "Engines failed: binary" in captured.err
+        baseline = {"results": {"binary": {"wall": 1.0}}}
+        assert check_regressions(report, baseline)[0].startswith("binary: failed")
+
+    def test_cold_without_fadvise(self, sample_measurements_file, monkeypatch, capsys):
+        """--cold stops with an error where the page cache can not be dropped."""
+        monkeypatch.delattr(os, "posix_fadvise", raising=False)
+        with pytest.raises(SystemExit):
+            main(["python", "--file", str(sample_measurements_file), "--cold"])
+        assert "posix_fadvise" in capsys.readouterr().err
+
+    def test_default_engines(self, sample_measurements_file, temp_dir):
+        """Without engine specs every engine reading the text file runs."""
+        assert "binary" not in default_engines()
+        assert set(default_engines()) == set(ENGINES) - {"binary"}
+        output = temp_dir / "results.json"
+        args = ["--file", str(sample_measurements_file), "--runs", "1", "--warmup", "0", "--output", str(output)]
+        assert main(args) == 0
+        report = json.loads(output.read_text())
+        assert list(report["results"]) == default_engines()
+
+    def test_sweep(self, sample_measurements_file, temp_dir, monkeypatch):
+        """A worker sweep runs every engine once per worker count."""
+        monkeypatch.setattr(bench, "available_cpus", lambda: 2)
+        output = temp_dir / "results.json"
+        args = ["threads", "--file", str(sample_measurements_file), "--runs", "1", "--warmup", "0", "--sweep", "1,2"]
+        assert main(args + ["--output", str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert list(report["results"]) == ["threads -w 1", "threads -w 2"]
+        assert report["results"]["threads -w 2"]["command"][-2:] == ["--workers", "2"]
+
+    def test_sweep_above_available_cpus(self, sample_measurements_file, monkeypatch, capsys):
+        """Worker counts an engine would cap are refused, oversubscribing the other engines is allowed."""
+        monkeypatch.setattr(bench, "available_cpus", lambda: 2)
+        for sweep in ("1,4", "0,1", "1,x"):
+            with pytest.raises(SystemExit):
+                main(["threads", "--file", str(sample_measurements_file), "--sweep", sweep])
+        assert "at most the 2 available CPUs" in capsys.readouterr().err
+        with pytest.raises(ValueError, match="available CPUs"):
+            bench.benchmark(["threads"], str(sample_measurements_file), sweep=[4])
+
+        file_name = str(sample_measurements_file)
+        bench.check_sweep(["inputbuffer", "polars", "duckdb"], file_name, [], [1, 4])
+        bench.check_sweep(["python", "pypy"], file_name, ["--unit-size", "1000"], [1, 4])
+        bench.check_sweep(["numpy"], f"{file_name}.gz", [], [1, 4])
+        with pytest.raises(ValueError, match="binary"):
+            bench.check_sweep(["binary"], f"{file_name}.1brc", ["-u", "1000"], [1, 4])
@@ -0,0 +1,104 @@
+"""
+Unit tests for the binary columnar format and its engine.
+"""
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from onebrc.binary import MAGIC, convert, main, pack_header, read_header, row_groups, write_group
+from onebrc.engines import EngineOptions, run
+
+
+EXPECTED = {
+    b"Hamburg": (-23, 120, 97, 2),
+    b"Bulawayo": (89, 230, 319, 2),
+    b"Palembang": (388, 412, 800, 2),
+    b"St. John's": (-51, 152, 101, 2),
+    b"Cracow": (-87, 126, 39, 2),
+}
+
+
+@pytest.fixture
+def binary_file(sample_measurements_file):
+    """The sample measurements converted to row groups of a few rows."""
+    path = f"{sample_measurements_file}.1brc"
+    convert(str(sample_measurements_file), path, block_size=40)
+    return path
+
+
+@pytest.mark.unit
+class TestBinaryFormat:
+    """Test the layout of binary files."""
+
+    def test_header_round_trip(self, temp_dir):
+        """Names come back in id order, row groups start 8 byte aligned."""
+        path = temp_dir / "header.1brc"
+        names = [b"Abha", "Zürich".encode("utf-8"), b"X"]
+        with open(path, mode="wb") as f:
+            f.write(pack_header(names))
+            write_group(f, [0, 2, 1], [-999, 0, 999])
+        assert read_header(str(path)) == (names, 32)
+        assert row_groups(str(path)) == [(32, 32 + 8 + 12)]
+
+    def test_convert(self, binary_file):
+        """The text file is split into row groups of 2 byte ids and tenths."""
+        names, offset = read_header(binary_file)
+        assert sorted(names) == sorted(EXPECTED)
+        groups = row_groups(binary_file)
+        assert len(groups) > 1
+        assert groups[0][0] == offset
+        assert sum(end - start - 8 for start, end in groups) == 4 * 10
+
+    def test_invalid_files(self, temp_dir):
+        """Text files and truncated row groups are rejected."""
+        path = temp_dir / "bad.1brc"
+        path.write_bytes(b"Hamburg;12.0\n")
+        with pytest.raises(ValueError, match="not a binary"):
+            read_header(str(path))
+        path.write_bytes(pack_header([b"A"]) + (5).to_bytes(8, "little") + bytes(4))
+        with pytest.raises(ValueError, match="truncated"):
+            row_groups(str(path))
+
+    def test_block_size(self, sample_measurements_file, temp_dir, capsys):
+        """The converter refuses a block size that would not read anything."""
+        destination = temp_dir / "zero.1brc"
+        with pytest.raises(SystemExit):
+            main([str(sample_measurements_file), str(destination), "-b", "0"])
+        assert "at least 1" in capsys.readouterr().err
+        assert not destination.exists()
+
+    def test_too_many_stations(self):
+        """Station ids have to fit in 16 bits."""
+        with pytest.raises(ValueError, match="uint16"):
+            pack_header([b"%d" % i for i in range(1 << 16 + 1)])
+
+
+@pytest.mark.unit
+class TestBinaryEngine:
+    """Test the memory mapped binary engine."""
+
+    def test_units(self, binary_file):
+        """Work units of any size cover every row group."""
+        result = run("binary", binary_file, EngineOptions(workers=3, unit_size=1))
+        assert dict(result.items()) == EXPECTED
+
+    def test_without_histograms(self, binary_file, monkeypatch):
+        """With too many stations for histograms min/max are reduced with ufunc.at."""
+        import calculateAverageBinary
+
+        monkeypatch.setattr(calculateAverageBinary, "HISTOGRAM_CELLS", 0)
+        result = calculateAverageBinary._process_file_chunk(binary_file, *row_groups(binary_file)[0])
+        assert dict(result.items()) == {b"Hamburg": (120, 120, 120, 1), b"Bulawayo": (89, 89, 89, 1)}
+
+    def test_stations_and_percentiles(self, binary_file):
+        """Station filters and percentiles are supported."""
+        options = EngineOptions(workers=2, stations=frozenset({b"Cracow"}), percentiles=True)
+        result = run("binary", binary_file, options)
+        assert dict(result.items()) == {b"Cracow": EXPECTED[b"Cracow"]}
+        assert result.percentiles() == [(-87, 126, 126)]
+
+    def test_magic(self, binary_file):
+        """Binary files start with the format magic."""
+        with open(binary_file, mode="rb") as f:
+            assert f.read(len(MAGIC)) == MAGIC
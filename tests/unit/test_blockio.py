@@ -0,0 +1,68 @@
+"""
+Unit tests for the I/O strategies of the block based chunk processors.
+"""
+
+import pytest
+
+from onebrc import StationStats, aggregate
+from onebrc.blockio import STRATEGIES, read_blocks
+
+
+@pytest.fixture
+def data_file(temp_dir):
+    path = temp_dir / "data.bin"
+    path.write_bytes(bytes(range(256)) * 40)
+    return path
+
+
+@pytest.mark.unit
+class TestReadBlocks:
+    """Test that every strategy reads exactly the requested range."""
+
+    @pytest.mark.parametrize("strategy", STRATEGIES)
+    @pytest.mark.parametrize("start, end, block_size", [(0, 10240, 4096), (100, 5000, 333), (7, 8, 1), (50, 50, 16)])
+    def test_range(self, data_file, strategy, start, end, block_size):
+        """Blocks are at most block_size bytes and cover [start, end) in order."""
+        blocks = [bytes(block) for block in read_blocks(str(data_file), start, end, block_size, strategy)]
+        assert all(0 < len(block) <= block_size for block in blocks)
+        assert b"".join(blocks) == data_file.read_bytes()[start:end]
+
+    @pytest.mark.parametrize("strategy", STRATEGIES)
+    def test_past_the_end(self, data_file, strategy):
+        """A range past the end of the file stops at the end."""
+        blocks = read_blocks(str(data_file), 10000, 20000, 100, strategy)
+        assert b"".join(bytes(block) for block in blocks) == data_file.read_bytes()[10000:]
+
+    @pytest.mark.parametrize("strategy", STRATEGIES)
+    def test_empty_file(self, temp_dir, strategy):
+        """An empty file has no blocks."""
+        path = temp_dir / "empty.txt"
+        path.write_bytes(b"")
+        assert list(read_blocks(str(path), 0, 0, 100, strategy)) == []
+
+    def test_unknown_strategy(self, data_file):
+        """Unknown strategies are rejected before reading."""
+        with pytest.raises(ValueError, match="unknown I/O strategy"):
+            read_blocks(str(data_file), 0, 100, 10, "aio")
+
+
+@pytest.mark.unit
+class TestEngineStrategies:
+    """Test the io option of the engines."""
+
+    @pytest.mark.parametrize("strategy", STRATEGIES)
+    @pytest.mark.parametrize("engine", ["pypy", "numpy"])
+    def test_engines(self, sample_measurements_file, engine, strategy):
+        """Every strategy gives the same results, also with blocks shorter than a line."""
+        if engine == "numpy":
+            pytest.importorskip("numpy")
+        result = aggregate(str(sample_measurements_file), engine=engine, workers=2, block_size=5, io=strategy)
+        assert result["Hamburg"] == StationStats(-2.3, 4.85, 12.0, 2)
+        assert sum(stats.count for stats in result.values()) == 10
+
+    def test_unsupported_engine(self, sample_measurements_file):
+        """Engines without a block loop refuse a strategy."""
+        with pytest.raises(ValueError, match="I/O strategy"):
+            aggregate(str(sample_measurements_file), engine="python", io="mmap")
+        with pytest.raises(ValueError, match="I/O strategy"):
+            aggregate(str(sample_measurements_file), engine="pypy", prefetch=True, io="pread")
@@ -0,0 +1,57 @@
+"""
+Unit tests for per work unit checkpoints.
+"""
+
+import os
+
+import pytest
+
+from calculateAverage import _process_file_chunk
+from onebrc.checkpoint import Checkpoint
+from onebrc.scheduler import format_schedule_report, get_work_units, run_work_units
+
+
+@pytest.mark.unit
+class TestCheckpoint:
+    """Test saving partials and resuming from them."""
+
+    def test_resume(self, sample_measurements_file, temp_dir):
+        """Saved units are merged instead of being processed again."""
+        file_name = str(sample_measurements_file)
+        directory = str(temp_dir / "checkpoint")
+        units = get_work_units(file_name, 40)
+
+        # A previous run completed the first two units before being killed
+        checkpoint = Checkpoint(directory, file_name)
+        for unit in units[:2]:
+            checkpoint.save(unit, _process_file_chunk(*unit))
+
+        result, report = run_work_units(_process_file_chunk, units, 2, checkpoint=Checkpoint(directory, file_name))
+        assert report.restored == 2
+        assert sum(worker.units for worker in report.workers) == len(units) - 2
+        assert dict(result.items())[b"Hamburg"] == (-23, 120, 97, 2)
+        assert "2 units restored" in format_schedule_report(report)
+        # A successful run clears its checkpoint
+        assert os.listdir(directory) == []
+
+    def test_workers_save_units(self, sample_measurements_file, temp_dir, monkeypatch):
+        """Every unit completed by a worker is saved."""
+        file_name = str(sample_measurements_file)
+        checkpoint = Checkpoint(str(temp_dir), file_name)
+        units = get_work_units(file_name, 40)
+        monkeypatch.setattr(Checkpoint, "clear", lambda self: None)  # keep the partials to look at them
+        run_work_units(_process_file_chunk, units, 2, checkpoint=checkpoint)
+        restored, missing = Checkpoint(str(temp_dir), file_name).restore(units)
+        assert missing == []
+        assert dict(restored.items())[b"Cracow"] == (-87, 126, 39, 2)
+
+    def test_changed_file(self, sample_measurements_file, temp_dir):
+        """Partials of another version of the file are dropped."""
+        file_name = str(sample_measurements_file)
+        units = get_work_units(file_name, 40)
+        Checkpoint(str(temp_dir), file_name).save(units[0], _process_file_chunk(*units[0]))
+
+        with open(file_name, mode="a") as f:
+            f.write("\nHamburg;1.0")
+        _, missing = Checkpoint(str(temp_dir), file_name).restore(units)
+        assert missing == units
@@ -0,0 +1,78 @@
+"""
+Unit tests for compressed and piped measurement files.
+"""
+
+import io
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from onebrc import compressed
+from onebrc.engines import EngineOptions, run
+from tests.unit.test_engines import EXPECTED
+
+
+def _random_rows(count):
+    names = [b"Hamburg", b"Bulawayo", "Zürich".encode(), b"St. John's"]
+    return b"".join(b"%s;%d.%d\n" % (names[row % 4], row % 97 - 40, row % 10) for row in range(count))
+
+
+@pytest.mark.unit
+class TestCompressed:
+    """Test the decompressor pipeline and parallel BGZF decompression."""
+
+    @pytest.mark.parametrize("suffix, compress", [(".gz", gzip.compress), (".bz2", bz2.compress), (".xz", lzma.compress)])
+    def test_pipeline(self, sample_measurements_file, temp_dir, suffix, compress):
+        """Compressed files are streamed to the parser processes."""
+        path = temp_dir / f"m.txt{suffix}"
+        path.write_bytes(compress(sample_measurements_file.read_bytes()))
+        result = run("pypy", str(path), EngineOptions(workers=2, block_size=16))
+        assert dict(result.items()) == EXPECTED
+
+    def test_stdin(self, sample_measurements_file, monkeypatch):
+        """- reads the measurements from stdin."""
+        monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(sample_measurements_file.read_bytes())))
+        result = run("python", "-", EngineOptions(workers=2, stations=frozenset({b"Cracow"})))
+        assert dict(result.items()) == {b"Cracow": EXPECTED[b"Cracow"]}
+
+    def test_bgzf(self, temp_dir):
+        """BGZF members are decompressed in parallel and the lines cut at their boundaries stitched back."""
+        data = _random_rows(30000)
+        path = temp_dir / "m.txt.gz"
+        with open(path, mode="wb") as f:
+            compressed.write_bgzf(io.BytesIO(data), f)
+        members = compressed.bgzf_members(str(path))
+        assert len(members) > 3
+        assert gzip.decompress(path.read_bytes()) == data
+
+        plain = temp_dir / "m.txt"
+        plain.write_bytes(data[:-1])  # without the trailing newline
+        compressed.main([str(plain), str(path)])
+        expected = dict(run("python", str(plain), EngineOptions(workers=2)).items())
+        for unit_size in (1, 20000, 1 << 30):
+            result = run("python", str(path), EngineOptions(workers=2, unit_size=unit_size))
+            assert dict(result.items()) == expected
+
+    def test_not_bgzf(self, temp_dir):
+        """Regular gzip files are not mistaken for BGZF."""
+        path = temp_dir / "m.txt.gz"
+        path.write_bytes(gzip.compress(b"A;1.0\n"))
+        assert compressed.bgzf_members(str(path)) is None
+
+    def test_corrupt_input(self, temp_dir):
+        """Decompression errors are raised in the caller."""
+        path = temp_dir / "m.txt.xz"
+        path.write_bytes(b"not xz")
+        with pytest.raises(lzma.LZMAError):
+            run("python", str(path), EngineOptions(workers=2))
+
+    def test_unsupported(self, temp_dir):
+        """Options that need seeking are rejected."""
+        path = temp_dir / "m.txt.gz"
+        path.write_bytes(gzip.compress(b"A;1.0\n"))
+        with pytest.raises(ValueError, match="incremental"):
+            run("python", str(path), EngineOptions(incremental=True))
+        with pytest.raises(ValueError, match="duckdb"):
+            run("duckdb", str(path))
@@ -0,0 +1,80 @@
+"""
+Unit tests for the affinity and cgroup aware worker count, and CPU pinning.
+"""
+
+import os
+
+import pytest
+
+from onebrc import StationStats, aggregate, cpus
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.mark.unit
+class TestCgroupLimit:
+    """Test reading the CPU quota from fake cgroup hierarchies."""
+
+    def test_v2(self, temp_dir):
+        """The smallest cpu.max of the cgroup and its ancestors wins."""
+        root = temp_dir / "cgroup"
+        _write(root / "cgroup.controllers", "cpu memory")
+        _write(root / "kubepods" / "cpu.max", "150000 100000")
+        _write(root / "kubepods" / "pod" / "cpu.max", "max 100000")
+        _write(temp_dir / "cgroup.txt", "0::/kubepods/pod\n")
+        assert cpus.cgroup_cpu_limit(str(root), str(temp_dir / "cgroup.txt")) == 1.5
+        assert cpus.available_cpus(str(root), str(temp_dir / "cgroup.txt")) == min(len(cpus.affinity_cpus()), 2)
+
+    def test_v2_namespace_root(self, temp_dir):
+        """Inside a cgroup namespace the quota is on the mounted root."""
+        root = temp_dir / "cgroup"
+        _write(root / "cgroup.controllers", "cpu")
+        _write(root / "cpu.max", "50000 100000")
+        _write(temp_dir / "cgroup.txt", "0::/\n")
+        assert cpus.cgroup_cpu_limit(str(root), str(temp_dir / "cgroup.txt")) == 0.5
+        assert cpus.available_cpus(str(root), str(temp_dir / "cgroup.txt")) == 1
+
+    def test_v1(self, temp_dir):
+        """cgroup v1 divides cpu.cfs_quota_us by cpu.cfs_period_us, -1 is no quota."""
+        root = temp_dir / "cgroup"
+        _write(root / "cpu,cpuacct" / "cpu.cfs_quota_us", "-1")
+        _write(root / "cpu,cpuacct" / "cpu.cfs_period_us", "100000")
+        _write(root / "cpu,cpuacct" / "docker" / "cpu.cfs_quota_us", "300000")
+        _write(root / "cpu,cpuacct" / "docker" / "cpu.cfs_period_us", "100000")
+        _write(temp_dir / "cgroup.txt", "4:memory:/docker\n2:cpu,cpuacct:/docker\n")
+        assert cpus.cgroup_cpu_limit(str(root), str(temp_dir / "cgroup.txt")) == 3.0
+
+    def test_no_quota(self, temp_dir):
+        """Without a quota the affinity mask decides."""
+        root = temp_dir / "cgroup"
+        _write(root / "cgroup.controllers", "cpu")
+        _write(root / "cpu.max", "max 100000")
+        _write(temp_dir / "cgroup.txt", "0::/\n")
+        assert cpus.cgroup_cpu_limit(str(root), str(temp_dir / "cgroup.txt")) is None
+        assert cpus.cgroup_cpu_limit(str(temp_dir / "missing"), str(temp_dir / "missing.txt")) is None
+        assert cpus.available_cpus(str(root), str(temp_dir / "cgroup.txt")) == len(cpus.affinity_cpus())
+
+
+@pytest.mark.unit
+class TestPinning:
+    """Test pinning the worker processes."""
+
+    def test_worker_cpus(self):
+        """Workers are spread round robin over the affinity mask."""
+        allowed = cpus.affinity_cpus()
+        assert cpus.worker_cpus(2 * len(allowed)) == allowed + allowed
+
+    @pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="needs os.sched_setaffinity")
+    @pytest.mark.parametrize("engine", ["python", "pypy"])
+    def test_pinned_run(self, sample_measurements_file, engine):
+        """Pinned workers give the same results."""
+        result = aggregate(str(sample_measurements_file), engine=engine, workers=2, pin=True)
+        assert result["Hamburg"] == StationStats(-2.3, 4.85, 12.0, 2)
+
+    def test_unsupported_engine(self, sample_measurements_file):
+        """Engines with their own pools refuse to pin."""
+        with pytest.raises(ValueError, match="does not pin"):
+            aggregate(str(sample_measurements_file), engine="inputbuffer", workers=2, pin=True)
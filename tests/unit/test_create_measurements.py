@@ -0,0 +1,105 @@
+"""
+Unit tests for the measurement file generator.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("polars")
+
+import numpy as np
+
+import createMeasurements
+from createMeasurements import CreateMeasurement, _append_file, format_rows
+
+
+@pytest.mark.unit
+class TestCreateMeasurement:
+    """Test seeded, parallel generation."""
+
+    def test_reproducible_across_workers(self, temp_dir):
+        """The same seed creates the same file with any number of workers."""
+        serial = temp_dir / "serial.txt"
+        parallel = temp_dir / "parallel.txt"
+        CreateMeasurement(7).generate_measurement_file(str(serial), records=1000, workers=1, batch_size=300)
+        CreateMeasurement(7).generate_measurement_file(str(parallel), records=1000, workers=3, batch_size=300)
+        assert serial.read_bytes() == parallel.read_bytes()
+        assert serial.read_bytes().count(b"\n") == 1000
+        assert sorted(path.name for path in temp_dir.iterdir()) == ["parallel.txt", "serial.txt"]
+
+    def test_seeds_differ(self, temp_dir):
+        """Different seeds create different files."""
+        files = [temp_dir / "a.txt", temp_dir / "b.txt"]
+        for seed, path in enumerate(files):
+            CreateMeasurement(seed).generate_measurement_file(str(path), records=100)
+        assert files[0].read_bytes() != files[1].read_bytes()
+
+    def test_append_file_fallback(self, temp_dir, monkeypatch):
+        """Shards are still appended without copy_file_range."""
+        monkeypatch.delattr("os.copy_file_range", raising=False)
+        shard = temp_dir / "shard"
+        shard.write_bytes(b"B;2.0\n")
+        with open(temp_dir / "out", mode="wb") as f:
+            f.write(b"A;1.0\n")
+            _append_file(str(shard), f)
+        assert (temp_dir / "out").read_bytes() == b"A;1.0\nB;2.0\n"
+        assert not shard.exists()
+
+    def test_binary_format(self, temp_dir):
+        """The binary file of a seed holds the same measurements as its text file."""
+        from onebrc.engines import run
+
+        text = temp_dir / "measurements.txt"
+        binary = temp_dir / "measurements.1brc"
+        CreateMeasurement(3).generate_measurement_file(str(text), records=500, batch_size=200)
+        CreateMeasurement(3).generate_measurement_file(str(binary), records=500, batch_size=200, binary=True)
+        assert dict(run("binary", str(binary)).items()) == dict(run("python", str(text)).items())
+
+    def test_synthetic_zipf_stations(self, temp_dir):
+        """Synthetic stations have unique UTF-8 names of up to 100 bytes and skewed frequencies."""
+        measurement = CreateMeasurement(11, stations=200, zipf=1.5)
+        names = measurement.stations["names"].to_list()
+        assert len(set(names)) == 200
+        assert max(len(name.encode("utf-8")) for name in names) <= 100
+        assert any(len(name.encode("utf-8")) > len(name) for name in names)
+
+        path = temp_dir / "skewed.txt"
+        measurement.generate_measurement_file(str(path), records=2000)
+        counts = sorted(path.read_bytes().decode("utf-8").count(f"{name};") for name in names)
+        assert counts[-1] > 20 * counts[len(counts) // 2]
+        assert CreateMeasurement(11, stations=200, zipf=1.5).stations["names"].to_list() == names
+
+    @pytest.mark.parametrize("segment_copy_bytes", [0, 1000])
+    def test_format_rows(self, monkeypatch, segment_copy_bytes):
+        """Rows assembled from the byte tables match formatting every row in Python, with either copy."""
+        monkeypatch.setattr(createMeasurements, "FORMAT_ROWS", 4)
+        monkeypatch.setattr(createMeasurements, "SEGMENT_COPY_BYTES", segment_copy_bytes)
+        names = ["Abha".encode("utf-8"), "Zürich".encode("utf-8"), "東京".encode("utf-8") * 16]
+        ids = np.array([0, 1, 2, 1, 0, 2, 2], dtype=np.int64)
+        tenths = np.array([-999, -5, 0, 5, 999, 123, -45], dtype=np.int16)
+        expected = b"".join(
+            names[station_id] + f";{value / 10:.1f}\n".encode() for station_id, value in zip(ids, tenths)
+        )
+        assert format_rows(names, ids, tenths).tobytes() == expected
+        assert format_rows(names, ids[:0], tenths[:0]).tobytes() == b""
+
+    @pytest.mark.parametrize("option", ["--workers", "--stations"])
+    def test_positive_options(self, temp_dir, option):
+        """Worker and station counts below 1 are rejected with a message about the option, not about records."""
+        script = Path(createMeasurements.__file__)
+        command = [sys.executable, str(script), "-r", "10", "-o", str(temp_dir / "out.txt"), option, "0"]
+        process = subprocess.run(command, capture_output=True, text=True)
+        assert process.returncode == 2
+        assert f"{option}: value must be at least 1" in process.stderr
+        assert not (temp_dir / "out.txt").exists()
+
+    def test_csv_path(self, temp_dir):
+        """The previous write_csv path still creates valid rows."""
+        path = temp_dir / "csv.txt"
+        CreateMeasurement(5).generate_measurement_file(str(path), records=300, csv=True)
+        rows = path.read_text(encoding="utf-8").splitlines()
+        assert len(rows) == 300
+        assert all(row.rsplit(";", 1)[1].replace("-", "").replace(".", "").isdigit() for row in rows)
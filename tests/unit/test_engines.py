@@ -0,0 +1,125 @@
+"""
+Unit tests for the engine registry and the command line entry point.
+"""
+
+import pytest
+
+from onebrc.__main__ import main
+from onebrc.engines import ENGINES, EngineOptions, run
+
+
+EXPECTED = {
+    b"Hamburg": (-23, 120, 97, 2),
+    b"Bulawayo": (89, 230, 319, 2),
+    b"Palembang": (388, 412, 800, 2),
+    b"St. John's": (-51, 152, 101, 2),
+    b"Cracow": (-87, 126, 39, 2),
+}
+
+
+@pytest.mark.unit
+class TestEngines:
+    """Every registered engine returns the same station table."""
+
+    @pytest.mark.parametrize("engine", sorted(ENGINES))
+    def test_engines_agree(self, sample_measurements_file, engine):
+        """Engines are run by name and return integer tenths per station."""
+        if engine in ("numpy", "polars", "duckdb"):
+            pytest.importorskip(engine)
+        file_name = str(sample_measurements_file)
+        if engine == "binary":
+            pytest.importorskip("numpy")
+            from onebrc.binary import convert
+
+            file_name = f"{file_name}.1brc"
+            convert(str(sample_measurements_file), file_name, block_size=40)
+        result = run(engine, file_name, EngineOptions(workers=2, block_size=16))
+        assert dict(result.items()) == EXPECTED
+
+    def test_unit_size(self, sample_measurements_file):
+        """Chunk engines can run on fine grained work units."""
+        result = run("pypy", str(sample_measurements_file), EngineOptions(workers=2, unit_size=10))
+        assert dict(result.items()) == EXPECTED
+
+    @pytest.mark.parametrize("engine", ["python", "mmap", "pypy", "numpy", "threads", "inputbuffer"])
+    def test_long_names(self, temp_dir, engine):
+        """Station names of up to 100 bytes of multi-byte UTF-8 do not break the chunk alignment."""
+        if engine == "numpy":
+            pytest.importorskip(engine)
+        names = ["ü" * 50, "東" * 33 + "a", "x" * 100]
+        path = temp_dir / "long.txt"
+        path.write_text("".join(f"{names[row % 3]};{row % 7 - 3}.5\n" for row in range(30)), encoding="utf-8")
+        result = run(engine, str(path), EngineOptions(workers=4))
+        assert sorted(len(name) for name in result.names) == [100, 100, 100]
+        assert sum(result.counts) == 30
+
+    def test_unknown_engine(self, sample_measurements_file):
+        """Unknown engines are rejected with the list of known ones."""
+        with pytest.raises(ValueError, match="python"):
+            run("java", str(sample_measurements_file))
+
+    def test_main(self, sample_measurements_file, capsys):
+        """The command line prints the usual one line summary."""
+        main(["--engine", "mmap", "--file", str(sample_measurements_file), "--workers", "2"])
+        assert capsys.readouterr().out.startswith("{Bulawayo=8.9/15.9/23.0, Cracow=-8.7/1.9/12.6, ")
+
+    @pytest.mark.parametrize("block_size", [16, 23, 4096])
+    def test_prefetch(self, sample_measurements_file, block_size):
+        """The prefetching pypy worker carries partial lines over any block size."""
+        options = EngineOptions(workers=2, block_size=block_size, prefetch=True, unit_size=40)
+        assert dict(run("pypy", str(sample_measurements_file), options).items()) == EXPECTED
+
+    @pytest.mark.parametrize("engine", ["python", "mmap", "numpy", "threads", "binary", "inputbuffer", "polars", "duckdb"])
+    def test_prefetch_unsupported(self, sample_measurements_file, engine):
+        """Engines without the prefetching reader refuse the option instead of ignoring it."""
+        with pytest.raises(ValueError, match="does not prefetch"):
+            run(engine, str(sample_measurements_file), EngineOptions(workers=2, prefetch=True))
+
+    def test_prefetch_long_line(self, temp_dir):
+        """Lines that do not fit the reserve in front of the buffers are reported."""
+        from calculateAveragePypy import TAIL_RESERVE, _process_file_chunk_prefetch
+
+        path = temp_dir / "long.txt"
+        path.write_bytes(b"A;1.0\n" + b"x" * 2 * TAIL_RESERVE + b";1.0\n")
+        with pytest.raises(ValueError, match="longer"):
+            _process_file_chunk_prefetch(str(path), 0, path.stat().st_size, blocksize=64)
+
+    def test_prefetch_stops_reader(self, temp_dir, monkeypatch):
+        """When parsing fails the reader thread waiting for a free buffer is stopped."""
+        import threading
+        import time
+
+        import calculateAveragePypy
+
+        def failing_parse_rows(*args):
+            time.sleep(0.05)  # the reader fills every buffer and waits for a free one
+            raise ValueError("bad row")
+
+        monkeypatch.setattr(calculateAveragePypy, "_parse_rows", failing_parse_rows)
+        path = temp_dir / "rows.txt"
+        path.write_bytes(b"B;2.0\n" * 1000)
+        threads = threading.active_count()
+        with pytest.raises(ValueError, match="bad row"):
+            calculateAveragePypy._process_file_chunk_prefetch(str(path), 0, path.stat().st_size, blocksize=64)
+        assert threading.active_count() == threads
+
+    def test_threads(self, sample_measurements_file, monkeypatch):
+        """The thread engine shares one memory map between threads when the GIL is disabled."""
+        import calculateAverageThreads
+
+        monkeypatch.setattr(calculateAverageThreads, "gil_disabled", lambda: True)
+        options = EngineOptions(workers=3, unit_size=20, stations=frozenset(EXPECTED) - {b"Hamburg"})
+        result = run("threads", str(sample_measurements_file), options)
+        assert dict(result.items()) == {name: value for name, value in EXPECTED.items() if name != b"Hamburg"}
+
+    def test_gil_detection(self, monkeypatch):
+        """Threads are only used on a free-threaded build that runs without the GIL."""
+        import calculateAverageThreads
+
+        monkeypatch.setattr("sysconfig.get_config_var", lambda name: None)
+        assert not calculateAverageThreads.gil_disabled()
+        monkeypatch.setattr("sysconfig.get_config_var", lambda name: 1)
+        monkeypatch.setattr("sys._is_gil_enabled", lambda: True, raising=False)
+        assert not calculateAverageThreads.gil_disabled()
+        monkeypatch.setattr("sys._is_gil_enabled", lambda: False)
+        assert calculateAverageThreads.gil_disabled()
@@ -0,0 +1,42 @@
+"""
+Unit tests for the fixed-point temperature parsing layer.
+"""
+
+import pytest
+
+from onebrc.fixedpoint import TENTHS, TENTHS_LINE, format_tenths, parse_tenths
+
+
+@pytest.mark.unit
+class TestFixedPoint:
+    """Test the integer tenths lookup tables."""
+
+    def test_table_covers_every_temperature(self):
+        """Every -99.9..99.9 temperature, plus -0.0, is precomputed."""
+        assert len(TENTHS) == 1999 + 1
+        assert len(TENTHS_LINE) == 1999 + 1
+        for value in range(-999, 1000):
+            assert TENTHS[format_tenths(value)] == value
+            assert TENTHS[format_tenths(value)] == round(float(format_tenths(value)) * 10)
+
+    @pytest.mark.parametrize(
+        "text, expected",
+        [(b"0.0", 0), (b"-0.0", 0), (b"9.9", 99), (b"-9.9", -99), (b"12.3", 123), (b"-99.9", -999)],
+    )
+    def test_lookup(self, text, expected):
+        """Known temperatures map to integer tenths, with or without a newline."""
+        assert TENTHS[text] == expected
+        assert TENTHS_LINE[text + b"\n"] == expected
+
+    def test_missing_key_falls_back_to_parsing(self):
+        """Unexpected formats are parsed instead of raising KeyError."""
+        assert TENTHS[b"22.77"] == 228
+        assert TENTHS_LINE[b"-5.1\r\n"] == -51
+        assert b"22.77" not in TENTHS
+        assert parse_tenths(b"100.0") == 1000
+
+    def test_format_tenths(self):
+        """Integer tenths are formatted back as -?d?d.d."""
+        assert format_tenths(0) == b"0.0"
+        assert format_tenths(-5) == b"-0.5"
+        assert format_tenths(999) == b"99.9"
@@ -0,0 +1,109 @@
+"""
+Unit tests for the per station temperature histograms and percentiles.
+"""
+
+import math
+import pickle
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from onebrc import aggregate, stations
+from onebrc.__main__ import main
+from onebrc.histogram import HistogramTable
+
+
+def _nearest_rank(values, percentile):
+    values = sorted(values)
+    return values[max(1, math.ceil(percentile * len(values) / 100)) - 1]
+
+
+@pytest.fixture
+def random_measurements_file(temp_dir):
+    """A file with a few stations and many repeated temperatures."""
+    rng = random.Random(42)
+    rows = [(rng.choice(["Abha", "Oslo", "Lima"]), rng.randint(-999, 999)) for _ in range(2000)]
+    path = temp_dir / "random.txt"
+    path.write_text("".join(f"{name};{value / 10:.1f}\n" for name, value in rows))
+    return path, rows
+
+
+@pytest.mark.unit
+class TestHistogramTable:
+    """Test histogram updates, merges and exact percentiles."""
+
+    @pytest.mark.parametrize("use_numpy", [True, False])
+    def test_merge_adds_histograms(self, monkeypatch, use_numpy):
+        """Histograms merge by addition, aligned on the station names."""
+        if not use_numpy:
+            monkeypatch.setattr(stations, "np", None)
+            monkeypatch.setattr("onebrc.histogram.np", None)
+        left, right = HistogramTable(), HistogramTable()
+        for value in (10, 20, 30):
+            left.update(b"Oslo", value)
+        right.update(b"Lima", -5)
+        right.update(b"Oslo", 40)
+        left.merge(right)
+        assert dict(left.items()) == {b"Oslo": (10, 40, 100, 4), b"Lima": (-5, -5, -5, 1)}
+        assert left.percentiles((50, 100)) == [(20, 40), (-5, -5)]
+
+    def test_percentiles_are_exact(self):
+        """Percentiles match the nearest rank of the sorted values."""
+        rng = random.Random(7)
+        values = [rng.randint(-999, 999) for _ in range(1001)]
+        table = HistogramTable()
+        for value in values:
+            table.update(b"A", value)
+        assert table.percentiles((1, 50, 95, 99)) == [
+            tuple(_nearest_rank(values, percentile) for percentile in (1, 50, 95, 99))
+        ]
+
+    def test_serialization(self):
+        """Histograms survive pickling and to_bytes."""
+        table = HistogramTable()
+        table.update(b"A", -999)
+        table.update(b"B", 999)
+        for restored in (pickle.loads(pickle.dumps(table)), HistogramTable.from_bytes(table.to_bytes())[0]):
+            assert restored.percentiles() == [(-999,) * 3, (999,) * 3]
+        assert table.select({b"B"}).percentiles() == [(999,) * 3]
+
+
+@pytest.mark.unit
+class TestEnginePercentiles:
+    """Test the percentile mode of the engines."""
+
+    @pytest.mark.parametrize("engine", ["python", "numpy"])
+    def test_engines(self, random_measurements_file, engine):
+        """Engines return the exact percentiles next to min/mean/max."""
+        if engine == "numpy":
+            pytest.importorskip("numpy")
+        path, rows = random_measurements_file
+        result = aggregate(str(path), engine=engine, workers=2, unit_size=4096, percentiles=True)
+        for name in ("Abha", "Oslo", "Lima"):
+            values = [value for station, value in rows if station == name]
+            stats = result[name]
+            assert (stats.min, stats.max, stats.count) == (min(values) / 10, max(values) / 10, len(values))
+            assert (stats.p50, stats.p95, stats.p99) == tuple(
+                _nearest_rank(values, percentile) / 10 for percentile in (50, 95, 99)
+            )
+
+    def test_unsupported_engine(self, sample_measurements_file):
+        """Engines without histograms say so."""
+        with pytest.raises(ValueError, match="percentiles"):
+            aggregate(str(sample_measurements_file), engine="pypy", percentiles=True)
+
+    def test_script_mmap(self, temp_dir):
+        """calculateAverage.py refuses --percentiles with --mmap instead of dropping --mmap."""
+        script = Path(__file__).resolve().parents[2] / "calculateAverage.py"
+        command = [sys.executable, str(script), "--mmap", "--percentiles"]
+        process = subprocess.run(command, cwd=temp_dir, capture_output=True, text=True)
+        assert process.returncode == 2
+        assert "--mmap does not support --percentiles" in process.stderr
+
+    def test_main(self, sample_measurements_file, capsys):
+        """Percentiles follow the max in the printed summary."""
+        main(["--file", str(sample_measurements_file), "--workers", "2", "--percentiles", "-s", "Hamburg"])
+        assert capsys.readouterr().out == "{Hamburg=-2.3/4.8/12.0/-2.3/12.0/12.0, \b\b} \n"
@@ -0,0 +1,70 @@
+"""
+Unit tests for incremental runs over append-only files.
+"""
+
+import pytest
+
+from onebrc import incremental
+from onebrc.engines import EngineOptions, run
+
+
+def _run(engine, path, state_file=None):
+    options = EngineOptions(workers=2, incremental=True, state_file=state_file)
+    return dict(run(engine, str(path), options).items())
+
+
+@pytest.mark.unit
+class TestIncremental:
+    """Test resuming from the saved offset and falling back to full rescans."""
+
+    def test_complete_lines_end(self, temp_dir):
+        """The partial last line is left for the next run."""
+        path = temp_dir / "m.txt"
+        path.write_bytes(b"A;1.0\nB;2.0\nC;3")
+        assert incremental.complete_lines_end(str(path)) == 12
+        path.write_bytes(b"A;1.0")
+        assert incremental.complete_lines_end(str(path)) == 0
+
+    @pytest.mark.parametrize("engine", ["python", "pypy"])
+    def test_append(self, temp_dir, engine):
+        """Appended lines are folded into the saved aggregate."""
+        path = temp_dir / "m.txt"
+        path.write_bytes(b"A;1.0\nB;2.0\nA;-3.5\nB;4")
+        assert _run(engine, path) == {b"A": (-35, 10, -25, 2), b"B": (20, 20, 20, 1)}
+        offset, _ = incremental.load_state(str(path))
+        assert offset == 19
+
+        with open(path, mode="ab") as f:
+            f.write(b".5\nC;9.9\n")
+        assert _run(engine, path) == {
+            b"A": (-35, 10, -25, 2),
+            b"B": (20, 45, 65, 2),
+            b"C": (99, 99, 99, 1),
+        }
+        # Nothing appended, the saved aggregate is returned as is
+        assert _run(engine, path)[b"C"] == (99, 99, 99, 1)
+
+    def test_rewritten_prefix(self, temp_dir):
+        """A changed or truncated file is rescanned from the start."""
+        path = temp_dir / "m.txt"
+        state_file = str(temp_dir / "state")
+        path.write_bytes(b"A;1.0\nB;2.0\n")
+        _run("python", path, state_file)
+
+        path.write_bytes(b"A;5.0\nB;2.0\nC;1.0\n")
+        assert _run("python", path, state_file)[b"A"] == (50, 50, 50, 1)
+        path.write_bytes(b"A;7.0\n")
+        assert _run("python", path, state_file) == {b"A": (70, 70, 70, 1)}
+
+    def test_corrupt_state(self, temp_dir):
+        """An unreadable state file means a full rescan."""
+        path = temp_dir / "m.txt"
+        path.write_bytes(b"A;1.0\n")
+        (temp_dir / ("m.txt" + incremental.STATE_SUFFIX)).write_bytes(b"garbage")
+        assert incremental.load_state(str(path))[0] == 0
+        assert _run("python", path) == {b"A": (10, 10, 10, 1)}
+
+    def test_unsupported_engine(self, sample_measurements_file):
+        """Engines that do not read byte ranges reject incremental runs."""
+        with pytest.raises(ValueError, match="inputbuffer"):
+            run("inputbuffer", str(sample_measurements_file), EngineOptions(incremental=True))
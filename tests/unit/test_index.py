@@ -0,0 +1,91 @@
+"""
+Unit tests for the sidecar block index.
+"""
+
+import pytest
+
+from onebrc.engines import ENGINES, EngineOptions, run
+from onebrc.index import build_index, load_index, main
+
+
+@pytest.mark.unit
+class TestBlockIndex:
+    """Test building, loading and querying the block index."""
+
+    def test_build_and_load(self, sample_measurements_file):
+        """Blocks are newline aligned and their summaries survive a round trip."""
+        file_name = str(sample_measurements_file)
+        built = build_index(file_name, block_size=40, workers=2)
+        index = load_index(file_name)
+        assert index.blocks == built.blocks
+        assert index.blocks[0][0] == 0
+        assert index.blocks[-1][1] == sample_measurements_file.stat().st_size
+        data = sample_measurements_file.read_bytes()
+        assert all(data[block_start - 1 : block_start] == b"\n" for block_start, _ in index.blocks[1:])
+        assert dict(index.query().items()) == dict(run("python", file_name).items())
+
+    def test_station_filter(self, sample_measurements_file):
+        """Filtered queries only touch the blocks with those stations."""
+        file_name = str(sample_measurements_file)
+        index = build_index(file_name, block_size=20, workers=2)
+        units = index.units({b"Palembang"})
+        assert 0 < len(units) < len(index.blocks)
+        assert dict(index.query({b"Palembang", b"Nowhere"}).items()) == {b"Palembang": (388, 412, 800, 2)}
+
+    def test_stale_index(self, sample_measurements_file):
+        """An index of another version of the file is not used."""
+        file_name = str(sample_measurements_file)
+        main(["--file", file_name, "--block-size", "40", "--workers", "2"])
+        with open(file_name, mode="a") as f:
+            f.write("\nHamburg;99.0")
+        assert load_index(file_name) is None
+        result = run("python", file_name, EngineOptions(index=True))
+        assert dict(result.items())[b"Hamburg"] == (-23, 990, 1087, 3)
+
+    def test_engine_uses_index(self, sample_measurements_file, temp_dir, monkeypatch):
+        """With an up to date index the file is not scanned."""
+        file_name = str(sample_measurements_file)
+        index_file = str(temp_dir / "index")
+        build_index(file_name, block_size=40, workers=2, index_file=index_file)
+
+        def scan(file_name, options):
+            raise AssertionError("the file was scanned")
+
+        monkeypatch.setitem(ENGINES, "python", scan)
+        result = run("python", file_name, EngineOptions(index=True, index_file=index_file))
+        assert dict(result.items())[b"Cracow"] == (-87, 126, 39, 2)
+
+    @pytest.mark.parametrize("engine", ["python", "numpy"])
+    def test_percentiles_scan_blocks(self, sample_measurements_file, monkeypatch, engine):
+        """Percentiles are not in the summaries, only the blocks with the stations are scanned."""
+        if engine == "numpy":
+            pytest.importorskip("numpy")
+        import calculateAverage
+        from onebrc import scheduler
+
+        file_name = str(sample_measurements_file)
+        index = build_index(file_name, block_size=20, workers=2)
+        scanned = list()
+
+        def no_chunks(*args, **kwargs):
+            raise AssertionError("the chunk boundaries were searched")
+
+        def run_work_units(processor, units, *args, **kwargs):
+            scanned.extend(units)
+            return original(processor, units, *args, **kwargs)
+
+        original = scheduler.run_work_units
+        monkeypatch.setattr(calculateAverage, "get_file_chunks", no_chunks)
+        monkeypatch.setattr(scheduler, "run_work_units", run_work_units)
+        options = EngineOptions(index=True, percentiles=True, stations=frozenset({b"Palembang"}), workers=2)
+        result = run(engine, file_name, options)
+        assert scanned == index.units({b"Palembang"})
+        assert len(scanned) < len(index.blocks)
+        assert dict(result.items()) == {b"Palembang": (388, 412, 800, 2)}
+        assert result.percentiles() == [(388, 412, 412)]
+
+    def test_block_size(self, sample_measurements_file, capsys):
+        """The block size has to be positive."""
+        with pytest.raises(SystemExit):
+            main(["--file", str(sample_measurements_file), "--block-size", "0"])
+        assert "at least 1" in capsys.readouterr().err
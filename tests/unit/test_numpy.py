@@ -0,0 +1,111 @@
+"""
+Unit tests for the NumPy vectorized block parser.
+"""
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import calculateAverageNumpy
+from calculateAverageNumpy import _parse_block, _process_file_chunk
+from onebrc.stations import first_byte_filter
+
+
+ROWS = [
+    (b"Hamburg", 120),
+    (b"Bo", -3),
+    (b"Hanoi", 7),
+    ("Zürich".encode("utf-8"), -999),
+    (b"Bo", 999),
+    (b"Hamburg", -45),
+    (b"Hanoi", 0),
+    (b"St. John's", -10),
+]
+
+
+def _block(rows) -> np.ndarray:
+    text = b"".join(name + f";{value / 10:.1f}\n".encode() for name, value in rows)
+    return np.frombuffer(text, dtype=np.uint8)
+
+
+def _decode(stations, ids, temperatures) -> list:
+    names = {station_id: name for name, station_id in stations.items()}
+    return [(names[station_id], int(value)) for station_id, value in zip(ids, temperatures)]
+
+
+@pytest.fixture
+def random_measurements_file(temp_dir):
+    """A file of a few stations sharing first bytes, without a trailing newline."""
+    rng = random.Random(7)
+    names = ["Abha", "Abéché", "Oslo", "Odesa", "Lima", "Las Palmas de Gran Canaria"]
+    rows = [(rng.choice(names).encode("utf-8"), rng.randint(-999, 999)) for _ in range(500)]
+    path = temp_dir / "random.txt"
+    path.write_bytes(b"\n".join(name + f";{value / 10:.1f}".encode() for name, value in rows))
+    return path, rows
+
+
+def _expected(rows, stations=None) -> dict:
+    expected = dict()
+    for name, value in rows:
+        if stations is not None and name not in stations:
+            continue
+        low, high, total, count = expected.get(name, (value, value, 0, 0))
+        expected[name] = (min(low, value), max(high, value), total + value, count + 1)
+    return expected
+
+
+@pytest.mark.unit
+class TestParseBlock:
+    """Test the row parser of one newline terminated block."""
+
+    def test_rows(self):
+        """Names and negative, single and double digit temperatures of every row, with dense station ids."""
+        stations = dict()
+        ids, temperatures = _parse_block(_block(ROWS), stations)
+        assert _decode(stations, ids, temperatures) == ROWS
+        assert sorted(stations.values()) == list(range(5))
+
+        # A later block keeps the ids of the stations already seen
+        ids, _ = _parse_block(_block([(b"Hanoi", 1), (b"Oslo", 2)]), stations)
+        assert list(ids) == [stations[b"Hanoi"], 5]
+
+    def test_hash_collisions(self, monkeypatch):
+        """When the hashes collide the padded names themselves are compared."""
+        # Every hash is then the last byte of the padded name, 0 for all but the longest names
+        monkeypatch.setattr(calculateAverageNumpy, "HASH_MULTIPLIER", np.uint64(0))
+        stations = dict()
+        ids, temperatures = _parse_block(_block(ROWS), stations)
+        assert _decode(stations, ids, temperatures) == ROWS
+        assert len(stations) == 5
+
+    def test_station_filter(self):
+        """Rows of other stations are dropped, also those sharing the first byte of an allowed one."""
+        allowed = frozenset({b"Hamburg", b"Bo"})
+        first_bytes = np.frombuffer(first_byte_filter(allowed), dtype=np.uint8).astype(bool)
+        stations = dict()
+        ids, temperatures = _parse_block(_block(ROWS), stations, allowed, first_bytes)
+        assert _decode(stations, ids, temperatures) == [row for row in ROWS if row[0] in allowed]
+
+        ids, temperatures = _parse_block(_block([(b"Oslo", 1), (b"Lima", 2)]), stations, allowed, first_bytes)
+        assert len(ids) == len(temperatures) == 0
+
+
+@pytest.mark.unit
+class TestProcessFileChunk:
+    """Test carrying partial lines between the blocks of a chunk."""
+
+    @pytest.mark.parametrize("blocksize", [1, 7, 64, 1 << 20])
+    def test_blocks(self, random_measurements_file, blocksize):
+        """Any block size gives the aggregates of the whole file, including its last line."""
+        path, rows = random_measurements_file
+        result = _process_file_chunk(str(path), 0, path.stat().st_size, blocksize=blocksize)
+        assert dict(result.items()) == _expected(rows)
+
+    def test_station_filter(self, random_measurements_file):
+        """Only the given stations are aggregated."""
+        path, rows = random_measurements_file
+        stations = frozenset({"Abha".encode("utf-8"), "Lima".encode("utf-8")})
+        result = _process_file_chunk(str(path), 0, path.stat().st_size, blocksize=64, stations=stations)
+        assert dict(result.items()) == _expected(rows, stations)
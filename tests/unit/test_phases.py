@@ -0,0 +1,69 @@
+"""
+Unit tests for the opt-in phase instrumentation.
+"""
+
+import json
+
+import pytest
+
+from onebrc import phases
+from onebrc.__main__ import main
+
+
+@pytest.mark.unit
+class TestPhaseRecorder:
+    """Test the recorders returned by current()."""
+
+    def test_disabled_by_default(self):
+        """Without enable() phases and counters are not recorded."""
+        recorder = phases.current()
+        assert recorder is phases.DISABLED
+        assert not recorder.enabled
+        with recorder.phase("read"):
+            recorder.count("rows", 10)
+        assert recorder.phase("read") is recorder.phase("merge")
+
+    def test_phases_and_counters(self):
+        """Every call of a phase adds to its totals, counters add up."""
+        recorder = phases.enable()
+        try:
+            assert phases.current() is recorder
+            for _ in range(3):
+                with recorder.phase("read"):
+                    recorder.count("rows", 5)
+            with pytest.raises(RuntimeError):
+                with recorder.phase("merge"):
+                    raise RuntimeError("still recorded")
+        finally:
+            phases.disable()
+        assert phases.current() is phases.DISABLED
+
+        report = recorder.to_dict()
+        assert report["counters"] == {"rows": 15}
+        assert report["phases"]["read"]["calls"] == 3
+        assert report["phases"]["merge"]["calls"] == 1
+        assert report["phases"]["read"]["wall"] >= 0
+        assert "workers" not in report
+
+
+@pytest.mark.unit
+class TestPhaseReport:
+    """Test the --phase-report option of the command line."""
+
+    @pytest.mark.parametrize("engine", ["python", "numpy"])
+    def test_report(self, engine, sample_measurements_file, temp_dir, capsys):
+        """The report has the phases of the parent and of every worker."""
+        path = temp_dir / "phases.json"
+        main(["--engine", engine, "--file", str(sample_measurements_file), "--workers", "2", "--phase-report", str(path)])
+        assert "Hamburg=" in capsys.readouterr().out
+        assert phases.current() is phases.DISABLED
+
+        report = json.loads(path.read_text())
+        assert report["engine"] == engine
+        assert {"chunks", "start_workers", "merge", "run", "format", "write"} <= set(report["phases"])
+        workers = report["workers"]
+        assert sum(worker["counters"]["rows"] for worker in workers) == 10
+        assert sum(worker["bytes"] for worker in workers) == sample_measurements_file.stat().st_size
+        for worker in workers:
+            assert "process" in worker["phases"]
+            assert worker["counters"]["keys"] > 0
@@ -0,0 +1,94 @@
+"""
+Unit tests for the live progress counters and reports.
+"""
+
+import io
+import json
+
+import pytest
+
+from onebrc import progress
+from onebrc.__main__ import main
+
+
+@pytest.mark.unit
+class TestProgressCounters:
+    """Test the shared per worker counters."""
+
+    def test_blocks_and_units(self):
+        """Blocks add their bytes and rows, unit_done adds what the blocks did not report."""
+        counters = progress.ProgressCounters(2)
+        first = progress.WorkerCounter(counters)
+        second = progress.WorkerCounter(counters)
+        with pytest.raises(ValueError):
+            progress.WorkerCounter(counters)
+
+        first.add(100, 7)
+        first.add(100, 15)
+        assert counters.snapshot() == ([200, 0], [15, 0])
+        first.unit_done(250, 18)
+        second.unit_done(50, 4)  # a processor without a block loop
+        first.add(10, 1)
+        assert counters.snapshot() == ([260, 50], [19, 4])
+
+    def test_disabled_by_default(self):
+        """Without a monitor nothing is counted."""
+        assert progress.current() is progress.DISABLED
+        assert progress.monitor() is None
+        progress.DISABLED.add(100, 10)
+        progress.DISABLED.unit_done(100, 10)
+
+
+@pytest.mark.unit
+class TestProgressStatus:
+    """Test the computed rates, skew and ETA."""
+
+    def test_status(self):
+        """Rates are over the last interval, the ETA over the whole run."""
+        status = progress.progress_status([300, 100], [30, 10], 800, 2.0, (1.0, 200, 20), False)
+        assert status["fraction"] == 0.5
+        assert status["bytes_per_s"] == 200
+        assert status["rows_per_s"] == 20
+        assert status["skew"] == 1.5
+        assert status["eta"] == 2.0
+        line = progress.format_progress(status)
+        assert " 50.0%" in line
+        assert "skew 1.50" in line
+        assert "ETA 0:02" in line
+
+    def test_nothing_done_yet(self):
+        """Without any bytes the ETA is unknown."""
+        status = progress.progress_status([0, 0], [0, 0], 800, 0.5, (0.0, 0, 0), False)
+        assert status["eta"] is None
+        assert "ETA --:--" in progress.format_progress(status)
+
+    def test_track(self):
+        """The last update is written when the tracked block exits."""
+        stream = io.StringIO()
+        monitor = progress.ProgressMonitor(stream, json_lines=True, interval=60)
+        counters = progress.ProgressCounters(1)
+        with monitor.track(counters, 100):
+            progress.WorkerCounter(counters).unit_done(100, 5)
+        (last,) = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert last["done"]
+        assert last["bytes"] == 100
+        assert last["rows"] == 5
+        assert last["eta"] == 0.0
+
+
+@pytest.mark.unit
+class TestProgressCli:
+    """Test the --progress-json option of the command line."""
+
+    @pytest.mark.parametrize("engine", ["python", "pypy", "numpy", "inputbuffer"])
+    def test_progress_json(self, engine, sample_measurements_file, temp_dir, capsys):
+        """The JSON lines end with the complete run."""
+        path = temp_dir / "progress.jsonl"
+        main(["--engine", engine, "--file", str(sample_measurements_file), "--workers", "2", "--progress-json", str(path)])
+        assert "Hamburg=" in capsys.readouterr().out
+        assert progress.monitor() is None
+
+        last = json.loads(path.read_text().splitlines()[-1])
+        assert last["done"]
+        assert last["rows"] == 10
+        assert last["bytes"] == last["total_bytes"]
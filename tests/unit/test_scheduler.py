@@ -0,0 +1,72 @@
+"""
+Unit tests for the work unit scheduler.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from calculateAverage import _process_file_chunk
+from onebrc import aggregate
+from onebrc.scheduler import format_schedule_report, get_work_units, run_work_units
+
+
+@pytest.mark.unit
+class TestScheduler:
+    """Test work unit splitting and the worker pool."""
+
+    @pytest.mark.parametrize("unit_size", [1, 7, 13, 40, 1000])
+    def test_units_are_newline_aligned(self, sample_measurements_file, unit_size):
+        """Units cover the whole file and every unit starts at a line."""
+        data = sample_measurements_file.read_bytes()
+        units = get_work_units(str(sample_measurements_file), unit_size)
+        assert units[0][1] == 0
+        assert units[-1][2] == len(data)
+        for (_, _, end), (_, start, _) in zip(units, units[1:]):
+            assert end == start
+            assert data[start - 1 : start] == b"\n"
+
+    def test_unit_size(self, sample_measurements_file):
+        """Unit sizes below 1 are rejected before the file is split."""
+        for unit_size in (0, -5):
+            with pytest.raises(ValueError, match="unit_size"):
+                get_work_units(str(sample_measurements_file), unit_size)
+        with pytest.raises(ValueError, match="unit_size"):
+            aggregate(str(sample_measurements_file), unit_size=-5)
+
+    @pytest.mark.parametrize("script", ["calculateAverage.py", "calculateAveragePypy.py", "calculateAverageThreads.py"])
+    def test_unit_size_option(self, script, temp_dir):
+        """The scripts reject a unit size below 1 in the parser."""
+        path = Path(__file__).resolve().parents[2] / script
+        process = subprocess.run([sys.executable, str(path), "--unit-size", "-5"], cwd=temp_dir, capture_output=True, text=True)
+        assert process.returncode == 2
+        assert "--unit-size: value must be at least 1" in process.stderr
+
+    @pytest.mark.parametrize("premerge", [True, False])
+    def test_run_work_units(self, sample_measurements_file, premerge):
+        """All units are processed and merged, with one stats entry per worker."""
+        units = get_work_units(str(sample_measurements_file), 20)
+        result, report = run_work_units(_process_file_chunk, units, 2, premerge)
+        assert dict(result.items())[b"Hamburg"] == (-23, 120, 97, 2)
+        assert sum(worker.units for worker in report.workers) == len(units)
+        assert len(report.workers) == 2
+        assert report.tables == (2 if premerge else len(units))
+        assert all(worker.idle_tail >= 0 for worker in report.workers)
+        assert len(format_schedule_report(report).splitlines()) == 4
+
+    def test_shared_memory(self, sample_measurements_file):
+        """Worker tables can be reduced from shared memory instead of being pickled."""
+        units = get_work_units(str(sample_measurements_file), 20)
+        result, report = run_work_units(_process_file_chunk, units, 2, shared_memory=True)
+        assert dict(result.items())[b"Cracow"] == (-87, 126, 39, 2)
+        with pytest.raises(ValueError):
+            run_work_units(_process_file_chunk, units, 2, premerge=False, shared_memory=True)
+
+    def test_worker_error_is_raised(self, temp_dir):
+        """A failing unit is reported in the parent instead of hanging it."""
+        broken = temp_dir / "broken.txt"
+        broken.write_text("no separator\n")
+        with pytest.raises(RuntimeError, match="worker process failed"):
+            run_work_units(_process_file_chunk, get_work_units(str(broken)), 2)
@@ -0,0 +1,46 @@
+"""
+Unit tests for the shared memory accumulator slots.
+"""
+
+import pytest
+
+from onebrc.shm import SharedTables
+from onebrc.stations import StationTable
+
+
+@pytest.mark.unit
+class TestSharedTables:
+    """Test writing tables to slots and reducing them in place."""
+
+    def test_round_trip(self):
+        """Slots are merged by station name, empty slots are skipped."""
+        left = StationTable()
+        left.update("Zürich".encode(), 93)
+        left.update(b"Cracow", -87)
+        right = StationTable()
+        right.update(b"Cracow", 126)
+
+        shared = SharedTables(3, capacity=4)
+        try:
+            shared.write(0, left)
+            shared.write(2, right)
+            result = shared.merge_into(StationTable())
+        finally:
+            shared.unlink()
+
+        assert dict(result.items()) == {
+            "Zürich".encode(): (93, 93, 93, 1),
+            b"Cracow": (-87, 126, 39, 2),
+        }
+
+    def test_capacity(self):
+        """Tables larger than a slot are rejected."""
+        table = StationTable()
+        for name in (b"A", b"B", b"C"):
+            table.update(name, 0)
+        shared = SharedTables(1, capacity=2)
+        try:
+            with pytest.raises(ValueError):
+                shared.write(0, table)
+        finally:
+            shared.unlink()
@@ -0,0 +1,89 @@
+"""
+Unit tests for the dense station table.
+"""
+
+import pickle
+
+import pytest
+
+from onebrc import stations
+from onebrc.stations import StationTable
+
+
+def _table(rows):
+    table = StationTable()
+    for name, value in rows:
+        table.update(name, value)
+    return table
+
+
+@pytest.mark.unit
+class TestStationTable:
+    """Test interning, updates and merges."""
+
+    def test_dense_ids(self):
+        """Stations get dense ids in the order they are first seen."""
+        table = StationTable()
+        assert table.station_id(b"Hamburg") == 0
+        assert table.station_id(b"Cracow") == 1
+        assert table.station_id(b"Hamburg") == 0
+        assert len(table) == 2
+        assert table.names == [b"Hamburg", b"Cracow"]
+
+    def test_update(self):
+        """Min, max, sum and count are tracked per station."""
+        table = _table([(b"Hamburg", 120), (b"Hamburg", -23), (b"Cracow", 126)])
+        assert dict(table.items()) == {
+            b"Hamburg": (-23, 120, 97, 2),
+            b"Cracow": (126, 126, 126, 1),
+        }
+
+    @pytest.mark.parametrize("use_numpy", [True, False])
+    def test_merge(self, monkeypatch, use_numpy):
+        """Merging remaps ids and combines the columns, with or without NumPy."""
+        if not use_numpy:
+            monkeypatch.setattr(stations, "np", None)
+        elif stations.np is None:
+            pytest.skip("NumPy is not installed")
+        left = _table([(b"Hamburg", 120), (b"Cracow", -87)])
+        right = _table([(b"Bulawayo", 89), (b"Hamburg", -23), (b"Hamburg", 200)])
+        left.merge(right).merge(StationTable())
+        assert dict(left.items()) == {
+            b"Hamburg": (-23, 200, 297, 3),
+            b"Cracow": (-87, -87, -87, 1),
+            b"Bulawayo": (89, 89, 89, 1),
+        }
+        # The columns can still grow after the NumPy merge released them
+        left.update(b"Palembang", 388)
+        assert len(left) == 4
+
+    def test_pickle(self):
+        """Only names and columns are pickled, ids are rebuilt."""
+        table = pickle.loads(pickle.dumps(_table([(b"Hamburg", 120), (b"Cracow", -87)])))
+        assert table.ids == {b"Hamburg": 0, b"Cracow": 1}
+        assert dict(table.items())[b"Cracow"] == (-87, -87, -87, 1)
+
+    def test_from_columns(self):
+        """Tables can be built from existing columns."""
+        table = StationTable.from_columns([b"A", b"B"], [1, 2], [3, 4], [5, 6], [7, 8])
+        assert dict(table.items()) == {b"A": (1, 3, 5, 7), b"B": (2, 4, 6, 8)}
+        assert table.station_id(b"B") == 1
+
+    def test_bytes_round_trip(self):
+        """Tables serialize to bytes and back, at any offset."""
+        table = _table([("Zürich".encode(), -12), (b"Cracow", 126), (b"Cracow", -87)])
+        data = b"prefix" + table.to_bytes() + b"suffix"
+        restored, end = StationTable.from_bytes(data, len(b"prefix"))
+        assert dict(restored.items()) == dict(table.items())
+        assert restored.ids == table.ids
+        assert data[end:] == b"suffix"
+
+    def test_select(self):
+        """Selecting stations keeps their aggregates and skips unknown names."""
+        table = _table([(b"Hamburg", 120), (b"Cracow", -87)])
+        assert dict(table.select({b"Cracow", b"Nowhere"}).items()) == {b"Cracow": (-87, -87, -87, 1)}
+
+    def test_first_byte_filter(self):
+        """Only the first bytes of the stations are set."""
+        table = stations.first_byte_filter({b"Hamburg", "Zürich".encode(), b""})
+        assert [byte for byte in range(256) if table[byte]] == [ord("H"), ord("Z")]